@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from stocksync.cache import shared_cache_configured
+from .tokens import TOKEN_VERSION_CLAIM
+
+USER_CACHE = 'auth_user'
+
+# User fields whose change revokes the user's issued tokens (see accounts.signals)
+TOKEN_VERSION_FIELDS = ('role', 'is_active', 'organization_id')
+
+
+def user_cache_key(user_id, token_version):
+    return f'{USER_CACHE}:{user_id}:{token_version}'
+
+
+def invalidate_cached_users(users):
+    """Drop the cached authentication state of the given (user id, token version) pairs"""
+    cache.delete_many([user_cache_key(user_id, token_version) for user_id, token_version in users])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that caches the resolved user together with its organization.
+
+    Tokens carry the user's token version (accounts.tokens), and entries are
+    keyed by user id and that version. A cache hit authenticates a request
+    without touching the database; a miss loads the user and organization in
+    one query, rejects the token if the user's version has moved on, and
+    caches them for AUTH_USER_CACHE_TIMEOUT seconds. Changing a user's role,
+    active flag or organization bumps its version, which revokes its tokens;
+    any save of the user or its organization deletes the entry once the
+    transaction commits (see accounts.signals). Changes made with
+    queryset.update() bypass those signals and are picked up when the entry
+    expires.
+
+    Caching is only enabled when the cache is shared by every worker
+    (stocksync.cache.shared_cache_configured), as an entry deleted by one
+    process would otherwise stay valid in the others. Without one, and for
+    tokens issued without a version, every request loads the user.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        token_version = validated_token.get(TOKEN_VERSION_CLAIM)
+        cached = token_version is not None and shared_cache_configured()
+        key = user_cache_key(user_id, token_version)
+        user = cache.get(key) if cached else None
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related('organization').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            if token_version is not None and token_version != user.token_version:
+                raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+            if cached:
+                cache.set(key, user, timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
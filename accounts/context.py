@@ -0,0 +1,97 @@
+from django.utils.functional import cached_property
+
+from .models import OrganizationRelationship
+
+BUYER_TYPES = ('buyer', 'both')
+SUPPLIER_TYPES = ('supplier', 'both')
+# Organization types that own and see their own catalog and stock
+OWNER_TYPES = ('supplier', 'both', 'internal')
+
+
+class OrganizationContext:
+    """
+    Organization and permission facts about the user of a request.
+
+    Built lazily and at most once per request by get_request_context(), so the
+    user -> organization fetch, the organization type branching and the
+    accepted supplier lookup are shared by middleware, permission classes,
+    views and serializers.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+
+    @cached_property
+    def is_authenticated(self):
+        return bool(self.user and self.user.is_authenticated)
+
+    @cached_property
+    def organization(self):
+        if not self.is_authenticated:
+            return None
+        return getattr(self.user, 'organization', None)
+
+    @property
+    def organization_id(self):
+        return self.organization.id if self.organization else None
+
+    @property
+    def organization_type(self):
+        return self.organization.organization_type if self.organization else None
+
+    @property
+    def role(self):
+        return getattr(self.user, 'role', None) if self.is_authenticated else None
+
+    @property
+    def is_buyer(self):
+        return self.organization_type in BUYER_TYPES
+
+    @property
+    def is_supplier(self):
+        return self.organization_type in SUPPLIER_TYPES
+
+    @property
+    def is_owner(self):
+        """Whether the organization sees its own products and inventory"""
+        return self.organization_type in OWNER_TYPES
+
+    @property
+    def is_admin_or_manager(self):
+        return self.role in ('admin', 'manager')
+
+    @cached_property
+    def visible_supplier_ids(self):
+        """Ids of the supplier organizations that accepted the organization as a buyer"""
+        if not self.is_buyer:
+            return frozenset()
+        return frozenset(
+            OrganizationRelationship.objects.filter(
+                buyer_organization=self.organization,
+                status='accepted'
+            ).values_list('supplier_organization_id', flat=True)
+        )
+
+    def can_buy_from(self, organization_id):
+        return organization_id in self.visible_supplier_ids
+
+
+def get_request_context(request):
+    """
+    Return the OrganizationContext of a request, building it on first use.
+
+    Accepts a Django HttpRequest, a DRF Request or None. The context is stored
+    on the underlying HttpRequest so that middleware, DRF and serializers share
+    it; it is rebuilt when the request's user changes (for example once DRF has
+    authenticated a token).
+    """
+    if request is None:
+        return OrganizationContext()
+
+    user = getattr(request, 'user', None)
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, '_organization_context', None)
+    if context is None or context.user is not user:
+        context = OrganizationContext(user)
+        http_request._organization_context = context
+    return context
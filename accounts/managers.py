@@ -1,28 +1,9 @@
 from django.db import models
 from django.db.models import Q
-from accounts.request_middleware import get_current_organization, _thread_locals # Import _thread_locals
-from contextlib import contextmanager
+from accounts.request_middleware import get_current_organization, tenant_context
 
-@contextmanager
-def set_current_organization(organization):
-    """Context manager to temporarily set the current organization for testing."""
-    # Create a mock request object and set the organization on it
-    class MockRequest:
-        def __init__(self, organization):
-            self.organization = organization
-            
-    mock_request = MockRequest(organization)
-    
-    original_request = getattr(_thread_locals, 'request', None)
-    _thread_locals.request = mock_request
-    try:
-        yield
-    finally:
-        if original_request is None:
-            if hasattr(_thread_locals, 'request'):
-                del _thread_locals.request
-        else:
-            _thread_locals.request = original_request
+# Kept for existing callers; tenant_context is the context manager to use
+set_current_organization = tenant_context
 
 
 class OrganizationModelManager(models.Manager):
@@ -41,7 +22,7 @@ class OrganizationModelManager(models.Manager):
         if not hasattr(self.model, 'organization'):
             return queryset
         
-        # Get current organization from thread-local request
+        # Get current organization from the request context
         organization = get_current_organization()
         
         # If we have an organization, filter by it
@@ -119,10 +100,7 @@ class BaseTenantManager(models.Manager):
     def get_queryset(self):
         queryset = TenantAwareQuerySet(self.model, using=self._db)
         # Apply organization filtering here
-        request = getattr(_thread_locals, 'request', None) # Get request from thread locals
-        organization = None
-        if request and hasattr(request, 'organization'):
-            organization = request.organization
+        organization = get_current_organization()
 
         if organization and hasattr(self.model, 'organization'):
             return queryset.filter(organization=organization)
@@ -3,6 +3,8 @@ from django.utils.deprecation import MiddlewareMixin
 from django.apps import apps
 from django.contrib.auth.models import AnonymousUser
 from django.db import models
+from accounts.context import get_request_context
+from accounts.request_middleware import get_current_organization
 
 
 class OrganizationMiddleware(MiddlewareMixin):
@@ -16,8 +18,10 @@ class OrganizationMiddleware(MiddlewareMixin):
     def process_request(self, request):
         """Process incoming request and set up organization filtering"""
         
-        # Skip for anonymous users or users without organization
-        if isinstance(request.user, AnonymousUser) or not hasattr(request.user, 'organization'):
+        context = get_request_context(request)
+
+        # Skip for anonymous users
+        if not context.is_authenticated:
             return None
         
         # Skip for superusers
@@ -25,8 +29,8 @@ class OrganizationMiddleware(MiddlewareMixin):
             return None
         
         # Store the user's organization for managers to use
-        if request.user.organization:
-            request.organization = request.user.organization
+        if context.organization:
+            request.organization = context.organization
             
         return None
 
@@ -47,16 +51,12 @@ class OrganizationModelManager(models.Manager):
         if not hasattr(self.model, 'organization'):
             return queryset
         
-        # Get current request from thread local
-        from threading import local
-        _thread_locals = local()
-        request = getattr(_thread_locals, 'request', None)
+        # Get current organization from the request context
+        organization = get_current_organization()
         
-        # If we have a request and it has an organization, filter by it
-        if request and hasattr(request, 'organization'):
-            organization = request.organization
-            if organization:
-                return queryset.filter(organization=organization)
+        # If we have an organization, filter by it
+        if organization:
+            return queryset.filter(organization=organization)
         
         # Otherwise return unfiltered queryset
         return queryset
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 10:34
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organizationrelationship_alter_user_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='organization_name_lower_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
+from django.db.models.functions import Lower
 
 
 class Organization(models.Model):
@@ -42,6 +43,8 @@ class Organization(models.Model):
             models.Index(fields=['active_status']),
             models.Index(fields=['activation_token']),
             models.Index(fields=['organization_type']),
+            # Case-insensitive name prefix search (api.discovery)
+            models.Index(Lower('name'), name='organization_name_lower_idx'),
         ]
 
     def __str__(self):
@@ -136,6 +139,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='users', null=True, blank=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='staff')
     phone_number = models.CharField(max_length=20, blank=True, null=True)
+    # Issued JWTs carry this; bumping it revokes them (see accounts.authentication)
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = UserManager()
 
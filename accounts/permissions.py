@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .context import get_request_context
+
 class IsAdmin(permissions.BasePermission):
     """Custom permission to only allow admin users to access an object."""
 
@@ -41,13 +43,8 @@ class IsBuyer(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Write permissions are only allowed to users associated with a 'buyer' organization.
-        user = request.user
-        # Check if user is authenticated and has an organization linked
-        if user and user.is_authenticated and hasattr(user, 'organization') and user.organization:
-            # Check if the organization type is 'buyer' or 'both' (if 'both' should also have buyer permissions)
-            return user.organization.organization_type in ['buyer', 'both']
-        return False
+        # Write permissions are only allowed to users associated with a 'buyer' (or 'both') organization.
+        return get_request_context(request).is_buyer
 
 class IsSupplier(permissions.BasePermission):
     """Custom permission to only allow supplier users to access an object."""
@@ -80,7 +77,7 @@ class IsAdminOrManager(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to admin or manager users.
-        return request.user and request.user.is_authenticated and request.user.role in ['admin', 'manager']
+        return get_request_context(request).is_admin_or_manager
 
 class IsOwnerOrAdmin(permissions.BasePermission):
     """Custom permission to only allow owners of an object or admin users to access it."""
@@ -1,48 +1,84 @@
-from threading import local
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Context variables instead of thread-locals: under ASGI many requests share a
+# thread, and each asyncio task (and every sync_to_async call it makes) gets its
+# own copy of the context.
+_current_request = ContextVar('current_request', default=None)
+_current_organization = ContextVar('current_organization', default=None)
 
-_thread_locals = local() # Define _thread_locals here
 
 def get_current_request():
     """
-    Get the current request from thread-local storage.
-    
+    Get the request being handled in the current context.
+
     This allows models and managers to access the current request
     for organization filtering and other context-aware behavior.
     """
-    return getattr(_thread_locals, 'request', None)
+    return _current_request.get()
 
 def get_current_organization():
     """
-    Get the organization from the current request.
-    
-    Returns None if there is no request or no organization.
+    Get the organization of the current context.
+
+    An organization set with tenant_context() takes precedence over the one
+    of the current request. Returns None if there is neither.
     """
+    organization = _current_organization.get()
+    if organization is not None:
+        return organization
     request = get_current_request()
     if request and hasattr(request, 'organization'):
         return request.organization
     return None
 
 
+@contextmanager
+def tenant_context(organization):
+    """
+    Scope queries to an organization for the duration of the block.
+
+    Used by management commands, background work and tests that run outside
+    of a request. Contexts nest and are restored on exit.
+    """
+    token = _current_organization.set(organization)
+    try:
+        yield organization
+    finally:
+        _current_organization.reset(token)
+
+
 class RequestMiddleware:
     """
-    Middleware to store the current request in thread-local storage.
-    
+    Middleware to store the current request in a context variable.
+
     This allows organization filtering to work in model managers by
-    providing access to the current request and organization.
+    providing access to the current request and organization. Works both
+    under WSGI and ASGI.
     """
-    
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
-        # Store request in thread-local storage
-        _thread_locals.request = request
-        
-        # Process the request
-        response = self.get_response(request)
-        
-        # Clean up thread-local storage
-        if hasattr(_thread_locals, 'request'):
-            del _thread_locals.request
-            
-        return response
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
@@ -1,8 +1,14 @@
 from djoser.serializers import UserCreateSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
+from .tokens import RefreshToken
 User = get_user_model()
 
 class UserCreateSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name', 'password', 'is_active')
+
+
+class TokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
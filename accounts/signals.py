@@ -1,6 +1,10 @@
 # filepath: c:\Users\eamok\OneDrive\Desktop\js files\kuandorwear\accounts\signals.py
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from djoser.signals import user_activated
+from .authentication import TOKEN_VERSION_FIELDS, invalidate_cached_users
 from .models import Organization, User
 
 @receiver(user_activated)
@@ -12,3 +16,40 @@ def activate_organization_on_user_activation(sender, user, request, **kwargs):
         user.organization.active_status = True
         user.organization.save(update_fields=['active_status'])
         print(f"Organization {user.organization.name} activated by user {user.email} activation.")
+
+
+@receiver(pre_save, sender=User)
+def remember_token_state(sender, instance, raw=False, **kwargs):
+    # Compared in post_save to tell whether the user's tokens must be revoked
+    if instance.pk and not raw:
+        instance._token_state = User.objects.filter(pk=instance.pk).values(*TOKEN_VERSION_FIELDS, 'token_version').first()
+
+
+@receiver(post_save, sender=User)
+def revoke_user_tokens(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_token_state', None)
+    instance._token_state = None
+    if created or raw or previous is None:
+        return
+    if any(getattr(instance, field) != previous[field] for field in TOKEN_VERSION_FIELDS):
+        # An UPDATE rather than a field on the instance, so save(update_fields=...) revokes too
+        User.objects.filter(pk=instance.pk).update(token_version=F('token_version') + 1)
+        instance.token_version = previous['token_version'] + 1
+    stale = [(instance.pk, previous['token_version'])]
+    # After commit: a worker reading the user before that would cache the old state again
+    transaction.on_commit(lambda: invalidate_cached_users(stale))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    stale = [(instance.pk, instance.token_version)]
+    transaction.on_commit(lambda: invalidate_cached_users(stale))
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_organization_user_cache(sender, instance, **kwargs):
+    # Cached users carry their organization; drop every member's entry
+    stale = list(User.objects.filter(organization_id=instance.pk).values_list('pk', 'token_version'))
+    if stale:
+        transaction.on_commit(lambda: invalidate_cached_users(stale))
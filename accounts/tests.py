@@ -1,7 +1,16 @@
-from django.test import TestCase
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import tokens
 from django.contrib.auth import get_user_model
 from accounts.models import Organization
 from accounts.managers import BaseTenantManager, TenantAwareQuerySet, set_current_organization # Import set_current_organization
+from accounts.authentication import CachedJWTAuthentication
+from accounts.tokens import AccessToken
+from accounts.request_middleware import RequestMiddleware, get_current_organization, get_current_request, tenant_context
 
 User = get_user_model()
 
@@ -48,6 +57,119 @@ class TenantManagerTests(TestCase):
     # Add more tests for other models using TenantManager
     # For example, test filtering for Products, Orders, etc.
 
+class TenantContextTests(SimpleTestCase):
+
+    def test_contexts_nest_and_restore(self):
+        with tenant_context('org1'):
+            with tenant_context('org2'):
+                self.assertEqual(get_current_organization(), 'org2')
+            self.assertEqual(get_current_organization(), 'org1')
+        self.assertIsNone(get_current_organization())
+
+    def test_concurrent_tasks_keep_their_own_tenant(self):
+        async def handle(organization):
+            with tenant_context(organization):
+                await asyncio.sleep(0)  # Let the other task run on the same thread
+                return await sync_to_async(get_current_organization)()
+
+        async def main():
+            return await asyncio.gather(handle('org1'), handle('org2'))
+
+        self.assertEqual(asyncio.run(main()), ['org1', 'org2'])
+
+    def test_async_middleware_scopes_request_to_its_task(self):
+        seen = []
+
+        async def get_response(request):
+            await asyncio.sleep(0)
+            seen.append(get_current_request().organization)
+            return None
+
+        middleware = RequestMiddleware(get_response)
+        factory = RequestFactory()
+        requests = [factory.get('/'), factory.get('/')]
+        for request, organization in zip(requests, ['org1', 'org2']):
+            request.organization = organization
+
+        async def main():
+            await asyncio.gather(*(middleware(request) for request in requests))
+
+        asyncio.run(main())
+        self.assertEqual(seen, ['org1', 'org2'])
+        self.assertIsNone(get_current_request())
+
+
+@override_settings(CACHE_IS_SHARED=True)
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='Cached Org', organization_type='buyer')
+        self.user = User.objects.create_user(
+            email='cached@org.com', username='cached', password='password',
+            organization=self.organization, role='staff'
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.authentication = CachedJWTAuthentication()
+
+    def test_user_and_organization_are_served_from_cache(self):
+        with self.assertNumQueries(1):
+            user = self.authentication.get_user(self.token)
+            self.assertEqual(user.organization.organization_type, 'buyer')
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(self.token)
+            self.assertEqual(user.organization, self.organization)
+
+    def test_role_and_active_changes_revoke_tokens(self):
+        self.authentication.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = 'manager'
+            self.user.save(update_fields=['role'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(self.authentication.get_user(token).role, 'manager')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(token)
+
+    def test_other_user_changes_invalidate_cache(self):
+        self.authentication.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Renamed'
+            self.user.save()
+        self.assertEqual(self.authentication.get_user(self.token).first_name, 'Renamed')
+
+    def test_organization_changes_invalidate_cache(self):
+        self.authentication.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.organization_type = 'both'
+            self.organization.save()
+        self.assertEqual(self.authentication.get_user(self.token).organization.organization_type, 'both')
+
+    def test_deleted_user_is_rejected(self):
+        self.authentication.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_tokens_without_a_version_are_not_cached(self):
+        token = tokens.AccessToken.for_user(self.user)
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.authentication.get_user(token)
+
+    @override_settings(CACHE_IS_SHARED=None)
+    def test_process_local_cache_is_not_used(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.authentication.get_user(self.token)
+
+
 class OrganizationModelTests(TestCase):
 
     def test_organization_creation(self):
@@ -0,0 +1,23 @@
+from rest_framework_simplejwt import tokens
+
+# Claim carrying User.token_version at the time the token was issued
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+class VersionedTokenMixin:
+    """Stamps issued tokens with the user's token version (see CachedJWTAuthentication)"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
+
+class AccessToken(VersionedTokenMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(VersionedTokenMixin, tokens.RefreshToken):
+    # Access tokens obtained from a refresh token copy its version claim
+    access_token_class = AccessToken
@@ -0,0 +1,219 @@
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .deferred import CommitQueue
+from .models import OrderItem, SalesDailyRollup
+from .rankings import SOLD_STATUSES
+from .reports import MONEY
+
+# interval option -> truncation of SalesDailyRollup.day (None: the day itself)
+SERIES_INTERVALS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+# by option -> (id field, name field) on SalesDailyRollup
+TOP_GROUPS = {
+    'product': ('product_id', 'product__name'),
+    'buyer': ('buyer_organization_id', 'buyer_organization__name'),
+    'supplier': ('supplier_organization_id', 'supplier_organization__name'),
+}
+
+TOP_METRICS = ('revenue', 'units', 'margin')
+
+# side option -> organization field of SalesDailyRollup
+SIDES = {'sales': 'supplier_organization', 'purchases': 'buyer_organization'}
+
+
+def _sold_lines():
+    """Order lines that count as sold, each annotated with its sale day"""
+    return OrderItem.objects.filter(order__status__in=SOLD_STATUSES, order__organization__isnull=False).annotate(
+        day=TruncDate(Coalesce('order__date_completed', 'order__order_date'))
+    )
+
+
+def _rollup_rows(lines):
+    return (
+        lines.values('order__organization_id', 'product_id', 'product__organization_id', 'day')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum('subtotal'),
+            cost=Sum(F('quantity') * F('product__cost'), output_field=MONEY),
+        )
+        .order_by()
+    )
+
+
+def _rollup(row):
+    return SalesDailyRollup(
+        day=row['day'], supplier_organization_id=row['product__organization_id'],
+        buyer_organization_id=row['order__organization_id'], product_id=row['product_id'],
+        units=row['units'], revenue=row['revenue'], cost=row['cost'],
+    )
+
+
+def refresh_sales_rollups(order_ids):
+    """
+    Recompute the rollup rows the lines of the given orders fall in, from all
+    the sold lines of those (buyer, product, day) keys. Rows of keys left
+    without sales (a canceled order) are deleted, so refreshing is idempotent.
+    """
+    keys = {
+        (buyer_id, product_id, timezone.localdate(completed or placed))
+        for buyer_id, product_id, completed, placed in OrderItem.objects.filter(
+            order_id__in=order_ids, order__organization__isnull=False
+        ).values_list('order__organization_id', 'product_id', 'order__date_completed', 'order__order_date')
+    }
+    if not keys:
+        return
+
+    buyer_ids, product_ids, days = (set(values) for values in zip(*keys))
+    lines = _sold_lines().filter(
+        order__organization_id__in=buyer_ids, product_id__in=product_ids, day__gte=min(days), day__lte=max(days)
+    )
+    rollups = {}
+    for row in _rollup_rows(lines):
+        key = (row['order__organization_id'], row['product_id'], row['day'])
+        if key in keys:
+            rollups[key] = _rollup(row)
+
+    if rollups:
+        SalesDailyRollup.objects.bulk_create(
+            rollups.values(), update_conflicts=True, unique_fields=['buyer_organization', 'product', 'day'],
+            update_fields=['supplier_organization', 'units', 'revenue', 'cost'],
+        )
+    stale = keys - rollups.keys()
+    if stale:
+        SalesDailyRollup.objects.filter(Q(*[
+            Q(buyer_organization_id=buyer_id, product_id=product_id, day=day) for buyer_id, product_id, day in stale
+        ], _connector=Q.OR)).delete()
+
+
+_rollups = CommitQueue('sales_rollups', set, refresh_sales_rollups)
+
+
+def schedule_sales_rollup(order_ids):
+    """
+    Queue a refresh of the rollups of orders until the current transaction
+    commits. Orders saved many times within one transaction are refreshed once.
+    """
+    _rollups.add(lambda pending: pending.update(order_ids))
+
+
+def rebuild_sales_rollups(supplier_ids=None, since=None, batch_size=1000):
+    """
+    Rebuild the rollups of the given supplier organizations (all when None)
+    from the day since (all days when None), in one transaction. The lines
+    are aggregated in the database and streamed into batches of inserts.
+    Returns the number of rows written.
+    """
+    existing = SalesDailyRollup.objects.all()
+    lines = _sold_lines()
+    if supplier_ids is not None:
+        existing = existing.filter(supplier_organization_id__in=supplier_ids)
+        lines = lines.filter(product__organization_id__in=supplier_ids)
+    if since is not None:
+        existing = existing.filter(day__gte=since)
+        lines = lines.filter(day__gte=since)
+
+    written = 0
+    with transaction.atomic():
+        existing.delete()
+        rows = (_rollup(row) for row in _rollup_rows(lines).iterator(chunk_size=batch_size))
+        while batch := list(islice(rows, batch_size)):
+            SalesDailyRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def _totals(row):
+    revenue = row['revenue'] or Decimal('0.00')
+    cost = row['cost'] or Decimal('0.00')
+    row.update(units=row['units'] or 0, revenue=revenue, cost=cost, margin=revenue - cost)
+    return row
+
+
+def _aggregates():
+    return {'units': Sum('units'), 'revenue': Sum('revenue'), 'cost': Sum('cost')}
+
+
+def default_range(days=30):
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def _period_starts(start, end, interval):
+    if interval == 'week':
+        current = start - timedelta(days=start.weekday())
+    elif interval == 'month':
+        current = start.replace(day=1)
+    else:
+        current = start
+    while current <= end:
+        yield current
+        if interval == 'week':
+            current += timedelta(days=7)
+        elif interval == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+
+
+def sales_series(organization_id, start, end, interval='day', side='sales'):
+    """
+    Units, revenue, cost and margin of an organization's sales (or
+    purchases) per day, week or month from start to end, periods without
+    sales included. One grouped query over the rollups.
+    """
+    rollups = SalesDailyRollup.objects.filter(**{f'{SIDES[side]}_id': organization_id}, day__gte=start, day__lte=end)
+    truncate = SERIES_INTERVALS[interval]
+    period = truncate('day') if truncate else F('day')
+    rows = {
+        row['period']: row
+        for row in rollups.annotate(period=period).values('period').annotate(**_aggregates()).order_by('period')
+    }
+    series = [
+        _totals(rows.get(period_start, {'period': period_start, 'units': 0, 'revenue': None, 'cost': None}))
+        for period_start in _period_starts(start, end, interval)
+    ]
+    return {
+        'side': side,
+        'interval': interval,
+        'start': start,
+        'end': end,
+        'series': series,
+        'totals': _totals({
+            'units': sum(row['units'] for row in series),
+            'revenue': sum(row['revenue'] for row in series),
+            'cost': sum(row['cost'] for row in series),
+        }),
+    }
+
+
+def top_sales(organization_id, start, end, by='product', metric='revenue', limit=10, side='sales'):
+    """The limit products, buyers or suppliers of an organization's sales (or purchases) with the highest metric"""
+    id_field, name_field = TOP_GROUPS[by]
+    rollups = SalesDailyRollup.objects.filter(**{f'{SIDES[side]}_id': organization_id}, day__gte=start, day__lte=end)
+    rows = (
+        rollups.values(id_field, name_field)
+        .annotate(**_aggregates())
+        .annotate(margin=F('revenue') - F('cost'))
+        .order_by(f'-{metric}', id_field)[:limit]
+    )
+    return {
+        'side': side,
+        'by': by,
+        'metric': metric,
+        'start': start,
+        'end': end,
+        'results': [
+            _totals({
+                'id': row[id_field], 'name': row[name_field],
+                'units': row['units'], 'revenue': row['revenue'], 'cost': row['cost'],
+            })
+            for row in rows
+        ],
+    }
@@ -0,0 +1,50 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+from .views import FilteredProductListView, InventoryListView, InventoryMovementListView, ProductAPIView
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def async_read_view(view_class, **initkwargs):
+    """
+    Serve a read-only DRF view as an async Django view.
+
+    Under ASGI, Django runs sync views one at a time on a single shared thread.
+    The wrapped view instead runs on the sync_to_async thread pool
+    (thread_sensitive=False), so one worker can serve several of these requests
+    concurrently. Authentication, permissions, filtering and serialization are
+    those of the wrapped view; tenant context follows the request because it is
+    kept in context variables, which sync_to_async carries into the worker thread.
+
+    Each pool thread holds its own database connection, which is released the
+    same way Django does at the end of a request.
+    """
+    view = view_class.as_view(**initkwargs)
+
+    def handle(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    async def async_view(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        return await sync_to_async(handle, thread_sensitive=False)(request, *args, **kwargs)
+
+    # Set directly: csrf_exempt() in this Django version wraps the view in a sync function
+    async_view.csrf_exempt = True
+    async_view.view_class = view_class
+    return async_view
+
+
+product_list = async_read_view(ProductAPIView)
+filtered_product_list = async_read_view(FilteredProductListView)
+inventory_list = async_read_view(InventoryListView)
+inventory_movement_list = async_read_view(InventoryMovementListView)
@@ -0,0 +1,231 @@
+import platform
+import subprocess
+from time import perf_counter
+
+import django
+from django.db import connection, transaction
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from accounts.models import Organization, OrganizationRelationship
+from .models import CatalogImport, Category, Inventory, Location, Order
+from .query_analysis import QueryCapture
+from .query_budget import get_query_budget
+
+PERCENTILES = (50, 95, 99)
+
+
+def prepare(dataset):
+    """
+    Add the rows the write and detail endpoints need to a generate_dataset() dataset:
+    pending relationships, inactive suppliers, a spare location and a
+    finished catalog import.
+    """
+    supplier = dataset['supplier']
+    tag = dataset['tag']
+    other_buyer = Organization.objects.create(name=f'Benchmark Buyer {tag}', organization_type='buyer')
+    other_buyer_admin = other_buyer.users.create(
+        email=f'benchmark-buyer-{tag}@example.com', username=f'benchmark_buyer_{tag}', role='admin'
+    )
+    third_buyer = Organization.objects.create(name=f'Benchmark Buyer 2 {tag}', organization_type='buyer')
+    third_buyer_admin = third_buyer.users.create(
+        email=f'benchmark-buyer2-{tag}@example.com', username=f'benchmark_buyer2_{tag}', role='admin'
+    )
+    dataset.update(
+        stock=Inventory.objects.filter(organization=supplier, quantity__gte=5).order_by('pk').first(),
+        spare_location=Location.objects.create(name='Overflow', organization=supplier),
+        pending_relationship=OrganizationRelationship.objects.create(
+            buyer_organization=other_buyer, supplier_organization=supplier, initiated_by=other_buyer_admin
+        ),
+        second_pending_relationship=OrganizationRelationship.objects.create(
+            buyer_organization=third_buyer, supplier_organization=supplier, initiated_by=third_buyer_admin
+        ),
+        new_supplier=Organization.objects.create(name=f'Benchmark Supplier {tag}', organization_type='supplier'),
+        second_supplier=Organization.objects.create(name=f'Benchmark Supplier 2 {tag}', organization_type='supplier'),
+        brand=supplier.brands.order_by('pk').first(),
+        category=supplier.categories.order_by('pk').first(),
+        catalog_import=CatalogImport.objects.create(organization=supplier, file='imports/catalog.csv', format='csv', status='completed'),
+    )
+    return dataset
+
+
+def endpoints(dataset):
+    """(label, method, path, user, data) for every endpoint of api.urls, see skipped_routes()"""
+    stock = dataset['stock']
+    destination = Location.objects.filter(organization=dataset['supplier']).exclude(pk=stock.location_id).first()
+    transfer = {'product_id': stock.product_id, 'from_location_id': stock.location_id, 'to_location_id': destination.pk, 'quantity': 1}
+    cart = Order.objects.get(customer=dataset['buyer'], status='pending')
+    subcategory = Category.objects.filter(organization=dataset['supplier'], parent__isnull=False).order_by('pk').first()
+    supplier_admin, buyer_admin = 'supplier_admin', 'buyer_admin'
+
+    return [
+        ('supplier products', 'get', '/api/products/', supplier_admin, None),
+        ('buyer products', 'get', '/api/products/', buyer_admin, None),
+        ('product filter', 'get', '/api/products/filter/?name=Product', buyer_admin, None),
+        ('supplier product filter', 'get', '/api/products/filter/?name=Product', supplier_admin, None),
+        ('product search', 'get', '/api/search/?q=Product', supplier_admin, None),
+        ('buyer product search', 'get', '/api/search/?q=Product', buyer_admin, None),
+        ('supplier inventory', 'get', '/api/inventory/', supplier_admin, None),
+        ('buyer inventory', 'get', '/api/inventory/', buyer_admin, None),
+        ('inventory detail', 'get', f'/api/inventory/{stock.pk}/', supplier_admin, None),
+        ('buyer inventory detail', 'get', f'/api/inventory/{stock.pk}/', buyer_admin, None),
+        ('inventory movements', 'get', '/api/inventory-movements/', supplier_admin, None),
+        ('buyer inventory movements', 'get', '/api/inventory-movements/', buyer_admin, None),
+        ('relationships', 'get', '/api/relationships/', buyer_admin, None),
+        ('potential suppliers', 'get', '/api/potential-suppliers/', buyer_admin, None),
+        ('brands', 'get', '/api/brands/', supplier_admin, None),
+        ('brand detail', 'get', f"/api/brands/{dataset['brand'].pk}/", supplier_admin, None),
+        ('categories', 'get', '/api/categories/', supplier_admin, None),
+        ('category detail', 'get', f"/api/categories/{dataset['category'].pk}/", supplier_admin, None),
+        ('category tree', 'get', '/api/categories/tree/', supplier_admin, None),
+        ('category breadcrumbs', 'get', f"/api/categories/{subcategory.pk}/breadcrumbs/", supplier_admin, None),
+        ('category filter', 'get', f"/api/products/filter/?category={dataset['category'].pk}", buyer_admin, None),
+        ('faceted filter', 'get', '/api/products/filter/?facets=1&min_price=1&in_stock=true', buyer_admin, None),
+        ('popular products page', 'get', '/api/products/?ordering=popular&page_size=20', buyer_admin, None),
+        ('trending filter page', 'get', '/api/products/filter/?ordering=trending&in_stock=true&page_size=20', buyer_admin, None),
+        ('locations', 'get', '/api/locations/', supplier_admin, None),
+        ('location detail', 'get', f"/api/locations/{dataset['spare_location'].pk}/", supplier_admin, None),
+        ('inventory valuation', 'get', '/api/reports/inventory-valuation/', supplier_admin, None),
+        ('sales series', 'get', '/api/analytics/sales/series/?interval=week', supplier_admin, None),
+        ('purchases series', 'get', '/api/analytics/sales/series/?side=purchases', buyer_admin, None),
+        ('top products', 'get', '/api/analytics/sales/top/?by=product&metric=margin', supplier_admin, None),
+        ('top suppliers', 'get', '/api/analytics/sales/top/?side=purchases&by=supplier', buyer_admin, None),
+        ('supplier scorecard', 'get', f"/api/suppliers/{dataset['supplier'].pk}/scorecard/", supplier_admin, None),
+        ('buyer supplier scorecard', 'get', f"/api/suppliers/{dataset['supplier'].pk}/scorecard/", buyer_admin, None),
+        ('cart', 'get', '/api/cart-data/', buyer_admin, None),
+        ('activate organization', 'get', f"/api/organizations/activate/{dataset['new_supplier'].activation_token}/", None, None),
+        ('catalog imports', 'get', '/api/products/imports/', supplier_admin, None),
+        ('catalog import detail', 'get', f"/api/products/imports/{dataset['catalog_import'].pk}/", supplier_admin, None),
+        ('create product', 'post', '/api/products/create/', supplier_admin, {'name': 'New', 'sku': f"{dataset['tag']}-NEW", 'price': '5.00', 'cost': '2.00'}),
+        ('create inventory', 'post', '/api/inventory/create/', supplier_admin, {'product': stock.product_id, 'location': dataset['spare_location'].pk, 'quantity': 3}),
+        ('update inventory', 'patch', f'/api/inventory/{stock.pk}/update/', supplier_admin, {'quantity': stock.quantity + 1}),
+        ('transfer', 'post', '/api/inventory/transfers/', supplier_admin, transfer),
+        ('transfer batch', 'post', '/api/inventory/transfers/batch/', supplier_admin, {'transfers': [transfer, transfer]}),
+        ('create brand', 'post', '/api/brands/', supplier_admin, {'name': 'New Brand'}),
+        ('update brand', 'patch', f"/api/brands/{dataset['brand'].pk}/", supplier_admin, {'name': 'Renamed Brand'}),
+        ('create category', 'post', '/api/categories/', supplier_admin, {'name': 'New Category'}),
+        ('update category', 'patch', f"/api/categories/{dataset['category'].pk}/", supplier_admin, {'name': 'Renamed Category'}),
+        ('create location', 'post', '/api/locations/', supplier_admin, {'name': 'New Site'}),
+        ('update location', 'patch', f"/api/locations/{dataset['spare_location'].pk}/", supplier_admin, {'name': 'Overflow 2'}),
+        ('request relationship', 'post', '/api/relationships/request/', buyer_admin, {'target_organization_id': dataset['new_supplier'].pk}),
+        ('accept relationship', 'patch', f"/api/relationships/{dataset['pending_relationship'].pk}/update/", supplier_admin, {'status': 'accepted'}),
+        ('request relationship batch', 'post', '/api/relationships/request/batch/', buyer_admin, {
+            'target_organization_ids': [dataset['new_supplier'].pk, dataset['second_supplier'].pk]
+        }),
+        ('update relationship batch', 'post', '/api/relationships/update/batch/', supplier_admin, {
+            'ids': [dataset['pending_relationship'].pk, dataset['second_pending_relationship'].pk], 'status': 'accepted'
+        }),
+        ('add to cart', 'post', '/api/create-order/', buyer_admin, {'product_id': stock.product_id}),
+        ('update cart', 'patch', '/api/update-cart/', buyer_admin, {'product_id': stock.product_id, 'action': 'add', 'amount': 1}),
+        ('process order', 'post', '/api/process-order/', buyer_admin, {'total': str(cart.get_cart_total), 'user_info': {}, 'shipping_info': {}}),
+        ('onboarding', 'post', '/api/onboarding/', None, {
+            'name': f"Onboarded {dataset['tag']}", 'contact_email': 'org@onboarded.com', 'first_name': 'On',
+            'last_name': 'Boarded', 'email': f"user-{dataset['tag']}@onboarded.com",
+            'password': 'S3cure-pass!', 're_password': 'S3cure-pass!',
+        }),
+    ]
+
+
+def skipped_routes():
+    """Routes of api.urls that are not benchmarked, with the reason"""
+    from . import urls as api_urls
+    skipped = {}
+    for pattern in api_urls.urlpatterns:
+        budget = get_query_budget(pattern.callback)
+        if str(pattern.pattern).startswith('async/'):
+            # They query on worker threads, which do not see the uncommitted dataset
+            skipped[str(pattern.pattern)] = "Async variant; its sync counterpart is benchmarked"
+        elif budget is not None and budget.is_exempt:
+            skipped[str(pattern.pattern)] = budget.reason
+    return skipped
+
+
+def route(path):
+    return resolve(path.partition('?')[0]).route.removeprefix('api/')
+
+
+def percentile(samples, percent):
+    """Linear interpolation between the closest ranks of sorted samples"""
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure(dataset, label, method, path, user, data, runs):
+    """
+    Time one endpoint runs times, after an untimed warm-up run that counts its
+    queries. Every request runs in a savepoint that is rolled back, so writes
+    see the same data on every run.
+    """
+    client = APIClient(SERVER_NAME='127.0.0.1')
+    if user:
+        client.force_authenticate(dataset[user])
+    call = getattr(client, method)
+
+    with transaction.atomic():
+        with QueryCapture() as capture:
+            response = call(path, data, format='json')
+        transaction.set_rollback(True)
+
+    timings = []
+    for _ in range(runs):
+        with transaction.atomic():
+            start = perf_counter()
+            call(path, data, format='json')
+            timings.append(perf_counter() - start)
+            transaction.set_rollback(True)
+
+    result = {
+        'method': method.upper(),
+        'path': path,
+        'status': response.status_code,
+        'queries': len(capture.queries),
+        'runs': runs,
+        'mean_ms': sum(timings) / runs * 1000,
+    }
+    for percent in PERCENTILES:
+        result[f'p{percent}_ms'] = percentile(timings, percent) * 1000
+    return result
+
+
+def environment():
+    """What a result depends on besides the code: versions and the database"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Per-endpoint differences between two benchmark results. An endpoint
+    regressed when it runs more queries, or its p95 latency grew by more than
+    threshold percent.
+    """
+    rows = []
+    for label, result in current['results'].items():
+        before = baseline['results'].get(label)
+        if before is None:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+        rows.append({
+            'label': label,
+            'p95_before': before['p95_ms'],
+            'p95_after': result['p95_ms'],
+            'p95_change': change,
+            'queries_before': before['queries'],
+            'queries_after': result['queries'],
+            'regressed': result['queries'] > before['queries'] or change > threshold,
+        })
+    return rows
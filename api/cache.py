@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(namespace, organization_id):
+    return f'{namespace}:version:{organization_id}'
+
+
+def get_version(namespace, organization_id):
+    """Current cache version of a namespace for one organization"""
+    return cache.get(_version_key(namespace, organization_id), 0)
+
+
+def get_versions(namespace, organization_ids):
+    """Current cache versions of a namespace for several organizations, in one cache round trip"""
+    keys = [_version_key(namespace, organization_id) for organization_id in organization_ids]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def _bump(namespace, organization_ids):
+    for organization_id in organization_ids:
+        key = _version_key(namespace, organization_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def bump_version(namespace, organization_ids):
+    """
+    Invalidate every cached entry of a namespace for the given organizations.
+
+    Entries are never deleted individually; bumping the version makes all keys
+    built with versioned_key() unreachable and lets them expire on their own.
+    The version is bumped once the current transaction commits: bumped any
+    earlier, a request reading the old rows before the commit would cache
+    them again under the new version. Other workers only see the bump when
+    the cache is shared by all of them (see CACHES in the settings).
+    """
+    organization_ids = {organization_id for organization_id in organization_ids if organization_id is not None}
+    if organization_ids:
+        transaction.on_commit(lambda: _bump(namespace, organization_ids))
+
+
+def versioned_key(namespace, organization_id, *parts):
+    """Build a cache key that is invalidated by bump_version()"""
+    version = get_version(namespace, organization_id)
+    return ':'.join(str(part) for part in (namespace, organization_id, version, *parts))
@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from stocksync.log import get_logger
+from .models import Brand, CatalogImport, Category, Product, ProductImage, ProductSize, Size
+from .serializers import CatalogImportRowSerializer
+from .signals import catalog_imported
+
+log = get_logger(__name__)
+
+# Product fields a row may set, besides brand, category, sizes and images
+PRODUCT_FIELDS = ('name', 'price', 'cost', 'description', 'barcode', 'digital', 'active')
+
+# Separator of the values of the sizes and images columns of a CSV file
+CSV_LIST_SEPARATOR = '|'
+
+
+def _csv_row(row):
+    """
+    A CSV row as an import row: empty cells are left out, sizes are
+    'S|M|L' and images 'color=name|color=name', the first being the default.
+    """
+    row = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+    if 'sizes' in row:
+        row['sizes'] = [size.strip() for size in row['sizes'].split(CSV_LIST_SEPARATOR) if size.strip()]
+    if 'images' in row:
+        images = []
+        for position, entry in enumerate(row['images'].split(CSV_LIST_SEPARATOR)):
+            color, _, name = entry.strip().rpartition('=')
+            images.append({'color': color.strip(), 'image': name.strip(), 'default': position == 0})
+        row['images'] = images
+    return row
+
+
+def read_rows(file, format):
+    """
+    Yield (line number, row, error) for every row of an open binary CSV or
+    NDJSON file, reading it one line at a time. error is set, and row None,
+    when the line cannot be parsed.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, _csv_row(row), None
+        return
+
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Expected a JSON object."
+            continue
+        yield number, row, None
+
+
+class CatalogImporter:
+    """
+    Upserts the products of one organization from import rows, chunk_size
+    rows at a time.
+
+    Every chunk is validated in memory, then resolved with set-based queries:
+    one for its existing SKUs, and for the brand and size names not seen in
+    an earlier chunk one lookup and one insert of the missing ones. Its
+    products, sizes and images are then written with bulk queries in one
+    transaction.
+    """
+
+    def __init__(self, organization, chunk_size=None, max_errors=None):
+        self.organization = organization
+        self.chunk_size = chunk_size or getattr(settings, 'CATALOG_IMPORT_CHUNK_SIZE', 500)
+        self.max_errors = max_errors if max_errors is not None else getattr(settings, 'CATALOG_IMPORT_MAX_ERRORS', 100)
+        self.brands = {}
+        self.sizes = {}
+        self.categories = None
+        self.seen_skus = {}
+        self.processed = self.created = self.updated = self.failed = 0
+        self.errors = []
+
+    def run(self, rows, progress=None):
+        """Import rows (see read_rows), calling progress(self) after every chunk"""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return self
+            self.import_chunk(chunk)
+            if progress is not None:
+                progress(self)
+
+    def error(self, number, sku, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'sku': sku, 'errors': errors})
+
+    def import_chunk(self, chunk):
+        valid = {}
+        for number, row, error in chunk:
+            self.processed += 1
+            if error:
+                self.error(number, None, {'non_field_errors': [error]})
+                continue
+            serializer = CatalogImportRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.error(number, row.get('sku'), serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data['sku'] in self.seen_skus:
+                self.error(number, data['sku'], {'sku': [f"Duplicate of row {self.seen_skus[data['sku']]}."]})
+                continue
+            self.seen_skus[data['sku']] = number
+            valid[data['sku']] = (number, data)
+
+        if not valid:
+            return
+        try:
+            self.write_chunk(valid)
+        except IntegrityError:
+            # A SKU was taken since it was checked: once more, with the SKUs re-read
+            self.write_chunk(valid)
+
+    def resolve_categories(self):
+        if self.categories is None:
+            self.categories = {}
+            for pk, name in Category.objects.filter(organization=self.organization).values_list('pk', 'name'):
+                # A name shared by several categories is ambiguous; their ids still resolve
+                self.categories[name] = None if name in self.categories else pk
+                self.categories[str(pk)] = pk
+        return self.categories
+
+    def resolve_brands(self, names):
+        missing = set(names) - set(self.brands)
+        if missing:
+            for pk, name in Brand.objects.filter(organization=self.organization, name__in=missing).values_list('pk', 'name'):
+                self.brands.setdefault(name, pk)
+            created = Brand.objects.bulk_create(
+                [Brand(name=name, organization=self.organization) for name in sorted(missing - set(self.brands))]
+            )
+            self.brands.update((brand.name, brand.pk) for brand in created)
+        return self.brands
+
+    def resolve_sizes(self, names):
+        missing = set(names) - set(self.sizes)
+        if missing:
+            for pk, name in Size.objects.filter(name__in=missing).order_by('pk').values_list('pk', 'name'):
+                self.sizes.setdefault(name, pk)
+            created = Size.objects.bulk_create([Size(name=name) for name in sorted(missing - set(self.sizes))])
+            self.sizes.update((size.name, size.pk) for size in created)
+        return self.sizes
+
+    def write_chunk(self, valid):
+        # Brands and sizes are committed on their own, so the caches never hold rolled back rows
+        brands = self.resolve_brands({data['brand'] for _, data in valid.values() if data.get('brand')})
+        sizes = self.resolve_sizes({size for _, data in valid.values() for size in data.get('sizes', ())})
+        categories = self.resolve_categories()
+        existing = {product.sku: product for product in Product.objects.filter(sku__in=valid)}
+
+        new, updated, update_fields, rows, failures = [], [], set(), [], []
+        now = timezone.now()
+        for sku, (number, data) in valid.items():
+            product = existing.get(sku)
+            if product is not None and product.organization_id != self.organization.pk:
+                failures.append((number, sku, {'sku': ["This SKU is used by another organization."]}))
+                continue
+            fields = {field: data[field] for field in PRODUCT_FIELDS if field in data}
+            if 'brand' in data:
+                fields['brand_id'] = brands[data['brand']] if data['brand'] else None
+            if 'category' in data:
+                fields['category_id'] = categories.get(data['category']) if data['category'] else None
+                if data['category'] and fields['category_id'] is None:
+                    reason = "Unknown category." if data['category'] not in categories else "Several categories have this name; use its id."
+                    failures.append((number, sku, {'category': [reason]}))
+                    continue
+
+            if product is None:
+                product = Product(sku=sku, organization=self.organization, **fields)
+                new.append(product)
+            else:
+                for field, value in fields.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                update_fields.update(fields)
+                updated.append(product)
+            rows.append((product, data))
+
+        with transaction.atomic():
+            Product.objects.bulk_create(new)
+            if updated:
+                Product.objects.bulk_update(updated, sorted(update_fields | {'updated_at'}))
+            self.write_sizes([(product, data['sizes']) for product, data in rows if 'sizes' in data], sizes)
+            self.write_images([(product, data['images']) for product, data in rows if 'images' in data])
+
+        for failure in failures:
+            self.error(*failure)
+        self.created += len(new)
+        self.updated += len(updated)
+        catalog_imported.send(
+            sender=Product, organization_id=self.organization.pk,
+            created_ids=[product.pk for product in new], updated_ids=[product.pk for product in updated],
+        )
+
+    def write_sizes(self, products, sizes):
+        """Give each product exactly the listed sizes"""
+        if not products:
+            return
+        wanted = {(product.pk, sizes[name]) for product, names in products for name in names}
+        current = ProductSize.objects.filter(product__in=[product for product, _ in products]).values_list('pk', 'product_id', 'size_id')
+        stale = [pk for pk, product_id, size_id in current if (product_id, size_id) not in wanted]
+        if stale:
+            ProductSize.objects.filter(pk__in=stale).delete()
+        ProductSize.objects.bulk_create(
+            [ProductSize(product_id=product_id, size_id=size_id) for product_id, size_id in sorted(wanted)],
+            ignore_conflicts=True,
+        )
+
+    def write_images(self, products):
+        """Give each product exactly the listed images, keeping the rows (and variants) of unchanged ones"""
+        if not products:
+            return
+        wanted = {}
+        for product, images in products:
+            for image in images:
+                wanted[(product.pk, image['image'])] = image
+        current = ProductImage.objects.filter(product__in=[product for product, _ in products])
+
+        stale, changed = [], []
+        for row in current:
+            image = wanted.pop((row.product_id, row.image.name), None)
+            if image is None:
+                stale.append(row.pk)
+            elif (row.color, row.default) != (image['color'], image['default']):
+                row.color, row.default = image['color'], image['default']
+                changed.append(row)
+        if stale:
+            ProductImage.objects.filter(pk__in=stale).delete()
+        if changed:
+            ProductImage.objects.bulk_update(changed, ['color', 'default'])
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=product_id, image=name, color=image['color'], default=image['default'])
+            for (product_id, name), image in wanted.items()
+        ])
+
+
+def _report(catalog_import, importer):
+    CatalogImport.objects.filter(pk=catalog_import.pk).update(
+        processed_rows=importer.processed, created_products=importer.created,
+        updated_products=importer.updated, failed_rows=importer.failed, errors=importer.errors,
+    )
+
+
+def import_catalog(catalog_import, chunk_size=None):
+    """
+    Import the file of a running CatalogImport, reporting its progress after
+    every chunk. A file that cannot be read fails the import; the chunks
+    written until then are kept.
+    """
+    importer = CatalogImporter(catalog_import.organization, chunk_size=chunk_size)
+    try:
+        with catalog_import.file.open('rb') as file:
+            importer.run(read_rows(file, catalog_import.format), progress=partial(_report, catalog_import))
+        status = 'completed'
+    except Exception as e:
+        log.exception('catalog_import.failed', import_id=catalog_import.pk)
+        importer.errors.append({'row': None, 'sku': None, 'errors': {'file': [str(e)]}})
+        status = 'failed'
+
+    _report(catalog_import, importer)
+    CatalogImport.objects.filter(pk=catalog_import.pk).update(status=status, finished_at=timezone.now())
+    catalog_import.refresh_from_db()
+    log.info(
+        'catalog_import.finished', import_id=catalog_import.pk, status=status, rows=importer.processed,
+        created=importer.created, updated=importer.updated, failed=importer.failed,
+    )
+    return catalog_import
+
+
+def claim_next_import():
+    """
+    Mark the oldest pending import as running and return it, or None. The
+    conditional update lets several workers poll without taking the same import.
+    """
+    while True:
+        catalog_import = CatalogImport.objects.filter(status='pending').order_by('pk').first()
+        if catalog_import is None:
+            return None
+        claimed = CatalogImport.objects.filter(pk=catalog_import.pk, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if claimed:
+            catalog_import.refresh_from_db()
+            return catalog_import
+
+
+def run_pending_imports(limit=None, chunk_size=None):
+    """Import pending catalog imports, oldest first, until none (or limit) are left. Returns them."""
+    imports = []
+    while limit is None or len(imports) < limit:
+        catalog_import = claim_next_import()
+        if catalog_import is None:
+            break
+        imports.append(import_catalog(catalog_import, chunk_size=chunk_size))
+    return imports
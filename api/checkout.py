@@ -0,0 +1,197 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from stocksync.log import get_logger
+from .models import Inventory, InventoryMovement, StockReservation
+from .signals import inventory_changed
+
+log = get_logger(__name__)
+
+SUPPLIER_TYPES = ('supplier', 'both')
+
+
+class InsufficientStock(Exception):
+    """Raised when a supplier cannot cover an order line. Nothing of the checkout is applied."""
+
+    def __init__(self, product, quantity):
+        super().__init__(f"Insufficient stock for {product.name}.")
+        self.product = product
+        self.quantity = quantity
+
+
+class _Stock:
+    """Locked inventory rows and the changes made to them, applied together by save()"""
+
+    def __init__(self, rows, now):
+        self.rows = {row.pk: row for row in rows}
+        self.now = now
+        self.quantity = defaultdict(int)
+        self.reserved = defaultdict(int)
+        self.sold, self.stocked = set(), set()
+        self.movements = []
+
+    def available(self, row):
+        return row.quantity - row.reserved_quantity
+
+    def change(self, row, quantity=0, reserved=0):
+        row.quantity += quantity
+        row.reserved_quantity += reserved
+        self.quantity[row.pk] += quantity
+        self.reserved[row.pk] += reserved
+
+    def record(self, row, quantity_change, movement_type, note, user, reference):
+        (self.sold if movement_type == 'sale' else self.stocked).add(row.pk)
+        self.movements.append(InventoryMovement(
+            inventory=row, quantity_change=quantity_change, movement_type=movement_type,
+            note=note, reference=reference, user=user, organization_id=row.organization_id
+        ))
+
+    def save(self):
+        """One UPDATE of all the changed rows, one insert of the movements, one signal per organization"""
+        changed = self.quantity.keys() | self.reserved.keys()
+        if not changed:
+            return
+
+        def delta(field, deltas):
+            return Case(
+                *[When(pk=pk, then=F(field) + amount) for pk, amount in deltas.items() if amount],
+                default=F(field), output_field=Inventory._meta.get_field(field)
+            )
+
+        def stamp(field, pks):
+            return Case(When(pk__in=pks, then=Value(self.now)), default=F(field)) if pks else F(field)
+
+        Inventory.objects.filter(pk__in=changed).update(
+            quantity=delta('quantity', self.quantity),
+            reserved_quantity=delta('reserved_quantity', self.reserved),
+            last_sold=stamp('last_sold', self.sold),
+            last_stocked=stamp('last_stocked', self.stocked),
+            updated_at=self.now
+        )
+        InventoryMovement.objects.bulk_create(self.movements, batch_size=500)
+
+        by_organization = defaultdict(list)
+        for pk in sorted(changed):
+            by_organization[self.rows[pk].organization_id].append(pk)
+        for organization_id, inventory_ids in by_organization.items():
+            inventory_changed.send(sender=Inventory, organization_id=organization_id, inventory_ids=inventory_ids)
+
+
+def _convert_reservations(stock, item, holds, note, user, reference):
+    """
+    Turn an order item's active holds into sales, as far as they cover it.
+    Returns the number of units sold from reservations and the hold updates.
+    """
+    converted, updates = 0, {}
+    for hold in holds:
+        quantity = min(hold.quantity, item.quantity - converted)
+        if quantity <= 0:
+            break
+        row = stock.rows[hold.inventory_id]
+        if row.quantity >= quantity and row.reserved_quantity >= quantity:
+            # The cart holds more than it buys; the surplus is returned
+            surplus = min(hold.quantity - quantity, row.reserved_quantity - quantity)
+            stock.change(row, quantity=-quantity, reserved=-quantity - surplus)
+            stock.record(row, -quantity, 'sale', note, user, reference)
+            converted += quantity
+            updates[hold.pk] = ('converted', quantity)
+        else:
+            # Stock was adjusted below the hold; drop it and fall back to available stock
+            stock.change(row, reserved=-min(hold.quantity, row.reserved_quantity))
+            updates[hold.pk] = ('released', hold.quantity)
+    return converted, updates
+
+
+def fulfil_order(order, items, organization, location, user=None):
+    """
+    Move the stock of an order's items from their suppliers to the buyer
+    organization's location, in a fixed number of queries whatever the
+    number of items.
+
+    The holds of the items and the supplier and buyer inventory rows are
+    locked up front (missing buyer rows are created), every item is then
+    worked out on the locked rows: its holds become sales first, and the
+    remainder is taken from the supplier location with the most available
+    stock. The rows are updated with one UPDATE ... CASE statement, the
+    holds with another, and the sale and purchase movements written with a
+    single bulk_create. Raises InsufficientStock when a supplier cannot
+    cover an item.
+    """
+    now = timezone.now()
+    reference = order.order_number
+    sale_note = f"Sale to {organization.name} (Order {order.id})"
+    supplied = {
+        item.pk for item in items
+        if item.product.organization and item.product.organization.organization_type in SUPPLIER_TYPES
+    }
+    catalogs = defaultdict(set)
+    for item in items:
+        if item.pk in supplied:
+            catalogs[item.product.organization_id].add(item.product_id)
+
+    with transaction.atomic():
+        holds = defaultdict(list)
+        for hold in StockReservation.objects.select_for_update().filter(order_item__in=supplied, status='active').order_by('pk'):
+            holds[hold.order_item_id].append(hold)
+
+        Inventory.objects.bulk_create(
+            [
+                Inventory(product_id=product_id, location=location, organization=organization, quantity=0)
+                for product_id in {item.product_id for item in items}
+            ],
+            ignore_conflicts=True
+        )
+        rows = Inventory.objects.select_for_update().filter(
+            Q(*[
+                Q(organization_id=organization_id, product_id__in=product_ids)
+                for organization_id, product_ids in catalogs.items()
+            ], _connector=Q.OR)
+            | Q(pk__in=[hold.inventory_id for item_holds in holds.values() for hold in item_holds])
+            | Q(product__in=[item.product_id for item in items], location=location, organization=organization)
+        ).order_by('pk')
+        stock = _Stock(rows, now)
+
+        product_rows, buyer_rows = defaultdict(list), {}
+        for row in stock.rows.values():
+            product_rows[row.product_id].append(row)
+            if row.location_id == location.pk and row.organization_id == organization.pk:
+                buyer_rows[row.product_id] = row
+
+        hold_updates = {}
+        for item in items:
+            product = item.product
+            supplier_organization = product.organization
+            log.debug('checkout.item', order_id=order.id, product_id=product.id, quantity=item.quantity)
+
+            if item.pk in supplied:
+                converted, updates = _convert_reservations(stock, item, holds[item.pk], sale_note, user, reference)
+                hold_updates.update(updates)
+                remaining = item.quantity - converted
+                candidates = [row for row in product_rows[product.pk] if row.organization_id == supplier_organization.pk]
+                if remaining > 0 and candidates:
+                    # Prefer the location with the most available stock
+                    row = max(candidates, key=stock.available)
+                    if stock.available(row) < remaining:
+                        raise InsufficientStock(product, remaining)
+                    stock.change(row, quantity=-remaining)
+                    stock.record(row, -remaining, 'sale', sale_note, user, reference)
+                elif remaining > 0:
+                    log.warning('checkout.item.no_supplier_stock', product_id=product.id, organization_id=supplier_organization.id)
+
+            row = buyer_rows[product.pk]
+            stock.change(row, quantity=item.quantity)
+            stock.record(
+                row, item.quantity, 'purchase', f"Purchase from {supplier_organization.name} (Order {order.id})", user, reference
+            )
+
+        if hold_updates:
+            StockReservation.objects.filter(pk__in=hold_updates).update(
+                status=Case(*[When(pk=pk, then=Value(status)) for pk, (status, _) in hold_updates.items()]),
+                quantity=Case(*[When(pk=pk, then=Value(quantity)) for pk, (_, quantity) in hold_updates.items()]),
+                updated_at=now
+            )
+        stock.save()
+    return stock.movements
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Buyer, Order
+
+# Payment statuses of orders the buyer still owes
+OUTSTANDING_PAYMENT_STATUSES = ('unpaid', 'partially_paid')
+
+# Order statuses that are not a debt: carts, and orders that will never be paid
+NOT_OWED_STATUSES = ('pending', 'canceled')
+
+# Payment terms under which orders are bought on credit, up to the buyer's credit_limit
+CREDIT_PAYMENT_TERMS = ('net_15', 'net_30', 'custom')
+
+
+class CreditLimitExceeded(Exception):
+    """An order would take a buyer's outstanding balance over its credit limit."""
+
+    def __init__(self, buyer_id, available, amount):
+        self.buyer_id = buyer_id
+        self.available = available
+        self.amount = amount
+        super().__init__(f"Order of {amount} exceeds the available credit of {available}.")
+
+
+def outstanding_orders():
+    return Order.objects.filter(payment_status__in=OUTSTANDING_PAYMENT_STATUSES).exclude(status__in=NOT_OWED_STATUSES)
+
+
+def refresh_outstanding_balances(buyer_ids=None):
+    """
+    Recompute Buyer.outstanding_balance of the given buyers (all when None)
+    from their unpaid orders, with one correlated UPDATE. Running it in the
+    transaction that changed an order keeps the balance consistent with it.
+    """
+    owed = (
+        outstanding_orders().filter(customer=OuterRef('pk'))
+        .values('customer').annotate(total=Sum('total_amount')).values('total')
+    )
+    buyers = Buyer.objects.all() if buyer_ids is None else Buyer.objects.filter(pk__in=buyer_ids)
+    return buyers.update(outstanding_balance=Coalesce(
+        Subquery(owed), Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+def check_credit(buyer_id, amount):
+    """
+    Lock the buyer's row until the end of the current transaction and raise
+    CreditLimitExceeded unless an order of amount fits in its available
+    credit. Concurrent checkouts of the same buyer queue on the lock, so each
+    one sees the balance the previous one left. Buyers not on credit terms
+    are not limited.
+    """
+    terms, credit_limit, outstanding = Buyer.objects.select_for_update().values_list(
+        'payment_terms', 'credit_limit', 'outstanding_balance'
+    ).get(pk=buyer_id)
+    if terms not in CREDIT_PAYMENT_TERMS:
+        return
+    if outstanding + amount > credit_limit:
+        raise CreditLimitExceeded(buyer_id, max(credit_limit - outstanding, Decimal('0.00')), amount)
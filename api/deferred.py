@@ -0,0 +1,60 @@
+import weakref
+from contextvars import ContextVar
+
+from django.db import transaction
+
+
+class _Batch:
+    __slots__ = ('state', 'ran', 'callback')
+
+    def __init__(self, state):
+        self.state = state
+        self.ran = False
+        self.callback = None
+
+    def pending(self):
+        # Only the connection holds the callbacks: once their block rolls back they are gone
+        return not self.ran and self.callback is not None and self.callback() is not None
+
+
+class CommitQueue:
+    """
+    Work queued by the writes of a transaction, merged and run once it commits.
+
+    Pending states, built by new(), are kept in a ContextVar per savepoint
+    (None for the outermost transaction), so concurrent requests served on
+    one thread (async views) never share them and work queued in a rolled
+    back savepoint never reaches the commit of the enclosing transaction.
+    Every add() registers a transaction.on_commit() callback capturing the
+    state of its block; the first of them to run passes it to run() and
+    removes it from the ContextVar. A rollback discards the callbacks, and
+    the state is not reused afterwards. Outside of a transaction the work
+    runs immediately.
+    """
+
+    def __init__(self, name, new, run):
+        self.new = new
+        self.run = run
+        self._pending = ContextVar(name, default={})
+
+    def add(self, update):
+        """Call update(state) with the pending state of the current transaction"""
+        connection = transaction.get_connection()
+        block = next((sid for sid in reversed(connection.savepoint_ids) if sid), None) if connection.in_atomic_block else None
+        pending = {key: batch for key, batch in self._pending.get().items() if batch.pending()}
+        batch = pending.get(block)
+        if batch is None:
+            batch = pending[block] = _Batch(self.new())
+        self._pending.set(pending)
+        update(batch.state)
+
+        def callback():
+            if batch.ran:
+                return
+            batch.ran = True
+            self._pending.set({key: other for key, other in self._pending.get().items() if other is not batch})
+            self.run(batch.state)
+
+        batch.callback = weakref.ref(callback)
+        # robust: failing deferred work must not surface as an error of the committed change
+        transaction.on_commit(callback, robust=True)
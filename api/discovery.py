@@ -0,0 +1,72 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
+
+from accounts.models import Organization, OrganizationRelationship
+from .cache import bump_version, get_version, versioned_key
+
+POTENTIAL_SUPPLIERS = 'potential_suppliers'
+# Pseudo organization id whose version changes with the supplier directory itself
+DIRECTORY = 'directory'
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def potential_suppliers(organization, search=None):
+    """
+    Supplier organizations the organization has no relationship with yet, in
+    any status, as one NOT EXISTS anti-join against OrganizationRelationship.
+
+    search matches the start of the name, case-insensitively. It is written as
+    a range on lower(name) so that the organization_name_lower_idx index
+    serves it, plus the exact prefix test on the rows in that range.
+    """
+    relationships = OrganizationRelationship.objects.filter(
+        buyer_organization=organization, supplier_organization=OuterRef('pk')
+    )
+    queryset = (
+        Organization.objects
+        .filter(organization_type__in=['supplier', 'both'])
+        .exclude(pk=organization.pk)
+        .filter(~Exists(relationships))
+    )
+    if search:
+        prefix = search.lower()
+        queryset = queryset.alias(name_lower=Lower('name')).filter(
+            name_lower__gte=prefix, name_lower__lt=_prefix_upper_bound(prefix), name_lower__startswith=prefix
+        )
+    return queryset
+
+
+def cached_potential_suppliers(organization_id, url, build):
+    """
+    Return the cached response data of one page of an organization's
+    potential suppliers (identified by its url), building it with build() on a miss.
+
+    Entries are invalidated by invalidate_potential_suppliers() when a
+    relationship of the organization is created or deleted, and for every
+    organization when the directory changes.
+    """
+    key = versioned_key(
+        POTENTIAL_SUPPLIERS, organization_id, get_version(POTENTIAL_SUPPLIERS, DIRECTORY),
+        hashlib.sha1(url.encode()).hexdigest()
+    )
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, getattr(settings, 'POTENTIAL_SUPPLIER_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate_potential_suppliers(organization_ids):
+    bump_version(POTENTIAL_SUPPLIERS, organization_ids)
+
+
+def invalidate_supplier_directory():
+    bump_version(POTENTIAL_SUPPLIERS, [DIRECTORY])
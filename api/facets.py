@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import bump_version, get_versions
+from .models import product_in_stock
+
+PRODUCT_FACETS = 'product_facets'
+
+# Lower bounds of the price buckets; the last bucket has no upper bound
+PRICE_BUCKETS = ('0.00', '10.00', '25.00', '50.00', '100.00', '250.00', '500.00')
+
+# facet -> (id field, name field) on Product
+FACET_GROUPS = {
+    'brands': ('brand_id', 'brand__name'),
+    'categories': ('category_id', 'category__name'),
+    'suppliers': ('organization_id', 'organization__name'),
+}
+
+
+def _price_ranges():
+    return list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)))
+
+
+def product_facets(queryset):
+    """
+    Counts of the products of queryset per brand, category and supplier, per
+    price bucket and in stock.
+
+    One grouped query per facet group, plus one query for the price buckets,
+    the in-stock count and the total, all aggregated in the database.
+    queryset should be the filtered catalog without listing annotations.
+    """
+    queryset = queryset.order_by()
+    facets = {}
+    for facet, (id_field, name_field) in FACET_GROUPS.items():
+        rows = queryset.values(id_field, name_field).annotate(count=Count('pk')).order_by('-count', name_field)
+        facets[facet] = [{'id': row[id_field], 'name': row[name_field], 'count': row['count']} for row in rows]
+
+    aggregates = {'total': Count('pk'), 'in_stock': Count('pk', filter=product_in_stock())}
+    for index, (low, high) in enumerate(_price_ranges()):
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{index}'] = Count('pk', filter=condition)
+    totals = queryset.aggregate(**aggregates)
+
+    facets['price'] = [
+        {'min': low, 'max': high, 'count': totals[f'price_{index}']}
+        for index, (low, high) in enumerate(_price_ranges())
+    ]
+    facets['in_stock'] = totals['in_stock']
+    facets['total'] = totals['total']
+    return facets
+
+
+def cached_product_facets(supplier_ids, params, build):
+    """
+    Return the cached facets of a filter signature, building them with build() on a miss.
+
+    The signature is the visible suppliers, their catalog versions and the
+    filter parameters, so viewers with the same suppliers share entries.
+    invalidate_product_facets() bumps the version of a supplier whose products,
+    brands, categories or stock change. Stock reservations do not, so the
+    in-stock count may lag by up to PRODUCT_FACET_CACHE_TIMEOUT.
+    """
+    timeout = getattr(settings, 'PRODUCT_FACET_CACHE_TIMEOUT', 60)
+    if not timeout:
+        return build()
+
+    supplier_ids = sorted(supplier_ids)
+    signature = json.dumps([supplier_ids, get_versions(PRODUCT_FACETS, supplier_ids), sorted(params.items())])
+    key = f'{PRODUCT_FACETS}:{hashlib.sha1(signature.encode()).hexdigest()}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
+
+
+def invalidate_product_facets(organization_ids):
+    bump_version(PRODUCT_FACETS, organization_ids)
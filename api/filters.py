@@ -1,12 +1,58 @@
 # filters.py
 import django_filters
-from .models import Product
+from django.db.models import F
+from rest_framework.filters import OrderingFilter
+from .models import Category, Product, product_in_stock
 
 class ProductFilter(django_filters.FilterSet):
-    min_price = django_filters.NumberFilter(field_name='discount_price', lookup_expr='gte')
-    max_price = django_filters.NumberFilter(field_name='discount_price', lookup_expr='lte')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     digital = django_filters.BooleanFilter(field_name='digital')
+    brand = django_filters.NumberFilter(field_name='brand_id')
+    supplier = django_filters.NumberFilter(field_name='organization_id')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    # Products of the category and all of its subcategories
+    category = django_filters.ModelChoiceFilter(queryset=Category.objects.only('path'), method='filter_category')
 
     class Meta:
         model = Product
-        fields = ['min_price', 'max_price', 'digital']
+        fields = ['min_price', 'max_price', 'digital', 'brand', 'supplier', 'in_stock', 'category']
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(product_in_stock() if value else ~product_in_stock())
+
+    def filter_category(self, queryset, name, value):
+        return queryset.in_category(value)
+
+
+class CatalogOrderingFilter(OrderingFilter):
+    """
+    ?ordering= of product listings: name (default), price, -price, popular
+    (units sold), trending (units sold recently) or availability (unreserved
+    stock). The ranking keys are read from ProductRanking and every ordering
+    ends with the id, so CursorPagination can page through it by key.
+    """
+    orderings = {
+        'name': ('name', 'id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', 'id'),
+        'popular': ('-popularity', 'id'),
+        'trending': ('-velocity', 'id'),
+        'availability': ('-availability', 'id'),
+    }
+    ranking_fields = {
+        'popularity': 'ranking__units_sold',
+        'velocity': 'ranking__recent_units',
+        'availability': 'ranking__available',
+    }
+
+    def get_ordering(self, request, queryset, view):
+        return list(self.orderings.get(request.query_params.get(self.ordering_param), self.orderings['name']))
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        key = ordering[0].lstrip('-')
+        if key in self.ranking_fields:
+            # Annotated under a plain name, which the cursor reads back from each product
+            queryset = queryset.annotate(**{key: F(self.ranking_fields[key])})
+        return queryset.order_by(*ordering)
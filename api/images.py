@@ -0,0 +1,183 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from accounts.models import Organization
+from accounts.request_middleware import tenant_context
+from stocksync.log import get_logger
+
+log = get_logger(__name__)
+
+# Variant -> width in pixels. Every variant is written as WebP and as JPEG
+# (PNG for images with transparency), never wider than the original.
+IMAGE_VARIANTS = {'thumbnail': 160, 'medium': 640}
+
+_executor = None
+_queue = None
+
+
+def render_variants(data):
+    """
+    Resize the encoded image data to every variant. Returns a list of
+    (variant, width, mime type, extension, encoded data).
+
+    Pillow only, no database or storage access, so it can run in a worker
+    process.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if transparent else 'RGB')
+        fallback = ('image/png', 'png', 'PNG') if transparent else ('image/jpeg', 'jpg', 'JPEG')
+
+        rendered = []
+        for variant, width in IMAGE_VARIANTS.items():
+            width = min(width, image.width)
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for mime, extension, format in (('image/webp', 'webp', 'WEBP'), fallback):
+                buffer = io.BytesIO()
+                resized.save(buffer, format, quality=82, optimize=True)
+                rendered.append((variant, width, mime, extension, buffer.getvalue()))
+        return rendered
+
+
+def variant_name(name, variant, extension):
+    """Storage name of a variant: images/variants/red.png -> images/variants/red__thumbnail.webp"""
+    return f'{os.path.splitext(name)[0]}__{variant}.{extension}'
+
+
+def store_variants(model, pk, name, rendered):
+    """
+    Write rendered variants of the image name next to it and record them in
+    the image_variants of the row, unless its image changed meanwhile.
+    """
+    storage = model._meta.get_field('image').storage
+    srcset = {}
+    for variant, width, mime, extension, data in rendered:
+        path = variant_name(name, variant, extension)
+        # Deterministic names: replace, rather than let the storage pick a free name
+        if storage.exists(path):
+            storage.delete(path)
+        storage.save(path, ContentFile(data))
+        srcset.setdefault(mime, []).append([width, path])
+
+    variants = {'source': name, 'srcset': srcset}
+    model._default_manager.filter(pk=pk, image=name).update(image_variants=variants)
+    return variants
+
+
+def _read(model, name):
+    with model._meta.get_field('image').storage.open(name, 'rb') as file:
+        return file.read()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+    return _executor
+
+
+def _get_queue():
+    global _queue
+    if _queue is None:
+        _queue = ThreadPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+    return _queue
+
+
+def _generate(model, pk, name, organization_id):
+    """
+    Read the original, render it in the process pool and store the variants.
+    Runs on a thread of the image variant queue, outside of any request, in
+    the tenant context of the image's organization.
+    """
+    try:
+        with tenant_context(Organization(id=organization_id)):
+            rendered = _get_executor().submit(render_variants, _read(model, name)).result()
+            store_variants(model, pk, name, rendered)
+    except Exception:
+        log.exception('images.variants_failed', model=model._meta.label, pk=pk, image=name)
+    finally:
+        # The thread outlives the job; do not keep its connections open between uploads
+        connections.close_all()
+
+
+def _enqueue(model, pk, name, organization_id):
+    if not getattr(settings, 'IMAGE_VARIANT_WORKERS', 0):
+        store_variants(model, pk, name, render_variants(_read(model, name)))
+        return
+    _get_queue().submit(_generate, model, pk, name, organization_id)
+
+
+def schedule_image_variants(instance):
+    """
+    Generate the variants of the image of a Product or ProductImage once the
+    current transaction commits. With IMAGE_VARIANT_WORKERS, the commit only
+    queues the image: a thread of the image variant queue reads it and has
+    it rendered by the process pool, so the request that uploaded it neither
+    reads nor waits for it. With 0 they are rendered inline, on commit.
+    """
+    product = getattr(instance, 'product', instance)
+    # robust: a failing upload of variants must not surface as an error of the committed change
+    transaction.on_commit(
+        partial(_enqueue, type(instance), instance.pk, instance.image.name, product.organization_id), robust=True
+    )
+
+
+def needs_variants(instance):
+    return bool(instance.image) and instance.image_variants.get('source') != instance.image.name
+
+
+def backfill_image_variants(queryset, workers=None, batch_size=50, force=False):
+    """
+    Generate the missing variants of the images of queryset (all of them with
+    force), batch_size images at a time rendered by a pool of workers
+    processes. Images that cannot be read or decoded are logged and skipped.
+    Returns the number of images processed.
+    """
+    model = queryset.model
+    rows = queryset.exclude(image='').exclude(image__isnull=True).order_by('pk').values_list('pk', 'image', 'image_variants')
+    pending = [(pk, name) for pk, name, variants in rows.iterator() if force or (variants or {}).get('source') != name]
+
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers or settings.IMAGE_VARIANT_WORKERS or None) as pool:
+        for start in range(0, len(pending), batch_size):
+            futures = []
+            for pk, name in pending[start:start + batch_size]:
+                try:
+                    futures.append((pk, name, pool.submit(render_variants, _read(model, name))))
+                except OSError:
+                    log.warning('images.source_missing', model=model._meta.label, pk=pk, image=name)
+            for pk, name, future in futures:
+                try:
+                    store_variants(model, pk, name, future.result())
+                except Exception:
+                    log.exception('images.variants_failed', model=model._meta.label, pk=pk, image=name)
+                    continue
+                processed += 1
+    return processed
+
+
+def image_srcset(field_file, variants, request=None):
+    """
+    {mime type: srcset} of the variants of field_file, e.g.
+    {'image/webp': '.../red__thumbnail.webp 160w, .../red__medium.webp 640w'},
+    or {} until they are generated.
+    """
+    if not field_file or (variants or {}).get('source') != field_file.name:
+        return {}
+
+    def url(name):
+        url = field_file.storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return {
+        mime: ', '.join(f'{url(name)} {width}w' for width, name in entries)
+        for mime, entries in variants['srcset'].items()
+    }
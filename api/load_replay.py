@@ -0,0 +1,232 @@
+import json
+import random
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.signals import got_request_exception
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from rest_framework.test import APIClient
+
+from accounts.models import OrganizationRelationship
+from .benchmark import percentile
+from .models import Inventory, Order, OrderItem, Product, StockReservation
+from .sample_data import generate_dataset
+
+# Error text of lock conflicts: PostgreSQL/MySQL deadlocks and SQLite lock timeouts
+DEADLOCK_MARKERS = ('deadlock', 'is locked', 'lock wait timeout')
+
+# Exception of the last failed request of each thread. The test client's own
+# hook is a single receiver shared by all clients, so it mixes up threads.
+_request_exception = threading.local()
+
+
+def _store_request_exception(sender, **kwargs):
+    _request_exception.value = sys.exc_info()[1]
+
+
+class ClientTransport:
+    """Sends requests through the Django test client, in this process"""
+
+    def __init__(self, user):
+        got_request_exception.connect(_store_request_exception, dispatch_uid='load-replay-exception')
+        self.client = APIClient(SERVER_NAME='127.0.0.1', raise_request_exception=False)
+        self.client.force_authenticate(user)
+
+    def request(self, method, path, data=None):
+        """Returns (status, body); the body of a failed request is its exception"""
+        _request_exception.value = None
+        response = getattr(self.client, method)(path, data, format='json')
+        exception = _request_exception.value
+        if exception is not None:
+            return response.status_code, f'{type(exception).__name__}: {exception}'
+        return response.status_code, response.content.decode()
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """Sends requests to a running server, authenticated with a JWT access token"""
+
+    def __init__(self, user, base_url):
+        from rest_framework_simplejwt.settings import api_settings
+        from accounts.tokens import AccessToken
+        self.base_url = base_url.rstrip('/')
+        self.authorization = f'{api_settings.AUTH_HEADER_TYPES[0]} {AccessToken.for_user(user)}'
+
+    def request(self, method, path, data=None):
+        request = urllib.request.Request(
+            self.base_url + path, method=method.upper(),
+            data=json.dumps(data).encode() if data is not None else None,
+            headers={'Authorization': self.authorization, 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode(errors='replace')
+        except OSError as e:
+            return None, str(e)
+
+    def close(self):
+        pass
+
+
+def prepare(buyers=20, products=3, stock=50, seed=0, tag=None):
+    """
+    Create one supplier whose products products are shared by buyers buyers
+    with empty carts, stocking stock units of each at a single location.
+    The rows are committed, as the simulated buyers use their own connections.
+    """
+    dataset = generate_dataset(
+        suppliers=1, buyers=buyers, products=products, locations=1, orders=0, movements=0,
+        seed=seed, tag=tag or f'load{seed}'
+    )
+    supplier = dataset['supplier']
+    OrganizationRelationship.objects.bulk_create(
+        [
+            OrganizationRelationship(buyer_organization=buyer, supplier_organization=supplier, status='accepted')
+            for buyer in dataset['buyer_organizations']
+        ],
+        ignore_conflicts=True
+    )
+    Order.objects.filter(organization__in=dataset['buyer_organizations']).delete()
+    Product.objects.filter(organization=supplier).update(active=True)
+    Inventory.objects.filter(organization=supplier).update(quantity=stock, reserved_quantity=0)
+    dataset['products'] = list(Product.objects.filter(organization=supplier).order_by('pk').values_list('pk', flat=True))
+    dataset['buyer_users'] = [organization.users.get() for organization in dataset['buyer_organizations']]
+    dataset['stock'] = stock
+    return dataset
+
+
+class LoadResult:
+    """Thread-safe tally of the requests made by the simulated buyers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.deadlocks = 0
+        self.errors = []
+        self.checkouts = 0
+
+    def record(self, operation, status, body, duration):
+        with self.lock:
+            self.latencies[operation].append(duration)
+            self.statuses[operation][status] += 1
+            if status is None or status >= 500:
+                if any(marker in body.lower() for marker in DEADLOCK_MARKERS):
+                    self.deadlocks += 1
+                else:
+                    self.errors.append(f'{operation}: {status} {body[:200]}')
+            elif operation == 'checkout' and status == 200:
+                self.checkouts += 1
+
+
+def simulate_buyer(transport, products, iterations, max_amount, rng, result):
+    """
+    One buyer filling carts with the shared products and checking out, iterations times.
+    Conflicts (409: the stock is held or sold out) are part of the expected
+    traffic; the buyer keeps what it could reserve and carries on.
+    """
+    def call(operation, method, path, data=None):
+        start = perf_counter()
+        status, body = transport.request(method, path, data)
+        result.record(operation, status, body, perf_counter() - start)
+        return status, body
+
+    try:
+        for _ in range(iterations):
+            for product_id in rng.sample(products, rng.randint(1, len(products))):
+                status, _ = call('add to cart', 'patch', '/api/update-cart/', {
+                    'product_id': product_id, 'action': 'add', 'amount': rng.randint(1, max_amount)
+                })
+            status, body = call('cart', 'get', '/api/cart-data/')
+            if status != 200:
+                continue
+            cart = json.loads(body)
+            if not cart.get('items'):
+                continue
+            call('checkout', 'post', '/api/process-order/', {
+                'total': cart['total_amount'], 'user_info': {}, 'shipping_info': {}
+            })
+    finally:
+        transport.close()
+
+
+def check_stock(dataset):
+    """
+    Compare what was sold with the stock of every shared product. A product is
+    oversold when more units were checked out than it had; its stock is
+    inconsistent when what is left (plus held units) does not add up.
+    """
+    report = []
+    for product_id in dataset['products']:
+        inventory = Inventory.objects.filter(product_id=product_id, organization=dataset['supplier']).aggregate(
+            quantity=Sum('quantity'), reserved=Sum('reserved_quantity')
+        )
+        sold = OrderItem.objects.filter(
+            product_id=product_id, order__status='completed', order__organization__in=dataset['buyer_organizations']
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        held = StockReservation.objects.filter(
+            inventory__product_id=product_id, status='active'
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        report.append({
+            'product': product_id,
+            'stock': dataset['stock'],
+            'sold': sold,
+            'left': inventory['quantity'],
+            'reserved': inventory['reserved'],
+            'held': held,
+            'oversold': max(0, sold - dataset['stock']),
+            'consistent': inventory['quantity'] == dataset['stock'] - sold and inventory['reserved'] == held
+                          and inventory['reserved'] <= inventory['quantity'],
+        })
+    return report
+
+
+def run_load(dataset, workers=8, iterations=5, max_amount=3, seed=0, base_url=None):
+    """Run one simulated buyer per buyer user of dataset on a pool of workers threads"""
+    result = LoadResult()
+    rng = random.Random(seed)
+
+    def buyer(user, buyer_seed):
+        if base_url:
+            transport = HttpTransport(user, base_url)
+        else:
+            close_old_connections()
+            transport = ClientTransport(user)
+        simulate_buyer(transport, dataset['products'], iterations, max_amount, random.Random(buyer_seed), result)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(buyer, user, rng.random()) for user in dataset['buyer_users']]
+        for future in futures:
+            future.result()
+    elapsed = perf_counter() - start
+
+    requests = sum(len(latencies) for latencies in result.latencies.values())
+    return {
+        'elapsed': elapsed,
+        'requests': requests,
+        'throughput': requests / elapsed if elapsed else 0.0,
+        'checkouts': result.checkouts,
+        'checkouts_per_second': result.checkouts / elapsed if elapsed else 0.0,
+        'deadlocks': result.deadlocks,
+        'errors': result.errors,
+        'operations': {
+            operation: {
+                'requests': len(latencies),
+                'statuses': {str(status): count for status, count in sorted(result.statuses[operation].items(), key=str)},
+                **{f'p{percent}_ms': percentile(latencies, percent) * 1000 for percent in (50, 95, 99)},
+            }
+            for operation, latencies in result.latencies.items()
+        },
+        'stock': check_stock(dataset),
+    }
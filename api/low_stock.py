@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .deferred import CommitQueue
+from .models import Inventory, Notification
+
+
+def find_low_stock(organization_id, inventory_ids=None):
+    """
+    Inventory rows of an organization at or below their minimum stock level.
+
+    Runs as a single query; passing inventory_ids narrows the check to the rows
+    that were just changed.
+    """
+    queryset = Inventory.objects.low_stock().filter(organization_id=organization_id)
+    if inventory_ids:
+        queryset = queryset.filter(pk__in=inventory_ids)
+    return queryset.select_related('product', 'location').order_by('pk')
+
+
+def notify_low_stock(organization_id, inventory_ids=None):
+    """Create low stock notifications for every breach in an organization"""
+    breaches = list(find_low_stock(organization_id, inventory_ids))
+    if not breaches:
+        return []
+    return Notification.create_low_stock_notifications(breaches)
+
+
+def run_pending_checks(checks):
+    """
+    Run the low stock checks queued by schedule_low_stock_check: one breach
+    query and one batch of notifications for all the organizations queued.
+    """
+    if not checks:
+        return []
+    # An empty set means the whole organization was queued for a check
+    queued = Q(*[
+        Q(organization_id=organization_id, pk__in=inventory_ids) if inventory_ids else Q(organization_id=organization_id)
+        for organization_id, inventory_ids in checks.items()
+    ], _connector=Q.OR)
+    breaches = list(Inventory.objects.low_stock().filter(queued).select_related('product', 'location').order_by('pk'))
+    if not breaches:
+        return []
+    return Notification.create_low_stock_notifications(breaches)
+
+
+_checks = CommitQueue('low_stock_checks', lambda: defaultdict(set), run_pending_checks)
+
+
+def schedule_low_stock_check(organization_id, inventory_ids=None):
+    """
+    Queue a low stock check for an organization until the current transaction commits.
+
+    Checks queued within one transaction are merged, so a checkout touching many
+    inventory rows of many organizations results in a single breach query.
+    Outside of a transaction the check runs immediately.
+    """
+    if not organization_id:
+        return
+
+    def update(checks):
+        if inventory_ids is None:
+            checks[organization_id] = set()
+        elif organization_id not in checks or checks[organization_id]:
+            checks[organization_id].update(inventory_ids)
+
+    _checks.add(update)
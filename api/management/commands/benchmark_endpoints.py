@@ -0,0 +1,102 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmark import compare, endpoints, environment, measure, prepare, skipped_routes, PERCENTILES
+from api.sample_data import generate_dataset
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every endpoint of api.urls against a deterministic generated dataset and report "
+        "p50/p95/p99 latency and query counts. The dataset is rolled back afterwards. "
+        "Save results with --output and compare them between commits with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suppliers', type=int, default=5)
+        parser.add_argument('--buyers', type=int, default=20)
+        parser.add_argument('--products', type=int, default=200, help="Products per supplier.")
+        parser.add_argument('--orders', type=int, default=10, help="Placed orders per buyer.")
+        parser.add_argument('--movements', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--runs', type=int, default=20, help="Timed requests per endpoint.")
+        parser.add_argument('--only', help="Only run endpoints whose label contains this text.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare with.")
+        parser.add_argument('--threshold', type=float, default=10.0, help="p95 growth (percent) reported as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as stream:
+                baseline = json.load(stream)
+
+        try:
+            with transaction.atomic():
+                result = self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(result, stream, indent=2, sort_keys=True)
+            self.stdout.write(f"\nResults written to {options['output']}")
+        if baseline is not None:
+            self.compare(baseline, result, options)
+
+    def run(self, options):
+        dataset_options = {
+            name: options[name] for name in ('suppliers', 'buyers', 'products', 'orders', 'movements', 'seed')
+        }
+        dataset = prepare(generate_dataset(**dataset_options, tag=f"bench{options['seed']}"))
+
+        results = {}
+        header = ''.join(f"{f'p{percent}':>9}" for percent in PERCENTILES)
+        self.stdout.write(f"{'Endpoint':<28}{'status':>7}{'queries':>9}{header}  (ms)")
+        for label, method, path, user, data in endpoints(dataset):
+            if options['only'] and options['only'] not in label:
+                continue
+            results[label] = measure(dataset, label, method, path, user, data, options['runs'])
+            self.stdout.write(self.format_row(label, results[label]))
+
+        for route, reason in skipped_routes().items():
+            self.stdout.write(self.style.WARNING(f"Skipped {route}: {reason}"))
+
+        return {
+            'environment': environment(),
+            'dataset': {**dataset_options, **dataset['counts']},
+            'runs': options['runs'],
+            'results': results,
+        }
+
+    def format_row(self, label, result):
+        latencies = ''.join(f"{result[f'p{percent}_ms']:>9.2f}" for percent in PERCENTILES)
+        row = f"{label:<28}{result['status']:>7}{result['queries']:>9}{latencies}"
+        return self.style.ERROR(row) if result['status'] >= 400 else row
+
+    def compare(self, baseline, result, options):
+        if baseline.get('dataset') != result['dataset']:
+            self.stdout.write(self.style.WARNING("\nThe baseline was measured on a different dataset."))
+        before = baseline.get('environment', {}).get('commit')
+        after = result['environment']['commit']
+        self.stdout.write(f"\nCompared with {before or 'baseline'} (now {after or 'working tree'}):")
+
+        rows = compare(baseline, result, options['threshold'])
+        for row in rows:
+            line = (
+                f"  {row['label']:<28} p95 {row['p95_before']:>8.2f} -> {row['p95_after']:>8.2f} ms "
+                f"({row['p95_change']:+.1f}%)  queries {row['queries_before']} -> {row['queries_after']}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+
+        regressions = [row['label'] for row in rows if row['regressed']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
@@ -0,0 +1,94 @@
+import io
+import logging
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from api.models import Product
+from api.query_analysis import QueryCapture
+from api.sample_data import seed_catalog
+from api.serializers import BuyerSupplierProductSerializer
+from stocksync.log import JSONFormatter, RequestIDFilter, log_sampling
+
+LOGGER = 'api.serializers'
+# (label, logger level, DEBUG records sampled)
+MODES = [
+    ('DEBUG disabled', logging.INFO, True),
+    ('DEBUG sampled out', logging.DEBUG, False),
+    ('DEBUG enabled', logging.DEBUG, True),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-row cost of the product serializer's DEBUG logging when the level is "
+        "disabled, sampled out and enabled. The dataset is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500, help="Number of products to serialize.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per mode; the fastest is reported.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.report(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, options):
+        dataset = seed_catalog(products=options['products'], seed=0)
+        request = RequestFactory().get('/api/products/')
+        request.user = dataset['buyer_admin']
+        products = list(Product.objects.filter(organization=dataset['supplier']).with_listing_data())
+        # Warm up: builds the request's organization context and the serializer fields
+        BuyerSupplierProductSerializer(products, many=True, context={'request': request}).data
+
+        logger = logging.getLogger(LOGGER)
+        saved = logger.level, logger.handlers, logger.propagate
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        handler.addFilter(RequestIDFilter())
+        logger.handlers, logger.propagate = [handler], False
+
+        results = []
+        try:
+            for label, level, sampled in MODES:
+                logger.setLevel(level)
+                with log_sampling(sampled):
+                    results.append((label, *self.measure(products, request, stream, options['repeat'])))
+        finally:
+            logger.setLevel(saved[0])
+            logger.handlers, logger.propagate = saved[1], saved[2]
+
+        rows = len(products)
+        enabled = results[-1][1]
+        self.stdout.write(f"Serializing {rows} products with {BuyerSupplierProductSerializer.__name__}:")
+        for label, seconds, queries, logged in results:
+            per_row = seconds / rows * 1e6
+            saving = (enabled - seconds) / rows * 1e6
+            self.stdout.write(
+                f"  {label:<18} {per_row:8.1f} us/row  {queries:3} queries  {logged / rows:7.1f} log bytes/row"
+                f"  saves {saving:6.1f} us/row"
+            )
+
+    def measure(self, products, request, stream, repeat):
+        best = None
+        for _ in range(repeat):
+            stream.seek(0)
+            stream.truncate()
+            with QueryCapture() as capture:
+                start = perf_counter()
+                BuyerSupplierProductSerializer(products, many=True, context={'request': request}).data
+                elapsed = perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, len(capture.queries), len(stream.getvalue()))
+        return best
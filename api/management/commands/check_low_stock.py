@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.low_stock import notify_low_stock
+from api.models import Inventory
+
+
+class Command(BaseCommand):
+    help = "Sweep all inventory for low stock and notify admins and managers of each organization."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only check the organization with this ID.")
+
+    def handle(self, *args, **options):
+        organization_ids = (
+            Inventory.objects.low_stock()
+            .exclude(organization=None)
+            .values_list('organization_id', flat=True)
+            .distinct()
+        )
+        if options['organization']:
+            organization_ids = organization_ids.filter(organization_id=options['organization'])
+
+        total = 0
+        for organization_id in organization_ids:
+            notifications = notify_low_stock(organization_id)
+            total += len(notifications)
+            if notifications:
+                self.stdout.write(f"Organization {organization_id}: {len(notifications)} low stock notifications created.")
+
+        self.stdout.write(self.style.SUCCESS(f"Low stock sweep complete. {total} notifications created."))
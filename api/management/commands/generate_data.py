@@ -0,0 +1,46 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Organization
+from api.sample_data import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic high-volume dataset (organizations, relationships, products, "
+        "images, sizes, locations, inventory, orders and movements) with bulk_create. "
+        "The same options always produce the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suppliers', type=int, default=5, help="Supplier organizations.")
+        parser.add_argument('--buyers', type=int, default=20, help="Buyer organizations.")
+        parser.add_argument('--products', type=int, default=200, help="Products per supplier.")
+        parser.add_argument('--locations', type=int, default=3, help="Warehouses per supplier.")
+        parser.add_argument('--orders', type=int, default=10, help="Placed orders per buyer.")
+        parser.add_argument('--movements', type=int, default=10000, help="Inventory movements in total.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--tag', help="Suffix of names and codes (default gen<seed>, at most 11 characters).")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tag = options['tag'] or f"gen{options['seed']}"
+        if len(tag) > 11:
+            raise CommandError("--tag must be at most 11 characters (it is part of order numbers).")
+        if options['suppliers'] < 1 or options['buyers'] < 1:
+            raise CommandError("At least one supplier and one buyer are required.")
+        if Organization.objects.filter(name__endswith=f' {tag}').exists():
+            raise CommandError(f"A dataset tagged {tag!r} already exists; pick another --seed or --tag.")
+
+        start = perf_counter()
+        dataset = generate_dataset(
+            suppliers=options['suppliers'], buyers=options['buyers'], products=options['products'],
+            locations=options['locations'], orders=options['orders'], movements=options['movements'],
+            seed=options['seed'], tag=tag, batch_size=options['batch_size'],
+        )
+        elapsed = perf_counter() - start
+
+        for name, count in dataset['counts'].items():
+            self.stdout.write(f"  {name:<14} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Generated dataset {tag!r} in {elapsed:.1f}s"))
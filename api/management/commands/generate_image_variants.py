@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.images import backfill_image_variants
+from api.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the thumbnail and medium variants (WebP and JPEG/PNG) of product images "
+        "uploaded before the image pipeline, or whose variants are missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only the images of the products of the organization with this ID.")
+        parser.add_argument('--workers', type=int, help="Worker processes (default: IMAGE_VARIANT_WORKERS).")
+        parser.add_argument('--batch-size', type=int, default=50, help="Images read and rendered per batch.")
+        parser.add_argument('--force', action='store_true', help="Regenerate the variants of every image.")
+
+    def handle(self, *args, **options):
+        products, images = Product.objects.all(), ProductImage.objects.all()
+        if options['organization']:
+            products = products.filter(organization_id=options['organization'])
+            images = images.filter(product__organization_id=options['organization'])
+
+        total = 0
+        for queryset in (products, images):
+            processed = backfill_image_variants(
+                queryset, workers=options['workers'], batch_size=options['batch_size'], force=options['force']
+            )
+            self.stdout.write(f"{queryset.model._meta.verbose_name_plural}: {processed} images processed.")
+            total += processed
+        self.stdout.write(self.style.SUCCESS(f"Image variants generated for {total} images."))
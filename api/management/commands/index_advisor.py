@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from api.query_analysis import QueryCapture, analyze
+from api.sample_data import seed_catalog
+
+# (label, path, user) replayed against the seeded dataset
+ENDPOINTS = [
+    ('supplier products', '/api/products/', 'supplier_admin'),
+    ('buyer products', '/api/products/', 'buyer_admin'),
+    ('product filter', '/api/products/filter/?name=Product', 'buyer_admin'),
+    ('product search', '/api/search/?q=Product', 'supplier_admin'),
+    ('supplier inventory', '/api/inventory/', 'supplier_admin'),
+    ('buyer inventory', '/api/inventory/', 'buyer_admin'),
+    ('inventory movements', '/api/inventory-movements/', 'supplier_admin'),
+    ('cart', '/api/cart-data/', 'buyer_admin'),
+    ('relationships', '/api/relationships/', 'buyer_admin'),
+    ('inventory valuation', '/api/reports/inventory-valuation/', 'supplier_admin'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the main API endpoints against a freshly seeded dataset, EXPLAIN their "
+        "queries and report full table scans, unindexed sorts and missing composite indexes. "
+        "The dataset is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300, help="Number of products to seed.")
+        parser.add_argument('--plans', action='store_true', help="Print the plan of every distinct query.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.report(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, options):
+        dataset = seed_catalog(products=options['products'], seed=0)
+        client = APIClient(SERVER_NAME='127.0.0.1')
+
+        queries, labels = [], []
+        self.stdout.write("Endpoint queries:")
+        for label, path, user in ENDPOINTS:
+            client.force_authenticate(dataset[user])
+            with QueryCapture() as capture:
+                response = client.get(path)
+            queries.extend(capture.queries)
+            labels.extend([label] * len(capture.queries))
+            self.stdout.write(f"  {label:<22} {path:<40} {response.status_code}  {len(capture.queries)} queries")
+
+        result = analyze(queries, labels)
+
+        if options['plans']:
+            self.stdout.write("\nPlans:")
+            for sql, plan in result['plans']:
+                self.stdout.write(f"\n  {sql}")
+                for line in plan:
+                    self.stdout.write(f"    {line}")
+
+        self.stdout.write("\nFull table scans:")
+        for table, count in sorted(result['scans'].items(), key=lambda item: -item[1]) or [('none', '')]:
+            self.stdout.write(f"  {table} {count}")
+        self.stdout.write("\nSorts without an index:")
+        for table, count in sorted(result['sorts'].items(), key=lambda item: -item[1]) or [('none', '')]:
+            self.stdout.write(f"  {table} {count}")
+
+        self.stdout.write("\nMissing composite indexes:")
+        if not result['recommendations']:
+            self.stdout.write(self.style.SUCCESS("  none"))
+        for recommendation in result['recommendations']:
+            self.stdout.write(self.style.WARNING(
+                f"  {recommendation['model']}: models.Index(fields={recommendation['fields']!r}) "
+                f"- {recommendation['queries']} {'query' if recommendation['queries'] == 1 else 'queries'} "
+                f"from {', '.join(sorted(recommendation['sources']))}"
+            ))
@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.load_replay import prepare, run_load
+from api.sample_data import delete_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Run many simulated buyers concurrently through update-cart, cart-data and "
+        "process-order on a few shared supplier products, then report throughput, latency "
+        "percentiles, deadlocks and oversold stock. Requests go through the Django test client, "
+        "or to a running server with --url (which must use the same database). "
+        "Fails when stock was oversold or does not add up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=20, help="Simulated buyers.")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent threads.")
+        parser.add_argument('--iterations', type=int, default=5, help="Checkouts attempted per buyer.")
+        parser.add_argument('--products', type=int, default=3, help="Shared products.")
+        parser.add_argument('--stock', type=int, default=50, help="Units of each shared product.")
+        parser.add_argument('--max-amount', type=int, default=3, help="Most units added to a cart at once.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--output', help="Write the report as JSON to this file.")
+        parser.add_argument('--keep', action='store_true', help="Keep the generated buyers and orders.")
+
+    def handle(self, *args, **options):
+        dataset = prepare(
+            buyers=options['buyers'], products=options['products'], stock=options['stock'], seed=options['seed']
+        )
+        try:
+            report = run_load(
+                dataset, workers=options['workers'], iterations=options['iterations'],
+                max_amount=options['max_amount'], seed=options['seed'], base_url=options['url']
+            )
+        finally:
+            if not options['keep']:
+                delete_dataset(dataset)
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(report, stream, indent=2)
+
+        oversold = sum(product['oversold'] for product in report['stock'])
+        inconsistent = [str(product['product']) for product in report['stock'] if not product['consistent']]
+        if oversold or inconsistent:
+            raise CommandError(f"{oversold} units oversold; inconsistent stock for products {', '.join(inconsistent) or 'none'}")
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['requests']} requests in {report['elapsed']:.2f}s "
+            f"({report['throughput']:.1f} req/s), {report['checkouts']} checkouts "
+            f"({report['checkouts_per_second']:.1f}/s)"
+        )
+        self.stdout.write(f"\n{'Operation':<14}{'requests':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)  statuses")
+        for operation, stats in report['operations'].items():
+            statuses = ', '.join(f'{status}: {count}' for status, count in stats['statuses'].items())
+            self.stdout.write(
+                f"{operation:<14}{stats['requests']:>9}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}        {statuses}"
+            )
+
+        self.stdout.write(f"\n{'Product':<10}{'stock':>7}{'sold':>7}{'left':>7}{'held':>7}{'oversold':>10}")
+        for product in report['stock']:
+            row = f"{product['product']:<10}{product['stock']:>7}{product['sold']:>7}{product['left']:>7}{product['held']:>7}{product['oversold']:>10}"
+            self.stdout.write(row if product['consistent'] else self.style.ERROR(f"{row}  inconsistent"))
+
+        style = self.style.ERROR if report['deadlocks'] else self.style.SUCCESS
+        self.stdout.write(style(f"\nDeadlocks / lock timeouts: {report['deadlocks']}"))
+        for error in report['errors'][:10]:
+            self.stdout.write(self.style.ERROR(f"  {error}"))
+        if len(report['errors']) > 10:
+            self.stdout.write(self.style.ERROR(f"  ... {len(report['errors']) - 10} more errors"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily sales rollups behind the analytics endpoints from the order lines. "
+        "Run after bulk order imports, deleted orders or edited completion dates, which the "
+        "incremental updates do not follow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only rebuild the sales of the supplier organization with this ID.")
+        parser.add_argument('--since', help="Only rebuild the days from this date (YYYY-MM-DD) on.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rollup rows inserted per batch.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_date(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError("--since must be a date formatted YYYY-MM-DD.")
+        supplier_ids = [options['organization']] if options['organization'] else None
+        written = rebuild_sales_rollups(supplier_ids, since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily sales rollups."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.credit import refresh_outstanding_balances
+from api.models import Buyer
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the outstanding balance of buyers from their unpaid orders. "
+        "Run after order payment statuses or totals were changed by bulk updates, which skip the signals that maintain it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only refresh the buyers of the organization with this ID.")
+
+    def handle(self, *args, **options):
+        buyer_ids = None
+        if options['organization']:
+            buyer_ids = Buyer.objects.filter(organization_id=options['organization']).values('pk')
+        refreshed = refresh_outstanding_balances(buyer_ids)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the outstanding balance of {refreshed} buyers."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+from api.rankings import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the popularity, recent velocity and availability of products. "
+        "Run daily so that velocity follows sales falling out of PRODUCT_VELOCITY_WINDOW."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only refresh the products of the organization with this ID.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Products refreshed per batch.")
+
+    def handle(self, *args, **options):
+        product_ids = None
+        if options['organization']:
+            product_ids = Product.objects.filter(organization_id=options['organization']).values('pk')
+        refreshed = refresh_rankings(product_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the rankings of {refreshed} products."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.supplier_metrics import refresh_supplier_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the order counts, fill rate, lead time and cancellation rate of supplier organizations "
+        "served by the supplier scorecard endpoint. Run periodically, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help="Only refresh the supplier organization with this ID.")
+
+    def handle(self, *args, **options):
+        supplier_ids = [options['organization']] if options['organization'] else None
+        refreshed = refresh_supplier_metrics(supplier_ids)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the performance metrics of {refreshed} suppliers."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog_import import run_pending_imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the pending catalog imports, oldest first. Run it from cron or a process "
+        "supervisor; several workers can run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Import at most this many files.")
+        parser.add_argument('--chunk-size', type=int, help="Rows written per transaction (default: CATALOG_IMPORT_CHUNK_SIZE).")
+
+    def handle(self, *args, **options):
+        imports = run_pending_imports(limit=options['limit'], chunk_size=options['chunk_size'])
+        for catalog_import in imports:
+            self.stdout.write(
+                f"Import {catalog_import.pk} {catalog_import.status}: {catalog_import.processed_rows} rows, "
+                f"{catalog_import.created_products} created, {catalog_import.updated_products} updated, "
+                f"{catalog_import.failed_rows} failed."
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(imports)} catalog imports processed."))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-19 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_order_date_completed_alter_order_payment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['organization', 'notification_type', 'related_object_id', 'read_status'], name='api_notific_organiz_24bd2e_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-19 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organizationrelationship_alter_user_options_and_more'),
+        ('api', '0008_notification_low_stock_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, help_text='Units held by active stock reservations'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('active', 'Active'), ('converted', 'Converted to Sale'), ('released', 'Released'), ('expired', 'Expired')], default='active', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.inventory')),
+                ('order_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.orderitem')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='accounts.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='api_stockre_status_fd423a_idx'), models.Index(fields=['order_item', 'status'], name='api_stockre_order_i_9879a4_idx'), models.Index(fields=['inventory', 'status'], name='api_stockre_invento_a5698d_idx')],
+            },
+        ),
+    ]
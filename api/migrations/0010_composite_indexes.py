@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-19 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['organization', 'product'], name='api_invento_organiz_5e99dc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['organization', '-timestamp'], name='api_invento_organiz_4edfde_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'status'], name='api_order_custome_04de71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product', 'order', 'quantity'], name='api_orderit_product_085a63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['organization', 'active', 'name'], name='api_product_organiz_81c748_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['organization', 'name'], name='api_product_organiz_616600_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-19 10:45
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    Category = apps.get_model('api', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path(pk):
+        if pk not in paths:
+            # Stop at a parent cycle, which the old code did not prevent beyond self-parenting
+            paths[pk] = ''
+            parent_id = parents[pk]
+            paths[pk] = (path(parent_id) if parent_id in parents else '') + f'{pk}/'
+        return paths[pk]
+
+    categories = list(Category.objects.only('pk'))
+    for category in categories:
+        category.path = path(category.pk)
+    Category.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
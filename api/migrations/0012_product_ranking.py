@@ -0,0 +1,58 @@
+# Generated by Django 4.2.6 on 2026-10-19 11:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_rankings(apps, schema_editor):
+    # Every listed product needs a row to sort by; run refresh_product_rankings to fill them in
+    Product = apps.get_model('api', 'Product')
+    ProductRanking = apps.get_model('api', 'ProductRanking')
+    ProductRanking.objects.bulk_create(
+        (ProductRanking(product_id=pk, organization_id=organization_id)
+         for pk, organization_id in Product.objects.values_list('pk', 'organization_id').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_organization_name_lower_idx'),
+        ('api', '0011_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='api.product')),
+                ('units_sold', models.PositiveIntegerField(default=0)),
+                ('recent_units', models.PositiveIntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='api_product_price_c2511f_idx'),
+        ),
+        migrations.AddField(
+            model_name='productranking',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_rankings', to='accounts.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['-units_sold', 'product'], name='ranking_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['-recent_units', 'product'], name='ranking_velocity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['-available', 'product'], name='ranking_availability_idx'),
+        ),
+        migrations.RunPython(create_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.6 on 2026-10-19 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_organization_name_lower_idx'),
+        ('api', '0014_catalog_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('buyer_organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_rollups', to='accounts.organization')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='api.product')),
+                ('supplier_organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='accounts.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier_organization', 'day'], name='sales_rollup_supplier_idx'), models.Index(fields=['buyer_organization', 'day'], name='sales_rollup_buyer_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='salesdailyrollup',
+            constraint=models.UniqueConstraint(fields=('buyer_organization', 'product', 'day'), name='sales_rollup_line_unique'),
+        ),
+    ]
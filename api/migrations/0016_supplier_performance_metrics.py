@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-19 11:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_organization_name_lower_idx'),
+        ('api', '0015_sales_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierPerformanceMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_orders', models.PositiveIntegerField(default=0)),
+                ('open_orders', models.PositiveIntegerField(default=0)),
+                ('completed_orders', models.PositiveIntegerField(default=0)),
+                ('canceled_orders', models.PositiveIntegerField(default=0)),
+                ('units_ordered', models.PositiveIntegerField(default=0)),
+                ('units_fulfilled', models.PositiveIntegerField(default=0)),
+                ('fill_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('cancellation_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('average_lead_time', models.DurationField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='performance_metrics', to='accounts.organization')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.6 on 2026-10-19 11:58
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def compute_balances(apps, schema_editor):
+    # Same as api.credit.refresh_outstanding_balances, on the historical models
+    Buyer = apps.get_model('api', 'Buyer')
+    Order = apps.get_model('api', 'Order')
+    owed = (
+        Order.objects.filter(customer=models.OuterRef('pk'), payment_status__in=['unpaid', 'partially_paid'])
+        .exclude(status__in=['pending', 'canceled'])
+        .values('customer').annotate(total=models.Sum('total_amount')).values('total')
+    )
+    Buyer.objects.update(outstanding_balance=Coalesce(
+        models.Subquery(owed), models.Value(Decimal('0.00')), output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_supplier_performance_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buyer',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(compute_balances, migrations.RunPython.noop),
+    ]
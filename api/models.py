@@ -2,8 +2,10 @@ from django.db import models
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db.models import Sum, Q, Prefetch
+from django.db.models import Exists, Sum, Q, F, Prefetch, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 import uuid
+from collections import defaultdict
 from accounts.models import User, Organization
 from decimal import Decimal
 import random, string
@@ -76,16 +78,18 @@ class Supplier(models.Model):
         super().save(*args, **kwargs)
 
     def get_order_history(self):
-        """Get purchase order history from this supplier"""
-        pass
+        """Get the placed orders that include products of this supplier"""
+        return Order.objects.exclude(status='pending').filter(
+            Exists(OrderItem.objects.filter(order=OuterRef('pk'), product__organization_id=self.organization_id))
+        ).order_by('-order_date')
 
     def get_performance_metrics(self):
-        """Calculate supplier performance metrics"""
-        return {
-            'total_orders': 0,
-            'on_time_delivery_rate': 0,
-            'quality_rating': 0,
-        }
+        """
+        Supplier performance metrics, as last computed by
+        api.supplier_metrics.refresh_supplier_metrics (None until then)
+        """
+        metrics = SupplierPerformanceMetrics.objects.filter(organization_id=self.organization_id).first()
+        return metrics.as_dict() if metrics else None
 
 
 class Buyer(models.Model):
@@ -109,6 +113,8 @@ class Buyer(models.Model):
     address = models.TextField(blank=True, null=True)
     payment_terms = models.CharField(max_length=20, choices=PAYMENT_TERMS_CHOICES, default='prepaid')
     credit_limit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Total of the placed, unpaid orders; kept up to date by api.credit
+    outstanding_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     notes = models.TextField(blank=True, null=True)
     active_status = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -149,16 +155,12 @@ class Buyer(models.Model):
         return self.orders.all()
 
     def get_current_credit_usage(self):
-        """Calculate current credit usage"""
-        unpaid_orders = self.orders.filter(
-            payment_status__in=['unpaid', 'partially_paid']
-        )
-        return sum(order.total_amount for order in unpaid_orders)
+        """Current credit usage: the maintained total of the placed, unpaid orders"""
+        return self.outstanding_balance
 
     def has_available_credit(self, amount):
         """Check if buyer has available credit for an order"""
-        current_usage = self.get_current_credit_usage()
-        return (current_usage + amount) <= self.credit_limit
+        return (self.outstanding_balance + amount) <= self.credit_limit
 
 
 class Driver(models.Model):
@@ -190,14 +192,40 @@ class Driver(models.Model):
         pass
 
 
+def subtree_lookups(path, field='path'):
+    """
+    Lookups matching the category with materialized path path and all of its
+    descendants. Written as a range on the indexed path column (every path
+    ends with '/', and '0' is the character after '/') plus the exact prefix
+    test on the rows in that range.
+    """
+    return {f'{field}__gte': path, f'{field}__lt': path[:-1] + '0', f'{field}__startswith': path}
+
+
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category):
+        """The category and all of its descendants"""
+        return self.filter(**subtree_lookups(category.path))
+
+    def rebase(self, old_path, new_path):
+        """Move the subtree at old_path to new_path with one UPDATE"""
+        return self.filter(**subtree_lookups(old_path)).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField())
+        )
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='subcategories')
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='categories')
+    # Materialized path: the ids from the root down to this category, each followed by '/'
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Categories'
         indexes = [
@@ -209,6 +237,85 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    @property
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.split('/')[:-2]]
+
+    def build_path(self, parent_path=''):
+        return f'{parent_path}{self.pk}/'
+
+    def save(self, *args, **kwargs):
+        """
+        Keep path in step with parent. A new category is given its path once
+        it has an id; a moved one takes its whole subtree along.
+        """
+        if self.pk is None:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self._update_path()
+            return
+
+        if self.path and self.parent_id == getattr(self, '_loaded_parent_id', self.parent_id):
+            super().save(*args, **kwargs)
+            return
+
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or 'parent' in update_fields:
+                self._update_path()
+
+    def _update_path(self):
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            if self.path and parent_path.startswith(self.path):
+                raise ValueError("A category cannot be moved under itself or one of its subcategories.")
+        old_path, self.path = self.path, self.build_path(parent_path)
+        if old_path and old_path != self.path:
+            Category.objects.rebase(old_path, self.path)
+        else:
+            Category.objects.filter(pk=self.pk).update(path=self.path)
+        self._loaded_parent_id = self.parent_id
+
+
+def product_in_stock():
+    """Condition on Product: some of its stock at its own organization is not reserved"""
+    return Exists(Inventory.objects.filter(
+        product=OuterRef('pk'), organization=OuterRef('organization'), quantity__gt=F('reserved_quantity')
+    ))
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_listing_data(self):
+        """
+        Load everything the product serializers read, in a fixed number of queries.
+
+        Category and brand are joined, images and sizes prefetched, and the
+        delivered order quantity (completed_quantity) and the unreserved stock
+        held by the product's own organization (stock_available) annotated.
+        """
+        completed = OrderItem.objects.filter(
+            product=OuterRef('pk'), order__status='delivered'
+        ).values('product').annotate(total=Sum('quantity')).values('total')
+        stock = Inventory.objects.filter(
+            product=OuterRef('pk'), organization=OuterRef('organization')
+        ).values('product').annotate(total=Sum(F('quantity') - F('reserved_quantity'))).values('total')
+        return self.select_related('category', 'brand').prefetch_related('images', 'sizes__size').annotate(
+            completed_quantity=Coalesce(Subquery(completed), 0),
+            stock_available=Subquery(stock),
+        )
+
+    def in_category(self, category):
+        """Products of the category or any of its subcategories, in one join on the category path"""
+        return self.filter(**subtree_lookups(category.path, field='category__path'))
+
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -219,6 +326,8 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Cost price per unit")
     image = models.ImageField(upload_to='products/', null=True, blank=True)
+    # Generated by api.images: {'source': image name, 'srcset': {mime type: [[width, name], ...]}}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     barcode = models.CharField(max_length=100, blank=True, null=True)
     digital = models.BooleanField(default=False, null=True, blank=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='products')
@@ -226,6 +335,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['sku']),
@@ -233,6 +344,11 @@ class Product(models.Model):
             models.Index(fields=['category']),
             models.Index(fields=['organization']),
             models.Index(fields=['active']),
+            # Catalog listings: organization filter (optionally active) ordered by name
+            models.Index(fields=['organization', 'active', 'name']),
+            models.Index(fields=['organization', 'name']),
+            # ?ordering=price / -price
+            models.Index(fields=['price', 'id']),
         ]
 
     def __str__(self):
@@ -279,6 +395,7 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     color = models.CharField(max_length=200)
     image = models.ImageField(upload_to='images/variants/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     default = models.BooleanField(default=False)
 
     def __str__(self):
@@ -305,10 +422,21 @@ class Location(models.Model):
         return self.name
 
 
+class InventoryQuerySet(models.QuerySet):
+    def low_stock(self):
+        """Inventory rows at or below their minimum stock level"""
+        return self.filter(quantity__lte=F('min_stock_level'))
+
+    def with_available(self):
+        """Annotate the quantity not held by active stock reservations"""
+        return self.annotate(available=F('quantity') - F('reserved_quantity'))
+
+
 class Inventory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_items')
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='inventory_items')
     quantity = models.PositiveIntegerField(default=0)
+    reserved_quantity = models.PositiveIntegerField(default=0, help_text="Units held by active stock reservations")
     min_stock_level = models.IntegerField(default=5, help_text="Minimum stock level before alert is triggered")
     max_stock_level = models.IntegerField(default=100, help_text="Maximum stock level")
     last_stocked = models.DateTimeField(auto_now=True)
@@ -317,6 +445,8 @@ class Inventory(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='inventory', null=True, blank=True)
 
+    objects = InventoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Inventory Items'
         unique_together = ['product', 'location']
@@ -325,6 +455,7 @@ class Inventory(models.Model):
             models.Index(fields=['location']),
             models.Index(fields=['organization']),
             models.Index(fields=['quantity']),
+            models.Index(fields=['organization', 'product']),
         ]
 
     def __str__(self):
@@ -335,6 +466,11 @@ class Inventory(models.Model):
         """Check if inventory is below minimum stock level"""
         return self.quantity <= self.min_stock_level
 
+    @property
+    def available_quantity(self):
+        """Quantity on hand that is not held by active stock reservations"""
+        return self.quantity - self.reserved_quantity
+
     @property
     def is_overstock(self):
         """Check if inventory exceeds maximum stock level"""
@@ -345,31 +481,75 @@ class Inventory(models.Model):
         """Calculate total value of inventory"""
         return Decimal(self.quantity) * self.product.cost
 
-    def add_stock(self, amount, note=None):
-        """Add stock to inventory"""
-        self.quantity += amount
-        self.save()
+    def add_stock(self, amount, note=None, user=None, reference=None, movement_type='addition'):
+        """
+        Add stock to inventory.
+
+        Runs a single UPDATE ... SET quantity = quantity + amount instead of a
+        read-modify-save, so concurrent writers cannot lose each other's updates.
+        Returns the number of rows affected.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            updated = Inventory.objects.filter(pk=self.pk).update(
+                quantity=F('quantity') + amount,
+                last_stocked=now,
+                updated_at=now
+            )
+            if updated:
+                self._record_stock_change(amount, movement_type, note or f"Added {amount} units", user, reference)
+        return updated
+
+    def remove_stock(self, amount, note=None, user=None, reference=None, movement_type='removal'):
+        """
+        Remove stock from inventory if enough is available.
+
+        Availability is checked by the database in the same statement
+        (UPDATE ... SET quantity = quantity - amount WHERE quantity - reserved_quantity >= amount),
+        not from a possibly stale read, so units held for other carts are never taken.
+        Returns the number of rows affected, 0 when there is not enough stock.
+        """
+        now = timezone.now()
+        changes = {'quantity': F('quantity') - amount, 'updated_at': now}
+        if movement_type == 'sale':
+            changes['last_sold'] = now
+        with transaction.atomic():
+            updated = Inventory.objects.filter(pk=self.pk, quantity__gte=F('reserved_quantity') + amount).update(**changes)
+            if updated:
+                self._record_stock_change(-amount, movement_type, note or f"Removed {amount} units", user, reference)
+        return updated
+
+    def sell_reserved_stock(self, amount, note=None, user=None, reference=None):
+        """
+        Turn reserved units into a sale, decrementing quantity and reserved_quantity together.
+        Returns the number of rows affected.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            updated = Inventory.objects.filter(pk=self.pk, quantity__gte=amount, reserved_quantity__gte=amount).update(
+                quantity=F('quantity') - amount,
+                reserved_quantity=F('reserved_quantity') - amount,
+                last_sold=now,
+                updated_at=now
+            )
+            if updated:
+                self._record_stock_change(-amount, 'sale', note or f"Sold {amount} reserved units", user, reference)
+        return updated
+
+    def _record_stock_change(self, quantity_change, movement_type, note, user, reference):
+        from .signals import inventory_changed
+
+        self.refresh_from_db(fields=['quantity', 'reserved_quantity', 'last_stocked', 'last_sold', 'updated_at'])
         InventoryMovement.objects.create(
             inventory=self,
-            quantity_change=amount,
-            movement_type='addition',
-            note=note or f"Added {amount} units"
+            quantity_change=quantity_change,
+            movement_type=movement_type,
+            note=note,
+            reference=reference,
+            user=user,
+            organization_id=self.organization_id
         )
-        return True
-
-    def remove_stock(self, amount, note=None):
-        """Remove stock from inventory"""
-        if self.quantity >= amount:
-            self.quantity -= amount
-            self.save()
-            InventoryMovement.objects.create(
-                inventory=self,
-                quantity_change=-amount,
-                movement_type='removal',
-                note=note or f"Removed {amount} units"
-            )
-            return True
-        return False
+        inventory_changed.send(sender=Inventory, organization_id=self.organization_id, inventory_ids=[self.pk])
 
 
 class InventoryMovement(models.Model):
@@ -395,6 +575,8 @@ class InventoryMovement(models.Model):
             models.Index(fields=['movement_type']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['organization']),
+            # Movement history: newest first per organization
+            models.Index(fields=['organization', '-timestamp']),
         ]
 
     def __str__(self):
@@ -448,6 +630,8 @@ class Order(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['organization']),
             models.Index(fields=['payment_status']),
+            # Cart lookups: a buyer's order in a given status
+            models.Index(fields=['customer', 'status']),
         ]
 
     def __str__(self):
@@ -495,12 +679,14 @@ class Order(models.Model):
                     if add_to_inventory:
                         inventory.add_stock(
                             item.quantity,
-                            f"Order {self.order_number} canceled/returned"
+                            f"Order {self.order_number} canceled/returned",
+                            reference=self.order_number
                         )
                     else:
                         inventory.remove_stock(
                             item.quantity,
-                            f"Order {self.order_number}"
+                            f"Order {self.order_number}",
+                            reference=self.order_number
                         )
             except Exception as e:
                 print(f"Error updating inventory for order {self.order_number}: {e}")
@@ -529,6 +715,8 @@ class OrderItem(models.Model):
             models.Index(fields=['order']),
             models.Index(fields=['product']),
             models.Index(fields=['organization']),
+            # Covers per-product sales totals joined on the order status
+            models.Index(fields=['product', 'order', 'quantity']),
         ]
 
     def __str__(self):
@@ -552,6 +740,178 @@ class OrderItem(models.Model):
         return self.subtotal
 
 
+class StockReservation(models.Model):
+    """
+    A time-limited hold on supplier inventory for an item in a buyer's pending cart.
+
+    The held units are mirrored in Inventory.reserved_quantity so availability
+    checks never need to aggregate reservations.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('converted', 'Converted to Sale'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='reservations')
+    order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    expires_at = models.DateTimeField()
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='stock_reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['order_item', 'status']),
+            models.Index(fields=['inventory', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} units of inventory {self.inventory_id} for order item {self.order_item_id} ({self.status})"
+
+
+class ProductRanking(models.Model):
+    """
+    Precomputed sort keys of a product's catalog listings, refreshed by
+    api.rankings when its orders or stock change.
+
+    units_sold counts the units of placed (not canceled) orders, recent_units
+    those placed within PRODUCT_VELOCITY_WINDOW, and available the unreserved
+    stock held by the product's own organization.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='product_rankings')
+    units_sold = models.PositiveIntegerField(default=0)
+    recent_units = models.PositiveIntegerField(default=0)
+    available = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # One per ?ordering= option; the product breaks ties
+            models.Index(fields=['-units_sold', 'product'], name='ranking_popularity_idx'),
+            models.Index(fields=['-recent_units', 'product'], name='ranking_velocity_idx'),
+            models.Index(fields=['-available', 'product'], name='ranking_availability_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ranking of {self.product_id}"
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Units, revenue and cost of a product sold to one buyer organization on
+    one day, maintained by api.analytics as orders are placed or canceled.
+
+    The day is the order's completion date (its placement date when it has
+    none); cost is the product's cost when the order was rolled up.
+    """
+    day = models.DateField()
+    supplier_organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='sales_rollups')
+    buyer_organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='purchase_rollups')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # The product determines the supplier
+            models.UniqueConstraint(fields=['buyer_organization', 'product', 'day'], name='sales_rollup_line_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['supplier_organization', 'day'], name='sales_rollup_supplier_idx'),
+            models.Index(fields=['buyer_organization', 'day'], name='sales_rollup_buyer_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.units} x {self.product_id} to {self.buyer_organization_id} on {self.day}"
+
+
+class SupplierPerformanceMetrics(models.Model):
+    """
+    Order counts, fill rate, lead time and cancellation rate of a supplier
+    organization over its whole order history, recomputed by
+    api.supplier_metrics for the supplier scorecard. Rates are percentages,
+    None while the supplier has no orders to compute them from.
+    """
+    organization = models.OneToOneField(Organization, on_delete=models.CASCADE, related_name='performance_metrics')
+    total_orders = models.PositiveIntegerField(default=0)
+    open_orders = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    canceled_orders = models.PositiveIntegerField(default=0)
+    units_ordered = models.PositiveIntegerField(default=0)
+    units_fulfilled = models.PositiveIntegerField(default=0)
+    fill_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    cancellation_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    average_lead_time = models.DurationField(null=True, blank=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Performance of {self.organization_id} at {self.computed_at}"
+
+    def as_dict(self):
+        return {
+            'total_orders': self.total_orders,
+            'open_orders': self.open_orders,
+            'completed_orders': self.completed_orders,
+            'canceled_orders': self.canceled_orders,
+            'units_ordered': self.units_ordered,
+            'units_fulfilled': self.units_fulfilled,
+            'fill_rate': self.fill_rate,
+            'cancellation_rate': self.cancellation_rate,
+            'average_lead_time': self.average_lead_time,
+            'computed_at': self.computed_at,
+        }
+
+
+class CatalogImport(models.Model):
+    """
+    A CSV or NDJSON file of products uploaded by an organization, imported
+    chunk by chunk by api.catalog_import in the run_catalog_imports worker.
+    The counters are updated after every chunk, so they report its progress.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='catalog_imports')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    file = models.FileField(upload_to='imports/')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_products = models.PositiveIntegerField(default=0)
+    updated_products = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    # The first CATALOG_IMPORT_MAX_ERRORS errors: [{'row': line number, 'sku': ..., 'errors': {...}}]
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['organization', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Catalog import {self.pk} ({self.status})"
+
+
 class ShippingAddress(models.Model):
     customer = models.ForeignKey(Buyer, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -590,6 +950,7 @@ class Notification(models.Model):
             models.Index(fields=['read_status']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['organization']),
+            models.Index(fields=['organization', 'notification_type', 'related_object_id', 'read_status']),
         ]
         ordering = ['timestamp']
 
@@ -606,30 +967,57 @@ class Notification(models.Model):
 
     @classmethod
     def create_low_stock_notification(cls, inventory, user=None):
-        if not user:
-            users = User.objects.filter(
-                organization=inventory.organization,
-                role__in=['admin', 'manager'],
-                is_active=True
-            )
+        return cls.create_low_stock_notifications([inventory], users=[user] if user else None)
+
+    @classmethod
+    def create_low_stock_notifications(cls, inventories, users=None):
+        """
+        Create low stock alerts for a batch of inventory items of one or more organizations.
+
+        Recipients default to each organization's active admins and managers. Items that
+        already have an unread low stock alert for a recipient are skipped, and all new
+        notifications are written with a single bulk_create, whatever the number of
+        organizations.
+        """
+        inventories = [inventory for inventory in inventories if inventory.organization_id]
+        if not inventories:
+            return []
+
+        organization_ids = {inventory.organization_id for inventory in inventories}
+        recipients = defaultdict(list)
+        if users is None:
+            for user in User.objects.filter(organization_id__in=organization_ids, role__in=['admin', 'manager'], is_active=True):
+                recipients[user.organization_id].append(user)
         else:
-            users = [user]
+            for organization_id in organization_ids:
+                recipients[organization_id] = users
+        if not any(recipients.values()):
+            return []
+
+        already_alerted = set(cls.objects.filter(
+            organization_id__in=organization_ids,
+            notification_type='low_stock',
+            related_object_type='inventory',
+            related_object_id__in=[inventory.id for inventory in inventories],
+            read_status=False,
+        ).values_list('user_id', 'related_object_id'))
 
         notifications = []
-        message = f"Low stock alert: {inventory.product.name} at {inventory.location.name} is below minimum level. Current: {inventory.quantity}, Minimum: {inventory.min_stock_level}"
-
-        for user in users:
-            notification = cls.objects.create(
-                user=user,
-                message=message,
-                notification_type='low_stock',
-                related_object_type='inventory',
-                related_object_id=inventory.id,
-                organization=inventory.organization
-            )
-            notifications.append(notification)
-
-        return notifications
+        for inventory in inventories:
+            message = f"Low stock alert: {inventory.product.name} at {inventory.location.name} is below minimum level. Current: {inventory.quantity}, Minimum: {inventory.min_stock_level}"
+            for user in recipients[inventory.organization_id]:
+                if (user.id, inventory.id) in already_alerted:
+                    continue
+                notifications.append(cls(
+                    user=user,
+                    message=message,
+                    notification_type='low_stock',
+                    related_object_type='inventory',
+                    related_object_id=inventory.id,
+                    organization_id=inventory.organization_id
+                ))
+
+        return cls.objects.bulk_create(notifications)
 
 
 class Communication(models.Model):
@@ -0,0 +1,38 @@
+from rest_framework.pagination import CursorPagination
+
+
+class NameCursorPagination(CursorPagination):
+    """
+    Keyset pagination on a unique name: every page is one indexed range scan
+    (name > last name seen), however deep the client pages.
+    """
+    ordering = 'name'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class CatalogCursorPagination(CursorPagination):
+    """
+    Keyset pagination of a product listing, by name unless the view's
+    CatalogOrderingFilter picks another ?ordering=. Sort keys are not unique,
+    so the id breaks ties and repeated keys at a page boundary are stepped
+    over with an offset.
+    """
+    ordering = ('name', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class OptionalCatalogCursorPagination(CatalogCursorPagination):
+    """
+    CatalogCursorPagination for listings that predate paging: a page is only
+    returned when the client asks for one (?cursor= or ?page_size=), else the
+    full list as before.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
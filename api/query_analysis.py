@@ -0,0 +1,173 @@
+import re
+from collections import defaultdict
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.apps import apps
+from django.db import connections
+
+# Plan lines that read a whole table (SQLite, PostgreSQL)
+SCAN_PATTERNS = [
+    re.compile(r'\bSCAN (?:TABLE )?(?P<table>\w+)(?: AS \w+)?$'),
+    re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+]
+# Plan lines where the database sorts rows itself instead of reading them in index order
+SORT_PATTERNS = [
+    re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)'),
+]
+FROM_TABLE = re.compile(r'\bFROM [`"](?P<table>\w+)[`"]')
+
+
+class QueryCapture:
+    """
+    Records every statement executed on the given database aliases.
+
+    Use as a context manager; queries holds one dict per statement with the
+    alias, sql, params and duration in seconds.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = list(aliases or connections)
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'duration': perf_counter() - start,
+            })
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+
+def explain(alias, sql, params):
+    """Return the plan lines of a SELECT statement"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+        rows = cursor.fetchall()
+    return [str(row[-1]) for row in rows]
+
+
+def _table_models():
+    return {model._meta.db_table: model for model in apps.get_models()}
+
+
+def _table_indexes(alias, table):
+    """Column lists of every index (including unique and primary key) on a table"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [
+        constraint['columns'] for constraint in constraints.values()
+        if constraint['index'] or constraint['unique'] or constraint['primary_key']
+    ]
+
+
+def _predicate_columns(sql, table):
+    """Equality/IN columns of a table in the WHERE clause and its ORDER BY columns"""
+    quoted = rf'[`"]{table}[`"]\.[`"](\w+)[`"]'
+    where, _, order_by = sql.partition(' ORDER BY ')
+    where = where.partition(' WHERE ')[2]
+    equality = []
+    for column in re.findall(quoted + r' (?:=|IN) ', where):
+        if column not in equality:
+            equality.append(column)
+    ordering = [column for column in re.findall(quoted, order_by) if column not in equality]
+    return equality, ordering
+
+
+def _is_covered(indexes, equality, ordering):
+    for columns in indexes:
+        if set(columns[:len(equality)]) == set(equality) and columns[len(equality):len(equality) + len(ordering)] == ordering:
+            return True
+    return False
+
+
+def analyze(queries, labels=None):
+    """
+    EXPLAIN the captured SELECT statements and summarize their plans.
+
+    Returns a dict with:
+    - scans: {table: number of statements reading the whole table}
+    - sorts: {table: number of statements sorting without an index}
+    - recommendations: composite indexes that would serve the scanned or
+      sorted statements and do not exist yet, most used first
+    - plans: (sql, plan lines) per distinct statement
+    labels, when given, names the source (e.g. the endpoint) of each query.
+    """
+    models = _table_models()
+    indexes = {}
+    scans, sorts = defaultdict(int), defaultdict(int)
+    recommendations = {}
+    plans = []
+    seen = set()
+
+    for position, query in enumerate(queries):
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+            continue
+        seen.add(sql)
+        plan = explain(query['alias'], sql, query['params'])
+        plans.append((sql, plan))
+
+        flagged = set()
+        for line in plan:
+            for pattern in SCAN_PATTERNS:
+                match = pattern.search(line)
+                if match and match.group('table') in models:
+                    scans[match.group('table')] += 1
+                    flagged.add(match.group('table'))
+            if any(pattern.search(line) for pattern in SORT_PATTERNS):
+                match = FROM_TABLE.search(sql)
+                if match and match.group('table') in models:
+                    sorts[match.group('table')] += 1
+                    flagged.add(match.group('table'))
+
+        for table in flagged:
+            if ' OR ' in sql.partition(' WHERE ')[2].partition(' ORDER BY ')[0]:
+                continue  # OR'ed predicates are not served by a single composite index
+            equality, ordering = _predicate_columns(sql, table)
+            columns = equality + ordering
+            if not columns or columns == ['id']:
+                continue
+            if table not in indexes:
+                indexes[table] = _table_indexes(query['alias'], table)
+            if _is_covered(indexes[table], equality, ordering):
+                continue
+
+            key = (table, tuple(columns))
+            if key not in recommendations:
+                model = models[table]
+                fields = {field.column: field.name for field in model._meta.concrete_fields}
+                recommendations[key] = {
+                    'model': model._meta.label,
+                    'table': table,
+                    'fields': [fields.get(column, column) for column in columns],
+                    'queries': 0,
+                    'sources': set(),
+                    'example': sql,
+                }
+            recommendations[key]['queries'] += 1
+            if labels:
+                recommendations[key]['sources'].add(labels[position])
+
+    return {
+        'scans': dict(scans),
+        'sorts': dict(sorts),
+        'recommendations': sorted(recommendations.values(), key=lambda item: -item['queries']),
+        'plans': plans,
+    }
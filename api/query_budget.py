@@ -0,0 +1,159 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from stocksync.log import get_logger
+from .query_analysis import QueryCapture
+
+log = get_logger(__name__)
+
+
+# Rows the current request worked on, when the view reports them itself
+_budget_rows = ContextVar('budget_rows', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def set_budget_rows(rows):
+    """
+    Report how many rows the current request processed, for views whose work
+    grows with something other than the items of their response (order lines,
+    a batch of transfers).
+    """
+    _budget_rows.set(rows)
+
+
+class QueryBudget:
+    """
+    Maximum number of queries a view may run for one request.
+
+    Declared on a view as a class attribute (or attribute of a function view):
+
+        query_budget = QueryBudget(4)
+
+    The limit is base + per_row * rows, where rows is the number of items in
+    the response (its page size) or the count reported through
+    set_budget_rows(). A view whose query count must not depend on
+    the data at all keeps per_row at 0. QueryBudget.exempt(reason) documents
+    a view that is deliberately not enforced.
+    """
+
+    def __init__(self, base, per_row=0, reason=None):
+        self.base = base
+        self.per_row = per_row
+        self.reason = reason
+
+    @classmethod
+    def exempt(cls, reason):
+        return cls(None, reason=reason)
+
+    @property
+    def is_exempt(self):
+        return self.base is None
+
+    def limit(self, rows=0):
+        if self.is_exempt:
+            return None
+        return self.base + self.per_row * rows
+
+    def __repr__(self):
+        if self.is_exempt:
+            return f'QueryBudget.exempt({self.reason!r})'
+        return f'QueryBudget({self.base}, per_row={self.per_row})'
+
+
+def get_query_budget(view_func):
+    """The QueryBudget declared by a view function or its view class, if any"""
+    view_class = getattr(view_func, 'view_class', None)
+    return getattr(view_class, 'query_budget', None) or getattr(view_func, 'query_budget', None)
+
+
+def response_rows(response):
+    """Number of items in a DRF list response (paginated or not), else 0"""
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        data = data['results']
+    return len(data) if isinstance(data, list) else 0
+
+
+class QueryBudgetMiddleware:
+    """
+    Reports requests whose view runs more queries than its QueryBudget allows.
+
+    Only installed when QUERY_BUDGETS_ENFORCED is set (test runs, or
+    explicitly through the environment), so production requests pay nothing
+    for it by default. Over-budget requests raise QueryBudgetExceeded when
+    QUERY_BUDGETS_RAISE is set (test runs) and are logged otherwise. Queries
+    on every database alias are counted. The count is returned in the
+    X-Query-Count header.
+
+    The middleware is async-capable, so async views are not adapted to sync
+    for it. Views wrapped by api.async_views run their queries on worker
+    threads, which this middleware does not see; their budgets are enforced
+    on the wrapped sync views instead.
+    """
+    header = 'X-Query-Count'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGETS_ENFORCED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.raise_exceeded = getattr(settings, 'QUERY_BUDGETS_RAISE', False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._query_budget = None
+        token = _budget_rows.set(None)
+        try:
+            with QueryCapture() as capture:
+                response = self.get_response(request)
+            rows = _budget_rows.get()
+        finally:
+            _budget_rows.reset(token)
+        return self._check(request, response, capture, rows)
+
+    async def __acall__(self, request):
+        request._query_budget = None
+        token = _budget_rows.set(None)
+        try:
+            with QueryCapture() as capture:
+                response = await self.get_response(request)
+            rows = _budget_rows.get()
+        finally:
+            _budget_rows.reset(token)
+        return self._check(request, response, capture, rows)
+
+    def _check(self, request, response, capture, rows):
+        count = len(capture.queries)
+        response[self.header] = str(count)
+
+        budget = request._query_budget
+        if budget is None or budget.is_exempt or response.status_code >= 500:
+            # A failed request is already reported; its DEBUG error page runs queries of its own
+            return response
+        limit = budget.limit(response_rows(response) if rows is None else rows)
+        if count > limit:
+            if not self.raise_exceeded:
+                log.warning('query_budget.exceeded', method=request.method, path=request.path, queries=count, limit=limit, budget=repr(budget))
+                return response
+            statements = '\n'.join(query['sql'] for query in capture.queries)
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} ran {count} queries, over its budget of {limit} "
+                f"({budget!r}):\n{statements}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = get_query_budget(view_func)
+        if budget is not None and not iscoroutinefunction(view_func):
+            request._query_budget = budget
+        return None
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .deferred import CommitQueue
+from .models import Inventory, OrderItem, Product, ProductRanking
+
+# Order statuses whose units count as sold
+SOLD_STATUSES = ('completed', 'processing', 'shipped', 'delivered')
+
+
+def _available():
+    """Units of the ranked product in stock at its own organization, less the reserved ones"""
+    stock = (
+        Inventory.objects.filter(product=OuterRef('product'), organization=OuterRef('organization'))
+        .values('product')
+        .annotate(total=Sum(F('quantity') - F('reserved_quantity')))
+        .values('total')
+    )
+    return Coalesce(Subquery(stock), 0)
+
+
+def _sales():
+    """Units of the ranked product sold in total and within PRODUCT_VELOCITY_WINDOW"""
+    since = timezone.now() - getattr(settings, 'PRODUCT_VELOCITY_WINDOW', timedelta(days=30))
+    items = OrderItem.objects.filter(product=OuterRef('product'), order__status__in=SOLD_STATUSES).values('product')
+    recent = items.filter(
+        Q(order__date_completed__gte=since) | Q(order__date_completed__isnull=True, order__order_date__gte=since)
+    )
+    return {
+        'units_sold': Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+        'recent_units': Coalesce(Subquery(recent.annotate(total=Sum('quantity')).values('total')), 0),
+    }
+
+
+def refresh_rankings(product_ids=None, batch_size=1000):
+    """
+    Recompute the ProductRanking rows of the given products (all when None)
+    from their orders and stock, creating the missing ones, batch_size
+    products at a time. Every batch is one insert of the missing rows and one
+    UPDATE computing all the columns in the database. Returns the number of
+    products refreshed.
+    """
+    products = Product.objects.order_by('pk')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    refreshed, last_pk = 0, 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk).values_list('pk', 'organization_id')[:batch_size])
+        if not batch:
+            return refreshed
+        last_pk = batch[-1][0]
+
+        with transaction.atomic():
+            ProductRanking.objects.bulk_create(
+                [ProductRanking(product_id=pk, organization_id=organization_id) for pk, organization_id in batch],
+                ignore_conflicts=True,
+            )
+            ProductRanking.objects.filter(product_id__in=[pk for pk, _ in batch]).update(
+                available=_available(), updated_at=timezone.now(), **_sales()
+            )
+        refreshed += len(batch)
+        if len(batch) < batch_size:
+            return refreshed
+
+
+def run_pending_refreshes(pending):
+    """
+    Refresh the rankings queued by schedule_ranking_refresh: one UPDATE of
+    the availability of the products whose stock changed, one of the sales
+    of the products of the orders placed. The products are selected by
+    subqueries, not loaded first.
+    """
+    stock = []
+    if pending['products']:
+        stock.append(Q(product_id__in=pending['products']))
+    if pending['inventory']:
+        stock.append(Q(product_id__in=Inventory.objects.filter(pk__in=pending['inventory']).values('product_id')))
+    if stock:
+        ProductRanking.objects.filter(Q(*stock, _connector=Q.OR)).update(available=_available(), updated_at=timezone.now())
+    if pending['orders']:
+        ProductRanking.objects.filter(
+            product_id__in=OrderItem.objects.filter(order_id__in=pending['orders']).values('product_id')
+        ).update(updated_at=timezone.now(), **_sales())
+
+
+_refreshes = CommitQueue(
+    'ranking_refreshes', lambda: {'products': set(), 'inventory': set(), 'orders': set()}, run_pending_refreshes
+)
+
+
+def schedule_ranking_refresh(product_ids=(), inventory_ids=(), order_ids=()):
+    """
+    Queue a ranking refresh until the current transaction commits: of the
+    availability of the products of inventory_ids and of product_ids (whose
+    stock rows are gone), and of the sales of the products of order_ids.
+
+    Refreshes queued within one transaction are merged, so a checkout of many
+    items refreshes their products together. Outside of a transaction the
+    refresh runs immediately. Products without a ranking row yet are left to
+    refresh_rankings().
+    """
+    def update(pending):
+        pending['products'].update(product_ids)
+        pending['inventory'].update(inventory_ids)
+        pending['orders'].update(order_ids)
+
+    _refreshes.add(update)
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.context import BUYER_TYPES, SUPPLIER_TYPES
+from accounts.models import Organization, OrganizationRelationship
+from .signals import relationships_changed
+
+
+class RelationshipError(Exception):
+    pass
+
+
+def request_relationships(org_context, user, target_ids):
+    """
+    Create pending relationships between the user's organization and many
+    target organizations, the way OrganizationRelationshipSerializer.create
+    does for one: a buyer (or 'both') organization requests suppliers, a
+    supplier requests buyers.
+
+    Targets are loaded with one IN query and existing pairs are found with
+    another; the new rows are written with bulk_create. Returns the created
+    relationships and a list of {'target_organization_id', 'reason'} for the
+    skipped targets.
+    """
+    organization = org_context.organization
+    if org_context.is_buyer:
+        target_types, as_buyer = SUPPLIER_TYPES, True
+    elif org_context.is_supplier:
+        target_types, as_buyer = BUYER_TYPES, False
+    else:
+        raise RelationshipError("Your organization type does not allow initiating relationships.")
+
+    target_ids = list(dict.fromkeys(target_ids))
+    targets = Organization.objects.in_bulk(target_ids)
+    if as_buyer:
+        existing = set(OrganizationRelationship.objects.filter(
+            buyer_organization=organization, supplier_organization_id__in=targets
+        ).values_list('supplier_organization_id', flat=True))
+    else:
+        existing = set(OrganizationRelationship.objects.filter(
+            supplier_organization=organization, buyer_organization_id__in=targets
+        ).values_list('buyer_organization_id', flat=True))
+
+    relationships, skipped = [], []
+    for target_id in target_ids:
+        target = targets.get(target_id)
+        if target is None:
+            reason = "Organization does not exist."
+        elif target.pk == organization.pk:
+            reason = "An organization cannot have a relationship with itself."
+        elif target.organization_type not in target_types:
+            reason = f"A {target.get_organization_type_display()} cannot be a {'supplier' if as_buyer else 'buyer'}."
+        elif target_id in existing:
+            reason = "A relationship between these organizations already exists."
+        else:
+            relationships.append(OrganizationRelationship(
+                buyer_organization=organization if as_buyer else target,
+                supplier_organization=target if as_buyer else organization,
+                status='pending',
+                initiated_by=user,
+            ))
+            continue
+        skipped.append({'target_organization_id': target_id, 'reason': reason})
+
+    if relationships:
+        with transaction.atomic():
+            relationships = OrganizationRelationship.objects.bulk_create(relationships)
+        _relationships_changed(relationships)
+    return relationships, skipped
+
+
+def update_relationship_statuses(org_context, relationship_ids, new_status):
+    """
+    Accept or reject many pending relationships of the user's organization
+    with one UPDATE. Like OrganizationRelationshipUpdateView, only pending
+    relationships initiated by the other side can be answered.
+
+    Returns the updated relationships and a list of {'id', 'reason'} for the
+    skipped ids.
+    """
+    if new_status not in ('accepted', 'rejected'):
+        raise RelationshipError("Status can only be changed to 'accepted' or 'rejected'.")
+
+    organization = org_context.organization
+    relationship_ids = list(dict.fromkeys(relationship_ids))
+    answerable = (
+        OrganizationRelationship.objects
+        .filter(Q(buyer_organization=organization) | Q(supplier_organization=organization))
+        .filter(pk__in=relationship_ids, status='pending')
+        .exclude(initiated_by__organization=organization)
+    )
+
+    with transaction.atomic():
+        eligible = set(answerable.select_for_update().values_list('pk', flat=True))
+        if eligible:
+            OrganizationRelationship.objects.filter(pk__in=eligible).update(status=new_status, updated_at=timezone.now())
+
+    updated = list(
+        OrganizationRelationship.objects.filter(pk__in=eligible)
+        .select_related('buyer_organization', 'supplier_organization', 'initiated_by')
+        .order_by('pk')
+    )
+    if updated:
+        _relationships_changed(updated)
+    skipped = [
+        {'id': relationship_id, 'reason': "Not a pending relationship awaiting your organization's answer."}
+        for relationship_id in relationship_ids if relationship_id not in eligible
+    ]
+    return updated, skipped
+
+
+def _relationships_changed(relationships):
+    # One notification for the whole batch, instead of one per row
+    relationships_changed.send(
+        sender=OrganizationRelationship,
+        buyer_organization_ids={relationship.buyer_organization_id for relationship in relationships},
+        supplier_organization_ids={relationship.supplier_organization_id for relationship in relationships},
+    )
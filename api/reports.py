@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, F, Sum
+
+from .cache import bump_version, versioned_key
+from .models import Inventory
+
+INVENTORY_REPORTS = 'inventory_reports'
+
+# group_by option -> (id field, name field) on Inventory
+VALUATION_GROUPS = {
+    'location': ('location_id', 'location__name'),
+    'category': ('product__category_id', 'product__category__name'),
+    'brand': ('product__brand_id', 'product__brand__name'),
+    'supplier': ('product__organization_id', 'product__organization__name'),
+}
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _valuation_aggregates():
+    return {
+        'units': Sum('quantity'),
+        'stock_value': Sum(F('quantity') * F('product__cost'), output_field=MONEY),
+        'retail_value': Sum(F('quantity') * F('product__price'), output_field=MONEY),
+    }
+
+
+def _with_margin(row):
+    stock_value = row['stock_value'] or Decimal('0.00')
+    retail_value = row['retail_value'] or Decimal('0.00')
+    row.update(
+        units=row['units'] or 0,
+        stock_value=stock_value,
+        retail_value=retail_value,
+        potential_margin=retail_value - stock_value,
+        margin_percent=((retail_value - stock_value) / retail_value * 100) if retail_value > 0 else None,
+    )
+    return row
+
+
+def inventory_valuation(organization_id, group_by='location'):
+    """
+    Stock value at cost, retail value and potential margin of an organization's inventory.
+
+    Values are aggregated in the database, grouped by location, category, brand or
+    supplier organization; only the grouped rows and one totals row are fetched.
+    """
+    id_field, name_field = VALUATION_GROUPS[group_by]
+    inventory = Inventory.objects.filter(organization_id=organization_id)
+
+    groups = (
+        inventory
+        .values(id_field, name_field)
+        .annotate(**_valuation_aggregates())
+        .order_by('-stock_value', name_field)
+    )
+    totals = inventory.aggregate(**_valuation_aggregates())
+
+    return {
+        'group_by': group_by,
+        'groups': [
+            _with_margin({
+                'id': row[id_field],
+                'name': row[name_field],
+                'units': row['units'],
+                'stock_value': row['stock_value'],
+                'retail_value': row['retail_value'],
+            })
+            for row in groups
+        ],
+        'totals': _with_margin(totals),
+    }
+
+
+def cached_inventory_valuation(organization_id, group_by, build):
+    """
+    Return the cached report for an organization, building it with build() on a miss.
+
+    Entries are invalidated by invalidate_inventory_reports() whenever the
+    organization's inventory or the products it holds change.
+    """
+    key = versioned_key(INVENTORY_REPORTS, organization_id, 'valuation', group_by)
+    data = cache.get(key)
+    if data is None:
+        data = build(inventory_valuation(organization_id, group_by))
+        cache.set(key, data, getattr(settings, 'INVENTORY_REPORT_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate_inventory_reports(organization_ids):
+    bump_version(INVENTORY_REPORTS, organization_ids)
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Inventory, StockReservation
+from .rankings import schedule_ranking_refresh
+
+
+class ReservationError(Exception):
+    """Raised when supplier stock is not available to hold for a cart."""
+
+
+def reservation_expiry(now=None):
+    ttl = getattr(settings, 'STOCK_RESERVATION_TTL', timedelta(minutes=15))
+    return (now or timezone.now()) + ttl
+
+
+def _supplier_inventory(product):
+    return Inventory.objects.filter(product=product, organization_id=product.organization_id)
+
+
+def reserve_stock(order_item, amount):
+    """
+    Hold amount units of the item's product against the supplier's inventory.
+
+    The hold is taken with a conditional update
+    (reserved_quantity = reserved_quantity + amount WHERE quantity - reserved_quantity >= amount)
+    on the location with the most available stock. Expired holds on the product
+    are released once before giving up. Returns the reservation, or None when the
+    supplier does not track inventory for the product. Raises ReservationError
+    when not enough stock is available.
+    """
+    product = order_item.product
+    now = timezone.now()
+    expires_at = reservation_expiry(now)
+
+    with transaction.atomic():
+        for attempt in range(2):
+            candidates = list(
+                _supplier_inventory(product).with_available()
+                .filter(available__gte=amount)
+                .order_by('-available')
+                .values_list('pk', flat=True)[:3]
+            )
+            for inventory_id in candidates:
+                held = Inventory.objects.filter(pk=inventory_id, quantity__gte=F('reserved_quantity') + amount).update(
+                    reserved_quantity=F('reserved_quantity') + amount
+                )
+                if not held:
+                    continue # Taken by a concurrent cart since it was read
+                schedule_ranking_refresh(inventory_ids=[inventory_id])
+
+                reservation, created = StockReservation.objects.get_or_create(
+                    order_item=order_item,
+                    inventory_id=inventory_id,
+                    status='active',
+                    defaults={'quantity': amount, 'expires_at': expires_at, 'organization_id': product.organization_id}
+                )
+                if not created:
+                    StockReservation.objects.filter(pk=reservation.pk).update(quantity=F('quantity') + amount)
+                    reservation.refresh_from_db()
+                # Cart activity keeps all of the cart's holds alive
+                StockReservation.objects.filter(order_item__order_id=order_item.order_id, status='active').update(expires_at=expires_at)
+                return reservation
+
+            if attempt == 0 and not release_expired_reservations(now=now, product=product):
+                break
+
+    if not _supplier_inventory(product).exists():
+        return None
+    raise ReservationError(f"Not enough stock available for {product.name}.")
+
+
+def release_reservations(order_item, amount=None):
+    """Release up to amount held units of an order item (all of them when amount is None)"""
+    released = 0
+    with transaction.atomic():
+        holds = StockReservation.objects.select_for_update().filter(order_item=order_item, status='active').order_by('-created_at')
+        for hold in holds:
+            if amount is not None and released >= amount:
+                break
+            take = hold.quantity if amount is None else min(hold.quantity, amount - released)
+            Inventory.objects.filter(pk=hold.inventory_id).update(
+                reserved_quantity=Greatest(F('reserved_quantity') - take, Value(0))
+            )
+            schedule_ranking_refresh(inventory_ids=[hold.inventory_id])
+            if take == hold.quantity:
+                StockReservation.objects.filter(pk=hold.pk).update(status='released', updated_at=timezone.now())
+            else:
+                StockReservation.objects.filter(pk=hold.pk).update(quantity=F('quantity') - take, updated_at=timezone.now())
+            released += take
+    return released
+
+
+def release_expired_reservations(now=None, product=None, batch_size=1000):
+    """
+    Release every active hold whose expiry has passed.
+
+    Holds are processed in batches: each batch returns its units to inventory
+    with one UPDATE ... CASE statement and marks the holds expired with another.
+    Returns the number of reservations released.
+    """
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status='active', expires_at__lte=now)
+    if product is not None:
+        expired = expired.filter(inventory__product=product)
+
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                expired.select_for_update()
+                .order_by('pk')
+                .values_list('pk', 'inventory_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                break
+
+            totals = defaultdict(int)
+            for _, inventory_id, quantity in batch:
+                totals[inventory_id] += quantity
+
+            Inventory.objects.filter(pk__in=totals).update(
+                reserved_quantity=Greatest(
+                    Case(*[When(pk=inventory_id, then=F('reserved_quantity') - total) for inventory_id, total in totals.items()]),
+                    Value(0)
+                )
+            )
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in batch]).update(status='expired', updated_at=now)
+            schedule_ranking_refresh(inventory_ids=totals.keys())
+            released += len(batch)
+
+        if len(batch) < batch_size:
+            break
+    return released
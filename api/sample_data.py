@@ -0,0 +1,338 @@
+import random
+import uuid
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import Organization, OrganizationRelationship
+from .models import (
+    Brand, Buyer, Category, Inventory, InventoryMovement, Location, Order, OrderItem, Product,
+    ProductImage, ProductSize, Size
+)
+from .analytics import rebuild_sales_rollups
+from .credit import CREDIT_PAYMENT_TERMS, refresh_outstanding_balances
+from .rankings import refresh_rankings
+from .supplier_metrics import refresh_supplier_metrics
+
+User = get_user_model()
+
+
+@transaction.atomic
+def seed_catalog(products=100, locations=3, orders=20, seed=None):
+    """
+    Create a supplier with a catalog and a buyer trading with it.
+
+    Rows are written with bulk_create, so model save() hooks and signals do not
+    run. Names are suffixed with a random tag so several datasets can coexist.
+    Returns a dict with the created supplier, buyer, their admin users and the
+    buyer profile.
+    """
+    rng = random.Random(seed)
+    tag = uuid.uuid4().hex[:8]
+
+    supplier = Organization.objects.create(name=f'Sample Supplier {tag}', organization_type='supplier', active_status=True)
+    buyer_org = Organization.objects.create(name=f'Sample Buyer {tag}', organization_type='buyer', active_status=True)
+    OrganizationRelationship.objects.create(buyer_organization=buyer_org, supplier_organization=supplier, status='accepted')
+    supplier_admin = User.objects.create_user(
+        email=f'supplier-{tag}@example.com', username=f'supplier_{tag}', password=None,
+        organization=supplier, role='admin'
+    )
+    buyer_admin = User.objects.create_user(
+        email=f'buyer-{tag}@example.com', username=f'buyer_{tag}', password=None,
+        organization=buyer_org, role='admin'
+    )
+    buyer = Buyer.objects.create(
+        user=buyer_admin, organization=buyer_org, name=buyer_org.name,
+        email=buyer_admin.email, buyer_code=f'BUY-{tag}'
+    )
+
+    categories = _categories(supplier)
+    brands = Brand.objects.bulk_create([Brand(name=f'Brand {index}', organization=supplier) for index in range(10)])
+    sites = Location.objects.bulk_create(
+        [Location(name=f'Warehouse {index}', organization=supplier) for index in range(locations)]
+    )
+    Location.objects.create(name='Receiving', organization=buyer_org)
+
+    catalog = []
+    for index in range(products):
+        cost = Decimal(rng.randint(100, 5000)) / 100
+        catalog.append(Product(
+            name=f'Product {index:06d} {tag}', sku=f'{tag}-{index:06d}',
+            price=(cost * Decimal('1.4')).quantize(Decimal('0.01')), cost=cost,
+            category=rng.choice(categories), brand=rng.choice(brands),
+            organization=supplier, active=rng.random() > 0.1
+        ))
+    catalog = Product.objects.bulk_create(catalog, batch_size=500)
+
+    stock = Inventory.objects.bulk_create(
+        [
+            Inventory(product=product, location=site, organization=supplier, quantity=rng.randint(0, 200))
+            for product in catalog for site in sites
+        ],
+        batch_size=500
+    )
+    InventoryMovement.objects.bulk_create(
+        [
+            InventoryMovement(
+                inventory=row, quantity_change=row.quantity, movement_type='addition',
+                note='Initial stock', user=supplier_admin, organization=supplier
+            )
+            for row in stock if row.quantity
+        ],
+        batch_size=500
+    )
+
+    statuses = ['pending', 'completed', 'processing', 'shipped', 'delivered']
+    placed = Order.objects.bulk_create([
+        Order(
+            order_number=f'ORD-{tag}-{index:06d}', customer=buyer, status=rng.choice(statuses),
+            organization=buyer_org, created_by=buyer_admin
+        )
+        for index in range(orders)
+    ])
+    items = []
+    for order in placed:
+        for product in rng.sample(catalog, min(3, len(catalog))):
+            quantity = rng.randint(1, 5)
+            items.append(OrderItem(
+                order=order, product=product, quantity=quantity, unit_price=product.price,
+                subtotal=product.price * quantity, organization=buyer_org
+            ))
+    OrderItem.objects.bulk_create(items, batch_size=500)
+    refresh_rankings([product.pk for product in catalog])
+    rebuild_sales_rollups([supplier.pk])
+    refresh_supplier_metrics([supplier.pk])
+    refresh_outstanding_balances([buyer.pk])
+
+    return {
+        'supplier': supplier,
+        'buyer_organization': buyer_org,
+        'supplier_admin': supplier_admin,
+        'buyer_admin': buyer_admin,
+        'buyer': buyer,
+    }
+
+
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+COLORS = ['black', 'white', 'red', 'blue', 'green']
+PLACED_STATUSES = ['completed', 'canceled', 'processing', 'shipped', 'delivered']
+# Credit limit of generated buyers on credit terms, far above what generated orders and load replays owe
+GENERATED_CREDIT_LIMIT = Decimal('1000000.00')
+
+
+def _bulk_create(model, rows, batch_size):
+    """bulk_create an iterable in batches, without holding more than one batch in memory"""
+    rows = iter(rows)
+    created = 0
+    while batch := list(islice(rows, batch_size)):
+        model.objects.bulk_create(batch, batch_size=batch_size)
+        created += len(batch)
+    return created
+
+
+def _categories(organization, count=10, roots=3):
+    """count categories: roots top-level ones, the others spread under them"""
+    top = Category.objects.bulk_create(
+        [Category(name=f'Category {index}', organization=organization) for index in range(roots)]
+    )
+    for category in top:
+        category.path = category.build_path()
+    Category.objects.bulk_update(top, ['path'])
+    children = Category.objects.bulk_create([
+        Category(name=f'Category {index}', organization=organization, parent=top[index % roots])
+        for index in range(roots, count)
+    ])
+    for category in children:
+        category.path = category.build_path(category.parent.path)
+    Category.objects.bulk_update(children, ['path'])
+    return top + children
+
+
+def _organizations(rng, tag, kind, count):
+    return Organization.objects.bulk_create([
+        Organization(
+            name=f'{kind.title()} {index:04d} {tag}', organization_type=kind, active_status=True,
+            contact_email=f'{kind}-{index}-{tag}@example.com', activation_token=uuid.UUID(int=rng.getrandbits(128))
+        )
+        for index in range(count)
+    ])
+
+
+def _admins(tag, organizations):
+    users = []
+    for organization in organizations:
+        user = User(
+            email=f'admin-{organization.pk}-{tag}@example.com', username=f'admin_{organization.pk}_{tag}',
+            organization=organization, role='admin'
+        )
+        user.set_unusable_password()
+        users.append(user)
+    return User.objects.bulk_create(users)
+
+
+@transaction.atomic
+def generate_dataset(suppliers=5, buyers=20, products=200, locations=3, orders=10, movements=10000,
+                     seed=0, tag=None, batch_size=2000):
+    """
+    Create a deterministic multi-tenant dataset for benchmarks.
+
+    suppliers supplier organizations each get a catalog of products products
+    (with images and sizes), locations warehouses stocking every product, and
+    their share of movements inventory movements. buyers buyer organizations
+    trade with a random subset of the suppliers (the first buyer with all of
+    them), and each has orders placed orders plus a pending cart.
+
+    The same arguments always produce the same rows: the content only depends
+    on seed, and tag (default gen<seed>) keeps names and codes unique so that
+    datasets of different seeds can coexist. Rows are written with bulk_create,
+    so model save() hooks and signals do not run.
+
+    Returns a dict shaped like seed_catalog()'s for the first supplier and
+    buyer, plus 'suppliers', 'buyer_organizations' and row 'counts'.
+    """
+    rng = random.Random(seed)
+    tag = tag or f'gen{seed}'
+
+    supplier_orgs = _organizations(rng, tag, 'supplier', suppliers)
+    buyer_orgs = _organizations(rng, tag, 'buyer', buyers)
+    admins = dict(zip(supplier_orgs + buyer_orgs, _admins(tag, supplier_orgs + buyer_orgs)))
+    buyer_profiles = []
+    for index, organization in enumerate(buyer_orgs):
+        terms = rng.choice(['prepaid', 'net_30'])
+        buyer_profiles.append(Buyer(
+            user=admins[organization], organization=organization, name=organization.name,
+            email=admins[organization].email, buyer_code=f'BUY-{tag}-{index:05d}', payment_terms=terms,
+            # Checkout enforces the limit of buyers on credit terms; keep generated ones well under it
+            credit_limit=GENERATED_CREDIT_LIMIT if terms in CREDIT_PAYMENT_TERMS else 0
+        ))
+    buyer_profiles = Buyer.objects.bulk_create(buyer_profiles)
+
+    trading = {}
+    relationships = []
+    for index, buyer_org in enumerate(buyer_orgs):
+        partners = supplier_orgs if index == 0 else rng.sample(supplier_orgs, rng.randint(0, len(supplier_orgs)))
+        trading[buyer_org] = partners
+        relationships.extend(
+            OrganizationRelationship(
+                buyer_organization=buyer_org, supplier_organization=supplier_org,
+                status='accepted', initiated_by=admins[buyer_org]
+            )
+            for supplier_org in partners
+        )
+    OrganizationRelationship.objects.bulk_create(relationships, batch_size=batch_size)
+    Location.objects.bulk_create([Location(name='Receiving', organization=organization) for organization in buyer_orgs])
+
+    sizes = list(Size.objects.filter(name__in=SIZES))
+    sizes += Size.objects.bulk_create([Size(name=name) for name in SIZES if name not in {size.name for size in sizes}])
+    sizes.sort(key=lambda size: SIZES.index(size.name))
+
+    catalogs, stock = {}, []
+    for supplier_index, supplier_org in enumerate(supplier_orgs):
+        categories = _categories(supplier_org)
+        brands = Brand.objects.bulk_create([Brand(name=f'Brand {index}', organization=supplier_org) for index in range(10)])
+        sites = Location.objects.bulk_create(
+            [Location(name=f'Warehouse {index}', organization=supplier_org) for index in range(locations)]
+        )
+
+        catalog = []
+        for index in range(products):
+            cost = Decimal(rng.randint(100, 5000)) / 100
+            catalog.append(Product(
+                name=f'Product {supplier_index:04d}-{index:06d}', sku=f'{tag}-{supplier_index:04d}-{index:06d}',
+                price=(cost * Decimal('1.4')).quantize(Decimal('0.01')), cost=cost,
+                category=rng.choice(categories), brand=rng.choice(brands),
+                organization=supplier_org, active=rng.random() > 0.1
+            ))
+        catalogs[supplier_org] = catalog = Product.objects.bulk_create(catalog, batch_size=batch_size)
+
+        _bulk_create(ProductImage, (
+            ProductImage(
+                product=product, color=color, image=f'images/variants/{product.sku}-{color}.jpg', default=position == 0
+            )
+            for product in catalog
+            for position, color in enumerate(rng.sample(COLORS, rng.randint(1, 3)))
+        ), batch_size)
+        _bulk_create(ProductSize, (
+            ProductSize(product=product, size=size)
+            for product in catalog
+            for size in rng.sample(sizes, rng.randint(0, 3))
+        ), batch_size)
+        stock += Inventory.objects.bulk_create(
+            [
+                Inventory(product=product, location=site, organization=supplier_org, quantity=rng.randint(0, 200))
+                for product in catalog for site in sites
+            ],
+            batch_size=batch_size
+        )
+
+    def movement_rows():
+        kinds = ['addition', 'removal', 'adjustment', 'transfer']
+        for position in range(movements):
+            row = stock[position % len(stock)] if position < len(stock) else rng.choice(stock)
+            kind = 'addition' if position < len(stock) else rng.choice(kinds)
+            change = rng.randint(1, 50) * (-1 if kind in ('removal', 'transfer') else 1)
+            yield InventoryMovement(
+                inventory=row, quantity_change=change, movement_type=kind, reference=f'{tag}-{position}',
+                user=admins[row.organization], organization=row.organization
+            )
+    movement_count = _bulk_create(InventoryMovement, movement_rows(), batch_size) if stock else 0
+
+    placed, items, number = [], [], 0
+    for buyer_org, profile in zip(buyer_orgs, buyer_profiles):
+        offered = [product for supplier_org in trading[buyer_org] for product in catalogs[supplier_org]]
+        if not offered:
+            continue
+        for status in [rng.choice(PLACED_STATUSES) for _ in range(orders)] + ['pending']:
+            number += 1
+            order = Order(
+                order_number=f'{tag}-{number:08d}', customer=profile, status=status,
+                organization=buyer_org, created_by=admins[buyer_org]
+            )
+            lines = []
+            for product in rng.sample(offered, min(3, len(offered))):
+                quantity = rng.randint(1, 5)
+                lines.append(OrderItem(
+                    order=order, product=product, quantity=quantity, unit_price=product.price,
+                    subtotal=product.price * quantity, organization=buyer_org
+                ))
+            order.total_amount = sum(line.subtotal for line in lines)
+            placed.append(order)
+            items.extend(lines)
+    Order.objects.bulk_create(placed, batch_size=batch_size)
+    OrderItem.objects.bulk_create(items, batch_size=batch_size)
+    refresh_rankings(Product.objects.filter(organization__in=supplier_orgs).values('pk'), batch_size=batch_size)
+    rebuild_sales_rollups([org.pk for org in supplier_orgs], batch_size=batch_size)
+    refresh_supplier_metrics([org.pk for org in supplier_orgs])
+    refresh_outstanding_balances([profile.pk for profile in buyer_profiles])
+
+    return {
+        'tag': tag,
+        'supplier': supplier_orgs[0],
+        'buyer_organization': buyer_orgs[0],
+        'supplier_admin': admins[supplier_orgs[0]],
+        'buyer_admin': admins[buyer_orgs[0]],
+        'buyer': buyer_profiles[0],
+        'suppliers': supplier_orgs,
+        'buyer_organizations': buyer_orgs,
+        'counts': {
+            'organizations': len(supplier_orgs) + len(buyer_orgs),
+            'relationships': len(relationships),
+            'products': sum(len(catalog) for catalog in catalogs.values()),
+            'inventory': len(stock),
+            'movements': movement_count,
+            'orders': len(placed),
+            'order_items': len(items),
+        },
+    }
+
+
+@transaction.atomic
+def delete_dataset(dataset):
+    """Delete what generate_dataset() created; orders are removed first as they only SET_NULL"""
+    organizations = dataset['suppliers'] + dataset['buyer_organizations']
+    # Carts opened by update-cart have a customer but no organization
+    Order.objects.filter(Q(organization__in=organizations) | Q(customer__organization__in=organizations)).delete()
+    Organization.objects.filter(pk__in=[organization.pk for organization in organizations]).delete()
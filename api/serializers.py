@@ -1,13 +1,24 @@
 from rest_framework import serializers
-from .models import Product, Order, ProductImage, Size, ProductSize, Brand, OrderItem, ShippingAddress, Buyer, Supplier, Driver, Category, Location, Inventory, InventoryMovement
+from .models import CatalogImport, SupplierPerformanceMetrics, Product, Order, ProductImage, Size, ProductSize, Brand, OrderItem, ShippingAddress, Buyer, Supplier, Driver, Category, Location, Inventory, InventoryMovement
 from accounts.models import Organization, User, OrganizationRelationship
+from accounts.context import get_request_context
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Sum, F
+from stocksync.log import get_logger
+from .images import image_srcset
+from .analytics import SERIES_INTERVALS, SIDES, TOP_GROUPS, TOP_METRICS, default_range
+
+log = get_logger(__name__)
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ('color', 'image', 'default')
+        fields = ('color', 'image', 'srcset', 'default')
+
+    def get_srcset(self, obj):
+        return image_srcset(obj.image, obj.image_variants, self.context.get('request'))
 
 class SizeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,6 +32,23 @@ class ProductSizeSerializer(serializers.ModelSerializer):
         model = ProductSize
         fields = ('size',)
 
+def completed_quantity(product):
+    """Delivered quantity of a product, annotated by Product.objects.with_listing_data()"""
+    if hasattr(product, 'completed_quantity'):
+        return product.completed_quantity
+    return product.get_completed
+
+def in_stock(product):
+    """Whether the product's own organization holds unreserved stock of it"""
+    if hasattr(product, 'stock_available'):
+        total_inventory = product.stock_available
+    else:
+        total_inventory = Inventory.objects.filter(
+            product=product,
+            organization_id=product.organization_id
+        ).aggregate(total_quantity=Sum(F('quantity') - F('reserved_quantity')))['total_quantity']
+    return total_inventory is not None and total_inventory > 0
+
 class ProductSerializer(serializers.ModelSerializer):
     """
     Standard Serializer for the Product model.
@@ -28,6 +56,7 @@ class ProductSerializer(serializers.ModelSerializer):
     """
     category = serializers.SlugRelatedField(slug_field='name', read_only=True)
     brand = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
     sizes = serializers.SerializerMethodField()
     total_completed_orders = serializers.SerializerMethodField()
@@ -37,56 +66,43 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             'id', 'name', 'sku', 'description', 'category', 'brand', 'price',
-            'cost', 'image', 'barcode', 'digital', 'organization', 'active',
+            'cost', 'image', 'image_srcset', 'barcode', 'digital', 'organization', 'active',
             'created_at', 'updated_at', 'images', 'sizes', 'total_completed_orders', 'is_available'
         ]
-        read_only_fields = ['organization', 'created_at', 'updated_at', 'images', 'sizes', 'total_completed_orders', 'is_available']
+        read_only_fields = ['organization', 'created_at', 'updated_at', 'image_srcset', 'images', 'sizes', 'total_completed_orders', 'is_available']
+
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image, obj.image_variants, self.context.get('request'))
 
     def get_images(self, obj):
         request = self.context.get('request')
-        images = ProductImage.objects.filter(product=obj)
+        images = obj.images.all()
         try:
             return ProductImageSerializer(images, many=True, context={'request': request}).data
         except ImportError:
             return []
 
     def get_sizes(self, obj):
-        sizes = ProductSize.objects.filter(product=obj)
+        sizes = obj.sizes.all()
         try:
             return ProductSizeSerializer(sizes, many=True).data
         except ImportError:
             return []
 
     def get_total_completed_orders(self, obj):
-        return obj.get_completed
+        return completed_quantity(obj)
 
     def get_is_available(self, obj):
-        request = self.context.get('request')
-        if request and request.user and request.user.is_authenticated:
-            user_organization = request.user.organization
+        org_context = get_request_context(self.context.get('request'))
+        user_organization = org_context.organization
 
-            if user_organization:
-                if obj.organization == user_organization:
-                     total_inventory = Inventory.objects.filter(
-                         product=obj,
-                         organization=user_organization
-                     ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-                     return total_inventory is not None and total_inventory > 0
-
-                if user_organization.organization_type in ['buyer', 'both']:
-                    is_accepted_supplier = OrganizationRelationship.objects.filter(
-                        buyer_organization=user_organization,
-                        supplier_organization=obj.organization,
-                        status='accepted'
-                    ).exists()
-
-                    if is_accepted_supplier:
-                        total_inventory = Inventory.objects.filter(
-                            product=obj,
-                            organization=obj.organization
-                        ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-
-                        return total_inventory is not None and total_inventory > 0
+        if user_organization:
+            if obj.organization_id == user_organization.id:
+                 return in_stock(obj)
+
+            if org_context.is_buyer:
+                if org_context.can_buy_from(obj.organization_id):
+                    return in_stock(obj)
 
         return False
 
@@ -97,6 +113,7 @@ class BuyerSupplierProductSerializer(serializers.ModelSerializer):
     """
     category = serializers.SlugRelatedField(slug_field='name', read_only=True)
     brand = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
     sizes = serializers.SerializerMethodField()
     total_completed_orders = serializers.SerializerMethodField()
@@ -106,65 +123,45 @@ class BuyerSupplierProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             'id', 'name', 'sku', 'description', 'category', 'brand', 'price',
-            'image', 'barcode', 'digital', 'organization', 'active',
+            'image', 'image_srcset', 'barcode', 'digital', 'organization', 'active',
             'created_at', 'updated_at', 'images', 'sizes', 'total_completed_orders', 'is_available'
         ]
-        read_only_fields = ['organization', 'created_at', 'updated_at', 'images', 'sizes', 'total_completed_orders', 'is_available']
+        read_only_fields = ['organization', 'created_at', 'updated_at', 'image_srcset', 'images', 'sizes', 'total_completed_orders', 'is_available']
+
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image, obj.image_variants, self.context.get('request'))
 
     def get_images(self, obj):
         request = self.context.get('request')
-        images = ProductImage.objects.filter(product=obj)
+        images = obj.images.all()
         try:
             return ProductImageSerializer(images, many=True, context={'request': request}).data
         except ImportError:
             return []
 
     def get_sizes(self, obj):
-        sizes = ProductSize.objects.filter(product=obj)
+        sizes = obj.sizes.all()
         try:
             return ProductSizeSerializer(sizes, many=True).data
         except ImportError:
             return []
 
     def get_total_completed_orders(self, obj):
-        return obj.get_completed
+        return completed_quantity(obj)
 
     def get_is_available(self, obj):
-        print(f"--- get_is_available for Product ID: {obj.id} ---")
-        request = self.context.get('request')
-        if request and request.user and request.user.is_authenticated:
-            print(f"User authenticated: {request.user.email}")
-            user_organization = request.user.organization
-            print(f"User Organization: {user_organization.id if user_organization else 'None'}")
+        org_context = get_request_context(self.context.get('request'))
+        if org_context.is_authenticated:
+            user_organization = org_context.organization
 
             if user_organization:
-                if user_organization.organization_type in ['buyer', 'both']:
-                    print(f"User organization type is buyer/both: {user_organization.organization_type}")
-                    print(f"Checking relationship between Buyer Org {user_organization.id} and Supplier Org {obj.organization.id}")
-                    is_accepted_supplier = OrganizationRelationship.objects.filter(
-                        buyer_organization=user_organization,
-                        supplier_organization=obj.organization,
-                        status='accepted'
-                    ).exists()
-                    print(f"Is accepted supplier relationship exists: {is_accepted_supplier}")
-
-                    if is_accepted_supplier:
-                        print(f"Calculating total inventory for Product ID {obj.id} in Organization ID {obj.organization.id}")
-                        total_inventory = Inventory.objects.filter(
-                            product=obj,
-                            organization=obj.organization
-                        ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-                        print(f"Total inventory calculated: {total_inventory}")
-
-                        result = total_inventory is not None and total_inventory > 0
-                        print(f"Final is_available result: {result}")
-                        print("--- End get_is_available ---")
+                if org_context.is_buyer:
+                    if org_context.can_buy_from(obj.organization_id):
+                        result = in_stock(obj)
+                        log.debug('product.availability', product_id=obj.id, organization_id=user_organization.id, available=result)
                         return result
-                    else:
-                        print("No accepted supplier relationship found.")
+                    log.debug('product.availability.no_relationship', product_id=obj.id, organization_id=user_organization.id)
 
-        print("Conditions not met for availability check.")
-        print("--- End get_is_available ---")
         return False
 
 class ProductCreateSerializer(serializers.ModelSerializer):
@@ -181,8 +178,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
     def validate_sku(self, value):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
         queryset = Product.objects.filter(sku=value, organization=user_organization)
 
         if self.instance:
@@ -193,19 +189,66 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         return value
 
     def validate_category(self, value):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
         if value and value.organization != user_organization:
             raise serializers.ValidationError("You can only assign categories belonging to your organization.")
         return value
 
     def validate_brand(self, value):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
         if value and value.organization != user_organization:
             raise serializers.ValidationError("You can only assign brands belonging to your organization.")
         return value
 
+class CatalogImportImageSerializer(serializers.Serializer):
+    color = serializers.CharField(max_length=200, allow_blank=True)
+    image = serializers.CharField(max_length=100)
+    default = serializers.BooleanField(required=False, default=False)
+
+class CatalogImportRowSerializer(serializers.Serializer):
+    """
+    One product of a catalog import. Brand and category are names (or a
+    category id), resolved by api.catalog_import; sizes and images, when
+    given, replace those of an existing product. Fields left out of a row
+    keep their current value on update.
+    """
+    sku = serializers.CharField(max_length=50)
+    name = serializers.CharField(max_length=200)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    description = serializers.CharField(max_length=1000, required=False, allow_blank=True, allow_null=True)
+    barcode = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    digital = serializers.BooleanField(required=False)
+    active = serializers.BooleanField(required=False)
+    brand = serializers.CharField(max_length=200, required=False, allow_null=True)
+    category = serializers.CharField(max_length=100, required=False, allow_null=True)
+    sizes = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+    images = CatalogImportImageSerializer(many=True, required=False)
+
+class CatalogImportSerializer(serializers.ModelSerializer):
+    format = serializers.ChoiceField(choices=CatalogImport.FORMAT_CHOICES, required=False)
+
+    class Meta:
+        model = CatalogImport
+        fields = [
+            'id', 'file', 'format', 'status', 'processed_rows', 'created_products', 'updated_products',
+            'failed_rows', 'errors', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'status', 'processed_rows', 'created_products', 'updated_products', 'failed_rows', 'errors',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        extra_kwargs = {'file': {'write_only': True}}
+
+    def validate(self, data):
+        if not data.get('format'):
+            extension = data['file'].name.rpartition('.')[2].lower()
+            formats = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+            if extension not in formats:
+                raise serializers.ValidationError({'format': "Give the format of files not named .csv, .ndjson or .jsonl."})
+            data['format'] = formats[extension]
+        return data
+
 class OrganizationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organization
@@ -292,12 +335,13 @@ class OrganizationRelationshipSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         target_organization = validated_data.pop('target_organization_id')
         user = self.context['request'].user
-        initiating_organization = user.organization
+        org_context = get_request_context(self.context['request'])
+        initiating_organization = org_context.organization
 
-        if initiating_organization.organization_type in ['buyer', 'both']:
+        if org_context.is_buyer:
             buyer_org = initiating_organization
             supplier_org = target_organization
-        elif initiating_organization.organization_type in ['supplier', 'both']:
+        elif org_context.is_supplier:
              buyer_org = target_organization
              supplier_org = initiating_organization
         else:
@@ -327,6 +371,15 @@ class OrganizationRelationshipSerializer(serializers.ModelSerializer):
 
         return instance
 
+class OrganizationRelationshipBatchRequestSerializer(serializers.Serializer):
+    target_organization_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500
+    )
+
+class OrganizationRelationshipBatchUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(choices=['accepted', 'rejected'])
+
 class PotentialSupplierSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organization
@@ -393,8 +446,7 @@ class LocationSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def validate(self, data):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
         name = data.get('name')
 
         queryset = Location.objects.filter(name=name, organization=user_organization)
@@ -410,31 +462,27 @@ class LocationSerializer(serializers.ModelSerializer):
 class InventorySerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     location = LocationSerializer(read_only=True)
+    available_quantity = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Inventory
         fields = [
-            'id', 'product', 'location', 'quantity', 'last_stocked', 'last_sold',
-            'created_at', 'updated_at', 'organization'
+            'id', 'product', 'location', 'quantity', 'reserved_quantity', 'available_quantity',
+            'last_stocked', 'last_sold', 'created_at', 'updated_at', 'organization'
         ]
-        read_only_fields = ['last_stocked', 'last_sold', 'created_at', 'updated_at', 'organization']
+        read_only_fields = ['reserved_quantity', 'last_stocked', 'last_sold', 'created_at', 'updated_at', 'organization']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        request = self.context.get('request')
-        user_organization = request.user.organization if request and request.user and request.user.is_authenticated else None
+        org_context = get_request_context(self.context.get('request'))
 
         # Check if the user is a buyer/both and the product belongs to a different organization
-        if user_organization and user_organization.organization_type in ['buyer', 'both'] and instance.product.organization != user_organization:
+        if org_context.is_buyer and instance.product.organization_id != org_context.organization_id:
             # If it's a supplier's product viewed by a buyer, use BuyerSupplierProductSerializer for the product part
             product_serializer = BuyerSupplierProductSerializer(instance.product, context=self.context)
             representation['product'] = product_serializer.data
             # Keep quantity as it's in the buyer's inventory
-        else:
-            # Otherwise, use the standard ProductSerializer (shows cost)
-            product_serializer = ProductSerializer(instance.product, context=self.context)
-            representation['product'] = product_serializer.data
-            # Keep quantity
+        # Otherwise the product field already holds the standard ProductSerializer output (shows cost)
 
         return representation
 
@@ -452,7 +500,7 @@ class BuyerSupplierInventorySerializer(serializers.ModelSerializer):
         read_only_fields = ['last_stocked', 'created_at', 'updated_at', 'organization']
 
     def get_is_available(self, obj):
-        return obj.quantity > 0
+        return obj.available_quantity > 0
 
 class InventoryCreateSerializer(serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
@@ -466,8 +514,7 @@ class InventoryCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
     def validate(self, data):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
 
         product = data.get('product')
         location = data.get('location')
@@ -498,20 +545,16 @@ class InventoryMovementSerializer(serializers.ModelSerializer):
         ]
 
     def get_inventory(self, obj):
-        request = self.context.get('request')
-        user_organization = request.user.organization if request and request.user and request.user.is_authenticated else None
+        org_context = get_request_context(self.context.get('request'))
 
-        # Re-fetch the Inventory object to ensure we have the latest quantity
-        try:
-            inventory_item = Inventory.objects.get(pk=obj.inventory.pk)
-        except Inventory.DoesNotExist:
-            return None # Or handle this case as appropriate
+        # Loaded with the movement (see InventoryMovementListView.get_queryset)
+        inventory_item = obj.inventory
 
-        product_organization = inventory_item.product.organization
+        product_organization_id = inventory_item.product.organization_id
 
         # If the user is a buyer/both AND the product belongs to a different organization (a supplier)
         # Use BuyerSupplierInventorySerializer which hides quantity and uses BuyerSupplierProductSerializer
-        if user_organization and user_organization.organization_type in ['buyer', 'both'] and product_organization != user_organization:
+        if org_context.is_buyer and product_organization_id != org_context.organization_id:
             # Note: BuyerSupplierInventorySerializer excludes 'quantity' by design
             return BuyerSupplierInventorySerializer(inventory_item, context=self.context).data
         else:
@@ -539,8 +582,7 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = []
 
     def validate(self, data):
-        request = self.context.get('request')
-        user_organization = request.user.organization
+        user_organization = get_request_context(self.context.get('request')).organization
         name = data.get('name')
         parent = data.get('parent')
 
@@ -555,6 +597,9 @@ class CategorySerializer(serializers.ModelSerializer):
         if self.instance and parent and self.instance.pk == parent.pk:
              raise serializers.ValidationError({"parent": "A category cannot be its own parent."})
 
+        if self.instance and parent and self.instance.path and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError({"parent": "A category cannot be moved under one of its subcategories."})
+
         return data
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -582,4 +627,101 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'order_number', 'organization', 'status', 'total_amount',
             'order_date', 'created_by', 'updated_at'
-        ]
\ No newline at end of file
+        ]
+class InventoryValuationRowSerializer(serializers.Serializer):
+    id = serializers.IntegerField(allow_null=True, required=False)
+    name = serializers.CharField(allow_null=True, required=False)
+    units = serializers.IntegerField()
+    stock_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+    retail_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+    potential_margin = serializers.DecimalField(max_digits=14, decimal_places=2)
+    margin_percent = serializers.DecimalField(max_digits=7, decimal_places=2, allow_null=True)
+
+class InventoryValuationSerializer(serializers.Serializer):
+    group_by = serializers.CharField()
+    groups = InventoryValuationRowSerializer(many=True)
+    totals = InventoryValuationRowSerializer()
+
+class SalesAnalyticsQuerySerializer(serializers.Serializer):
+    """Query parameters of the sales analytics endpoints; the range defaults to the last 30 days"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    side = serializers.ChoiceField(choices=list(SIDES), default='sales')
+
+    # Longest range a request may cover, in days
+    MAX_RANGE = 731
+
+    def validate(self, data):
+        default_start, default_end = default_range()
+        data.setdefault('end', default_end)
+        data.setdefault('start', min(default_start, data['end']))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({"start": "Must not be after end."})
+        if (data['end'] - data['start']).days >= self.MAX_RANGE:
+            raise serializers.ValidationError({"start": f"The range may cover at most {self.MAX_RANGE} days."})
+        return data
+
+class SalesSeriesQuerySerializer(SalesAnalyticsQuerySerializer):
+    interval = serializers.ChoiceField(choices=list(SERIES_INTERVALS), default='day')
+
+class SalesTopQuerySerializer(SalesAnalyticsQuerySerializer):
+    by = serializers.ChoiceField(choices=list(TOP_GROUPS), default='product')
+    metric = serializers.ChoiceField(choices=list(TOP_METRICS), default='revenue')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+class SalesFiguresSerializer(serializers.Serializer):
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    cost = serializers.DecimalField(max_digits=14, decimal_places=2)
+    margin = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class SalesPeriodSerializer(SalesFiguresSerializer):
+    period = serializers.DateField()
+
+class SalesTopRowSerializer(SalesFiguresSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(allow_null=True)
+
+class SalesSeriesSerializer(serializers.Serializer):
+    side = serializers.CharField()
+    interval = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    series = SalesPeriodSerializer(many=True)
+    totals = SalesFiguresSerializer()
+
+class SalesTopSerializer(serializers.Serializer):
+    side = serializers.CharField()
+    by = serializers.CharField()
+    metric = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    results = SalesTopRowSerializer(many=True)
+
+class SupplierScorecardSerializer(serializers.ModelSerializer):
+    organization_name = serializers.CharField(source='organization.name', read_only=True)
+
+    class Meta:
+        model = SupplierPerformanceMetrics
+        fields = [
+            'organization', 'organization_name', 'total_orders', 'open_orders', 'completed_orders',
+            'canceled_orders', 'units_ordered', 'units_fulfilled', 'fill_rate', 'cancellation_rate',
+            'average_lead_time', 'computed_at',
+        ]
+        read_only_fields = fields
+
+class InventoryTransferSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    from_location_id = serializers.IntegerField()
+    to_location_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    note = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['from_location_id'] == data['to_location_id']:
+            raise serializers.ValidationError({"to_location_id": "Source and destination locations must differ."})
+        return data
+
+class InventoryTransferBatchSerializer(serializers.Serializer):
+    transfers = InventoryTransferSerializer(many=True, allow_empty=False)
+    reference = serializers.CharField(max_length=90, required=False)
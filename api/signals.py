@@ -0,0 +1,153 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from accounts.models import Organization, OrganizationRelationship
+from .analytics import schedule_sales_rollup
+from .credit import refresh_outstanding_balances
+from .discovery import invalidate_potential_suppliers, invalidate_supplier_directory
+from .facets import invalidate_product_facets
+from .images import needs_variants, schedule_image_variants
+from .low_stock import schedule_low_stock_check
+from .models import Brand, Category, Inventory, Order, OrderItem, Product, ProductImage, ProductRanking
+from .rankings import schedule_ranking_refresh
+from .reports import invalidate_inventory_reports
+from .reservations import release_reservations
+
+# Sent whenever stock levels change. Write paths that bypass Inventory.save()
+# (queryset updates, bulk operations) send it explicitly.
+# Arguments: organization_id, inventory_ids
+inventory_changed = Signal()
+
+# Sent once per batch by api.relationships, whose bulk writes skip post_save.
+# Arguments: buyer_organization_ids, supplier_organization_ids
+relationships_changed = Signal()
+
+# Sent once per chunk by api.catalog_import, whose bulk writes skip post_save.
+# Arguments: organization_id, created_ids, updated_ids
+catalog_imported = Signal()
+
+
+@receiver(post_save, sender=Inventory)
+def inventory_saved(sender, instance, **kwargs):
+    inventory_changed.send(sender=Inventory, organization_id=instance.organization_id, inventory_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_deleted(sender, instance, **kwargs):
+    invalidate_inventory_reports([instance.organization_id])
+    invalidate_product_facets([instance.organization_id])
+    schedule_ranking_refresh(product_ids=[instance.product_id])
+
+
+@receiver(inventory_changed)
+def check_low_stock_on_change(sender, organization_id, inventory_ids=None, **kwargs):
+    schedule_low_stock_check(organization_id, inventory_ids)
+
+
+@receiver(inventory_changed)
+def invalidate_reports_on_change(sender, organization_id, **kwargs):
+    invalidate_inventory_reports([organization_id])
+
+
+@receiver(inventory_changed)
+def invalidate_facets_on_change(sender, organization_id, **kwargs):
+    invalidate_product_facets([organization_id])
+
+
+@receiver(inventory_changed)
+def refresh_rankings_on_change(sender, organization_id, inventory_ids=None, **kwargs):
+    schedule_ranking_refresh(inventory_ids=inventory_ids or ())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # Cost and price feed the valuation of every organization holding the product
+    holders = Inventory.objects.filter(product_id=instance.pk).values_list('organization_id', flat=True).distinct()
+    invalidate_inventory_reports([instance.organization_id, *holders])
+    invalidate_product_facets([instance.organization_id])
+
+
+@receiver(post_save, sender=Product)
+def product_created(sender, instance, created, **kwargs):
+    # A new product has neither sales nor stock yet
+    if created:
+        ProductRanking.objects.create(product=instance, organization_id=instance.organization_id)
+
+
+@receiver(catalog_imported)
+def catalog_imported_changed(sender, organization_id, created_ids, updated_ids, **kwargs):
+    ProductRanking.objects.bulk_create(
+        [ProductRanking(product_id=pk, organization_id=organization_id) for pk in created_ids], ignore_conflicts=True
+    )
+    holders = []
+    if updated_ids:
+        # Cost and price feed the valuation of every organization holding the products
+        holders = Inventory.objects.filter(product_id__in=updated_ids).values_list('organization_id', flat=True).distinct()
+    invalidate_inventory_reports([organization_id, *holders])
+    invalidate_product_facets([organization_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_saved(sender, instance, **kwargs):
+    if needs_variants(instance):
+        schedule_image_variants(instance)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    # Carts count towards neither sales nor credit; a placed order does from its first save as such
+    if instance.status != 'pending':
+        schedule_ranking_refresh(order_ids=[instance.pk])
+        schedule_sales_rollup([instance.pk])
+        if instance.customer_id:
+            # In the saving transaction: a credit check that follows must see this order
+            refresh_outstanding_balances([instance.customer_id])
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    if instance.customer_id and instance.status != 'pending':
+        refresh_outstanding_balances([instance.customer_id])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+def catalog_taxonomy_changed(sender, instance, **kwargs):
+    # Brand and category names are part of the facets of the organization's catalog
+    invalidate_product_facets([instance.organization_id])
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # on_delete=SET_NULL turned the subcategories into roots; move their subtrees' paths up too
+    if instance.path:
+        Category.objects.rebase(instance.path, '')
+    invalidate_product_facets([instance.organization_id])
+
+
+@receiver(pre_delete, sender=OrderItem)
+def release_order_item_reservations(sender, instance, **kwargs):
+    # Reservations cascade with the item; hand their units back to inventory first
+    release_reservations(instance)
+
+
+@receiver(post_save, sender=OrganizationRelationship)
+@receiver(post_delete, sender=OrganizationRelationship)
+def relationship_changed(sender, instance, created=True, **kwargs):
+    # Only a new or removed relationship moves a supplier in or out of the buyer's discovery list
+    if created:
+        invalidate_potential_suppliers([instance.buyer_organization_id])
+
+
+@receiver(relationships_changed)
+def invalidate_discovery_on_relationships_change(sender, buyer_organization_ids, **kwargs):
+    invalidate_potential_suppliers(buyer_organization_ids)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def organization_changed(sender, instance, **kwargs):
+    invalidate_supplier_directory()
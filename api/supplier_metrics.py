@@ -0,0 +1,107 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from accounts.models import Organization
+from stocksync.log import get_logger
+from .models import InventoryMovement, Order, OrderItem, SupplierPerformanceMetrics
+
+log = get_logger(__name__)
+
+COMPLETED_STATUSES = ('completed', 'delivered')
+CANCELED_STATUS = 'canceled'
+
+METRIC_FIELDS = [
+    'total_orders', 'open_orders', 'completed_orders', 'canceled_orders', 'units_ordered', 'units_fulfilled',
+    'fill_rate', 'cancellation_rate', 'average_lead_time', 'computed_at',
+]
+
+
+def _percent(part, whole):
+    if not whole:
+        return None
+    return (Decimal(100) * part / whole).quantize(Decimal('0.01'))
+
+
+def _order_stats(lines):
+    """
+    One pass over the (supplier, order) pairs of the placed order lines:
+    order counts by outcome and the total and number of lead times
+    (order_date to date_completed) per supplier.
+    """
+    stats = defaultdict(lambda: {'total': 0, 'open': 0, 'completed': 0, 'canceled': 0, 'lead_time': timedelta(), 'lead_times': 0})
+    pairs = (
+        lines.values_list('product__organization_id', 'order_id', 'order__status', 'order__order_date', 'order__date_completed')
+        .distinct()
+        .order_by()
+    )
+    for supplier_id, _, status, placed, completed in pairs.iterator(chunk_size=2000):
+        row = stats[supplier_id]
+        row['total'] += 1
+        if status == CANCELED_STATUS:
+            row['canceled'] += 1
+            continue
+        row['completed' if status in COMPLETED_STATUSES else 'open'] += 1
+        if completed is not None and completed >= placed:
+            row['lead_time'] += completed - placed
+            row['lead_times'] += 1
+    return stats
+
+
+def refresh_supplier_metrics(supplier_ids=None):
+    """
+    Recompute the SupplierPerformanceMetrics of the given supplier
+    organizations (all suppliers when None) from their whole order and
+    movement history, and store them with one upsert. Returns the number of
+    suppliers refreshed.
+
+    The history is read by three set-based queries over every supplier at
+    once, never one per supplier: the distinct (supplier, order) pairs for
+    order counts and lead times, ordered units per supplier, and the units
+    the sale movements of those orders took out of the suppliers' stock.
+    """
+    suppliers = Organization.objects.filter(organization_type__in=['supplier', 'both'])
+    if supplier_ids is not None:
+        suppliers = suppliers.filter(pk__in=supplier_ids)
+
+    lines = OrderItem.objects.exclude(order__status='pending').filter(product__organization_id__in=suppliers.values('pk'))
+    stats = _order_stats(lines)
+    ordered = dict(
+        lines.exclude(order__status=CANCELED_STATUS).values('product__organization_id')
+        .annotate(units=Sum('quantity')).order_by().values_list('product__organization_id', 'units')
+    )
+    # Checkout records every unit it takes from stock as a sale movement referencing the order
+    fulfilled = dict(
+        InventoryMovement.objects.filter(
+            movement_type='sale', organization_id__in=suppliers.values('pk'),
+            reference__in=Order.objects.exclude(status__in=['pending', CANCELED_STATUS]).values('order_number'),
+        )
+        .values('organization_id').annotate(units=Sum(-F('quantity_change'))).order_by()
+        .values_list('organization_id', 'units')
+    )
+
+    now = timezone.now()
+    metrics = []
+    for supplier_id in suppliers.values_list('pk', flat=True).order_by('pk'):
+        row = stats.get(supplier_id) or {'total': 0, 'open': 0, 'completed': 0, 'canceled': 0, 'lead_times': 0}
+        units_ordered = ordered.get(supplier_id) or 0
+        units_fulfilled = min(fulfilled.get(supplier_id) or 0, units_ordered)
+        metrics.append(SupplierPerformanceMetrics(
+            organization_id=supplier_id,
+            total_orders=row['total'], open_orders=row['open'],
+            completed_orders=row['completed'], canceled_orders=row['canceled'],
+            units_ordered=units_ordered, units_fulfilled=units_fulfilled,
+            fill_rate=_percent(units_fulfilled, units_ordered),
+            cancellation_rate=_percent(row['canceled'], row['total']),
+            average_lead_time=row['lead_time'] / row['lead_times'] if row['lead_times'] else None,
+            computed_at=now,
+        ))
+
+    SupplierPerformanceMetrics.objects.bulk_create(
+        metrics, update_conflicts=True, unique_fields=['organization'], update_fields=METRIC_FIELDS, batch_size=500,
+    )
+    log.info('supplier_metrics.refreshed', suppliers=len(metrics))
+    return len(metrics)
@@ -1,3 +1,1738 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from unittest import skipUnless
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import Mock, patch
+from asgiref.sync import async_to_sync, iscoroutinefunction
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from rest_framework.test import APIClient
+from PIL import Image as PILImage
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from io import StringIO
+from decimal import Decimal
+from datetime import timedelta
+from django.utils import timezone
+from accounts.context import get_request_context
+from accounts.request_middleware import get_current_organization
+from stocksync.db_router import ReadReplicaMiddleware, ReadReplicaRouter
+from stocksync.metrics import REGISTRY
+from stocksync.log import JSONFormatter, RequestIDFilter, get_logger, log_sampling
+from accounts.models import Organization, OrganizationRelationship
+from .models import CatalogImport, Product, Location, Inventory, InventoryMovement, Notification, Brand, Category, Order, OrderItem, StockReservation, Buyer, ProductImage, ProductRanking, ProductSize, SalesDailyRollup, Size, Supplier, SupplierPerformanceMetrics
+from .low_stock import notify_low_stock, schedule_low_stock_check
+from .reports import inventory_valuation
+from .transfers import TransferError, transfer_stock
+from .reservations import release_expired_reservations, release_reservations, reserve_stock
+from .query_analysis import QueryCapture, analyze
+from .query_budget import QueryBudget, QueryBudgetExceeded, QueryBudgetMiddleware, get_query_budget
+from .sample_data import generate_dataset, seed_catalog
+from .benchmark import prepare
+from .catalog_import import CatalogImporter, read_rows, run_pending_imports
+from .discovery import invalidate_potential_suppliers, potential_suppliers
+from .supplier_metrics import refresh_supplier_metrics
+from .credit import CreditLimitExceeded, check_credit
+from .images import image_srcset, render_variants
+from . import benchmark, images, load_replay
+from .views import ProductAPIView
+from .serializers import BuyerSupplierProductSerializer
+from . import urls as api_urls
 
-# Create your tests here.
+User = get_user_model()
+
+
+class StockTestMixin:
+    """Shared fixtures: a supplier organization with one product stocked at one location."""
+
+    def setUp(self):
+        self.org = Organization.objects.create(name='Supplier Org', organization_type='supplier')
+        self.admin = User.objects.create_user(email='admin@supplier.com', username='supplier_admin', password='password', organization=self.org, role='admin')
+        self.manager = User.objects.create_user(email='manager@supplier.com', username='supplier_manager', password='password', organization=self.org, role='manager')
+        self.staff = User.objects.create_user(email='staff@supplier.com', username='supplier_staff', password='password', organization=self.org, role='staff')
+        self.location = Location.objects.create(name='Main Warehouse', organization=self.org)
+        self.product = Product.objects.create(name='Widget', sku='WID-001', price=Decimal('10.00'), cost=Decimal('6.00'), organization=self.org)
+        self.inventory = Inventory.objects.create(product=self.product, location=self.location, organization=self.org, quantity=50, min_stock_level=5)
+
+
+class LowStockTests(StockTestMixin, TestCase):
+
+    def test_low_stock_queryset(self):
+        self.assertFalse(Inventory.objects.low_stock().exists())
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=5)
+        self.assertEqual(list(Inventory.objects.low_stock()), [self.inventory])
+
+    def test_notifies_admins_and_managers_only(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=2)
+        notifications = notify_low_stock(self.org.id)
+        self.assertEqual({n.user_id for n in notifications}, {self.admin.id, self.manager.id})
+        self.assertTrue(all(n.related_object_id == self.inventory.id for n in notifications))
+
+    def test_unread_alerts_are_not_duplicated(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=2)
+        self.assertEqual(len(notify_low_stock(self.org.id)), 2)
+        self.assertEqual(len(notify_low_stock(self.org.id)), 0)
+
+        Notification.objects.filter(user=self.admin).update(read_status=True)
+        notifications = notify_low_stock(self.org.id)
+        self.assertEqual([n.user_id for n in notifications], [self.admin.id])
+
+    def test_batched_fan_out_query_count(self):
+        for i in range(5):
+            product = Product.objects.create(name=f'Part {i}', sku=f'PRT-{i}', price=Decimal('1.00'), cost=Decimal('0.50'), organization=self.org)
+            Inventory.objects.create(product=product, location=self.location, organization=self.org, quantity=0)
+        # breaches, recipients, existing alerts, bulk insert
+        with self.assertNumQueries(4):
+            notifications = notify_low_stock(self.org.id)
+        self.assertEqual(len(notifications), 10)
+
+    def test_check_runs_after_commit(self):
+        self.inventory.quantity = 3
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.inventory.save()
+            self.assertFalse(Notification.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notification.objects.filter(notification_type='low_stock').count(), 2)
+
+    def test_checks_queued_in_a_rolled_back_transaction_are_dropped(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=2)
+        other_org = Organization.objects.create(name='Other Org', organization_type='supplier')
+        # In a transaction of its own, apart from the check the fixture's save queued
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                schedule_low_stock_check(self.org.id, [self.inventory.pk])
+                raise RuntimeError
+            schedule_low_stock_check(other_org.id)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_checks_around_a_rolled_back_savepoint_run_once(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=2)
+        part = Product.objects.create(name='Part', sku='PRT-1', price=Decimal('1.00'), cost=Decimal('0.50'), organization=self.org)
+        other = Inventory.objects.bulk_create([Inventory(product=part, location=self.location, organization=self.org, quantity=0)])[0]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            schedule_low_stock_check(self.org.id, [self.inventory.pk])
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                schedule_low_stock_check(self.org.id, [other.pk])
+                raise RuntimeError
+            schedule_low_stock_check(self.org.id, [self.inventory.pk])
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(list(Notification.objects.values_list('related_object_id', flat=True)), [self.inventory.pk] * 2)
+
+    def test_sweep_command(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=0)
+        out = StringIO()
+        call_command('check_low_stock', stdout=out)
+        self.assertIn('2 notifications created', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+class InventoryValuationTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.category = Category.objects.create(name='Hardware', organization=self.org)
+        self.product.category = self.category
+        self.product.save()
+        self.backroom = Location.objects.create(name='Backroom', organization=self.org)
+        self.gadget = Product.objects.create(name='Gadget', sku='GAD-001', price=Decimal('20.00'), cost=Decimal('15.00'), organization=self.org)
+        Inventory.objects.create(product=self.gadget, location=self.backroom, organization=self.org, quantity=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_valuation_by_location(self):
+        report = inventory_valuation(self.org.id, 'location')
+        groups = {row['name']: row for row in report['groups']}
+        self.assertEqual(groups['Main Warehouse']['stock_value'], Decimal('300.00'))
+        self.assertEqual(groups['Main Warehouse']['potential_margin'], Decimal('200.00'))
+        self.assertEqual(groups['Backroom']['stock_value'], Decimal('150.00'))
+        self.assertEqual(report['totals']['units'], 60)
+        self.assertEqual(report['totals']['retail_value'], Decimal('700.00'))
+
+    def test_valuation_by_category_includes_uncategorized(self):
+        report = inventory_valuation(self.org.id, 'category')
+        self.assertEqual({row['name'] for row in report['groups']}, {'Hardware', None})
+
+    def test_endpoint_caches_and_invalidates(self):
+        url = '/api/reports/inventory-valuation/?group_by=location'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['stock_value'], '450.00')
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inventory.quantity = 0
+            self.inventory.save()
+        self.assertEqual(self.client.get(url).data['totals']['stock_value'], '150.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gadget.cost = Decimal('10.00')
+            self.gadget.save()
+        self.assertEqual(self.client.get(url).data['totals']['stock_value'], '100.00')
+
+    def test_invalidated_when_the_change_commits(self):
+        url = '/api/reports/inventory-valuation/?group_by=location'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.inventory.quantity = 0
+            self.inventory.save()
+            # Until then other requests read (and would cache again) the committed rows
+            self.assertEqual(self.client.get(url).data['totals']['stock_value'], '450.00')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data['totals']['stock_value'], '150.00')
+
+    def test_invalid_group_by(self):
+        response = self.client.get('/api/reports/inventory-valuation/?group_by=color')
+        self.assertEqual(response.status_code, 400)
+
+
+class InventoryTransferTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = Location.objects.create(name='Store', organization=self.org)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def transfer(self, quantity, to_location=None):
+        return {
+            'product_id': self.product.id,
+            'from_location_id': self.location.id,
+            'to_location_id': (to_location or self.store).id,
+            'quantity': quantity,
+        }
+
+    def test_transfer_creates_destination_and_paired_movements(self):
+        reference, movements = transfer_stock(self.org, [self.transfer(20)], user=self.admin)
+
+        self.inventory.refresh_from_db()
+        destination = Inventory.objects.get(product=self.product, location=self.store)
+        self.assertEqual(self.inventory.quantity, 30)
+        self.assertEqual(destination.quantity, 20)
+
+        paired = InventoryMovement.objects.filter(reference=reference, movement_type='transfer')
+        self.assertEqual(sorted(paired.values_list('quantity_change', flat=True)), [-20, 20])
+
+    def test_batch_is_all_or_nothing(self):
+        overflow = Location.objects.create(name='Overflow', organization=self.org)
+        with self.assertRaises(TransferError):
+            transfer_stock(self.org, [self.transfer(30), self.transfer(30, to_location=overflow)])
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 50)
+        self.assertFalse(InventoryMovement.objects.exists())
+
+    def test_held_units_are_not_transferred(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(reserved_quantity=30)
+        with self.assertRaises(TransferError):
+            transfer_stock(self.org, [self.transfer(21)])
+        transfer_stock(self.org, [self.transfer(20)])
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.quantity, self.inventory.reserved_quantity), (30, 30))
+
+    def test_rejects_foreign_location(self):
+        other_org = Organization.objects.create(name='Other Org', organization_type='supplier')
+        foreign = Location.objects.create(name='Foreign', organization=other_org)
+        with self.assertRaises(TransferError):
+            transfer_stock(self.org, [self.transfer(5, to_location=foreign)])
+        self.assertFalse(Inventory.objects.filter(location=foreign).exists())
+
+    def test_rejects_unknown_and_foreign_products(self):
+        other_org = Organization.objects.create(name='Other Org', organization_type='supplier')
+        foreign = Product.objects.create(name='Foreign', sku='FOR-001', price=Decimal('1.00'), cost=Decimal('1.00'), organization=other_org)
+        for product_id in (foreign.id, 999999):
+            with self.assertRaises(TransferError):
+                transfer_stock(self.org, [{**self.transfer(5), 'product_id': product_id}])
+        self.assertFalse(Inventory.objects.filter(location=self.store).exists())
+
+        response = self.client.post('/api/inventory/transfers/', {**self.transfer(5), 'product_id': 999999}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_destination_of_another_organization(self):
+        Inventory.objects.create(product=self.product, location=self.store, organization=None, quantity=0)
+        with self.assertRaises(TransferError):
+            transfer_stock(self.org, [self.transfer(5)])
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 50)
+
+    def test_batch_endpoint(self):
+        overflow = Location.objects.create(name='Overflow', organization=self.org)
+        response = self.client.post('/api/inventory/transfers/batch/', {
+            'transfers': [self.transfer(10), self.transfer(15, to_location=overflow)],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['transfers']), 2)
+        self.assertEqual(response.data['transfers'][1]['reference'], f"{response.data['reference']}-2")
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 25)
+
+    def test_single_endpoint_insufficient_stock(self):
+        response = self.client.post('/api/inventory/transfers/', self.transfer(51), format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AtomicStockMutationTests(StockTestMixin, TestCase):
+
+    def test_remove_stock_reports_affected_rows(self):
+        self.assertEqual(self.inventory.remove_stock(20), 1)
+        self.assertEqual(self.inventory.quantity, 30)
+        self.assertEqual(self.inventory.remove_stock(31), 0)
+        self.assertEqual(self.inventory.add_stock(5, reference='PO-1'), 1)
+        self.assertEqual(self.inventory.quantity, 35)
+
+        movements = InventoryMovement.objects.filter(inventory=self.inventory).order_by('id')
+        self.assertEqual([m.quantity_change for m in movements], [-20, 5])
+        self.assertEqual(movements[1].reference, 'PO-1')
+        self.assertEqual(movements[1].organization, self.org)
+
+    def test_stale_instance_cannot_oversell(self):
+        stale = Inventory.objects.get(pk=self.inventory.pk)
+        self.inventory.remove_stock(45)
+        # stale still believes 50 units are on hand
+        self.assertEqual(stale.remove_stock(10), 0)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 5)
+
+
+class ConcurrentStockMutationTests(StockTestMixin, TransactionTestCase):
+    """Hammers one inventory row from many threads and checks that no update is lost."""
+
+    threads = 8
+    operations_per_thread = 25
+
+    def run_concurrently(self, *operations):
+        """Run each operation operations_per_thread times per thread; return the summed results."""
+        def attempt(operation):
+            while True:
+                try:
+                    # Every attempt starts from a fresh (soon stale) read of the row
+                    return operation(Inventory.objects.get(pk=self.inventory.pk))
+                except OperationalError:
+                    # SQLite serialises writers with table locks; a failed statement is rolled back, retry it
+                    time.sleep(0.001)
+
+        def worker(_):
+            try:
+                return sum(attempt(operation) for _ in range(self.operations_per_thread) for operation in operations)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return sum(pool.map(worker, range(self.threads)))
+
+    def test_concurrent_additions_and_removals(self):
+        net_change = self.run_concurrently(
+            lambda inventory: 2 * inventory.add_stock(2),
+            lambda inventory: -inventory.remove_stock(1),
+        )
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(net_change, self.threads * self.operations_per_thread)
+        self.assertEqual(self.inventory.quantity, 50 + net_change)
+        movement_total = sum(InventoryMovement.objects.filter(inventory=self.inventory).values_list('quantity_change', flat=True))
+        self.assertEqual(movement_total, net_change)
+
+    def test_concurrent_removals_never_oversell(self):
+        sold = self.run_concurrently(lambda inventory: inventory.remove_stock(1))
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(sold, 50)
+        self.assertEqual(self.inventory.quantity, 0)
+
+
+class BuyerTestMixin(StockTestMixin):
+    """Adds buyer organizations with an accepted relationship to the supplier."""
+
+    def create_buyer(self, name):
+        organization = Organization.objects.create(name=name, organization_type='buyer')
+        OrganizationRelationship.objects.create(buyer_organization=organization, supplier_organization=self.org, status='accepted')
+        Location.objects.create(name='Receiving', organization=organization)
+        user = User.objects.create_user(
+            email=f'{name.lower().replace(" ", "")}@buyer.com', username=name.lower().replace(' ', '_'),
+            password='password', organization=organization, role='admin'
+        )
+        Buyer.objects.create(user=user, organization=organization, name=name, email=user.email, buyer_code=f'BUY-{organization.pk}')
+        client = APIClient()
+        client.force_authenticate(user)
+        client.user = user
+        return client
+
+    def add_to_cart(self, client, amount, action='add'):
+        return client.patch('/api/update-cart/', {'product_id': self.product.id, 'action': action, 'amount': amount}, format='json')
+
+    def checkout(self, client):
+        order = Order.objects.get(status='pending', customer__user=client.user)
+        return client.post('/api/process-order/', {'total': str(order.get_cart_total), 'shipping_info': {}, 'user_info': {}}, format='json')
+
+
+class StockReservationTests(BuyerTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer_a = self.create_buyer('Buyer A')
+        self.buyer_b = self.create_buyer('Buyer B')
+
+    def test_cart_holds_stock_against_other_buyers(self):
+        self.assertEqual(self.add_to_cart(self.buyer_a, 30).status_code, 200)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.quantity, self.inventory.reserved_quantity), (50, 30))
+
+        response = self.add_to_cart(self.buyer_b, 25)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.add_to_cart(self.buyer_b, 20).status_code, 200)
+
+    def test_removing_from_cart_releases_hold(self):
+        self.add_to_cart(self.buyer_a, 30)
+        self.add_to_cart(self.buyer_a, 10, action='remove')
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.reserved_quantity, 20)
+
+        self.add_to_cart(self.buyer_a, 20, action='remove')
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.reserved_quantity, 0)
+        self.assertFalse(StockReservation.objects.filter(status='active').exists())
+
+    def test_checkout_converts_holds_into_sales(self):
+        self.add_to_cart(self.buyer_a, 10)
+        response = self.checkout(self.buyer_a)
+        self.assertEqual(response.status_code, 200)
+
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.quantity, self.inventory.reserved_quantity), (40, 0))
+        self.assertEqual(StockReservation.objects.get().status, 'converted')
+        order = Order.objects.get(status='completed')
+        sale = InventoryMovement.objects.get(inventory=self.inventory, movement_type='sale')
+        self.assertEqual((sale.quantity_change, sale.reference), (-10, order.order_number))
+
+    def test_checkout_query_count_does_not_grow_with_lines(self):
+        other_supplier = Organization.objects.create(name='Other Supplier', organization_type='supplier')
+        other_location = Location.objects.create(name='Depot', organization=other_supplier)
+        OrganizationRelationship.objects.create(buyer_organization=self.buyer_b.user.organization, supplier_organization=other_supplier, status='accepted')
+        Inventory.objects.filter(pk=self.inventory.pk).update(min_stock_level=49)
+        products = [self.product]
+        for index in range(2):
+            product = Product.objects.create(name=f'Part {index}', sku=f'PRT-{index}', price=Decimal('2.00'), cost=Decimal('1.00'), organization=other_supplier)
+            Inventory.objects.create(product=product, location=other_location, organization=other_supplier, quantity=10, min_stock_level=9)
+            products.append(product)
+
+        def checkout(client, products):
+            for product in products:
+                client.patch('/api/update-cart/', {'product_id': product.id, 'action': 'add', 'amount': 2}, format='json')
+            # Low stock alerts, rankings and rollups run on commit, as part of the request
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.checkout(client).status_code, 200)
+            return len(queries)
+
+        self.assertEqual(checkout(self.buyer_a, products[:1]), checkout(self.buyer_b, products))
+        self.assertEqual(
+            list(Inventory.objects.filter(product__in=products, location__in=[self.location, other_location]).order_by('pk').values_list('quantity', 'reserved_quantity')),
+            [(46, 0), (8, 0), (8, 0)]
+        )
+        order = Order.objects.get(status='completed', customer__user=self.buyer_b.user)
+        self.assertEqual(
+            sorted(InventoryMovement.objects.filter(reference=order.order_number).values_list('movement_type', 'quantity_change')),
+            [('purchase', 2)] * 3 + [('sale', -2)] * 3
+        )
+
+    def test_adjustment_cannot_go_below_held_units(self):
+        self.add_to_cart(self.buyer_a, 30)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.patch(f'/api/inventory/{self.inventory.pk}/update/', {'quantity': 29}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 50)
+
+        response = client.patch(f'/api/inventory/{self.inventory.pk}/update/', {'quantity': 30}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.checkout(self.buyer_a).status_code, 200)
+
+    def test_sweeper_releases_expired_holds(self):
+        self.add_to_cart(self.buyer_a, 30)
+        self.add_to_cart(self.buyer_b, 20)
+        StockReservation.objects.filter(order_item__order__customer__user=self.buyer_a.user).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.reserved_quantity, 20)
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_expired_holds_are_reclaimed_when_stock_runs_short(self):
+        self.add_to_cart(self.buyer_a, 50)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.add_to_cart(self.buyer_b, 50).status_code, 200)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.reserved_quantity, 50)
+
+
+class AsyncReadViewTests(StockTestMixin, TransactionTestCase):
+    """The async endpoints run the sync views on a worker thread with its own connection"""
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_async_endpoints_match_sync_ones(self):
+        for path in ['products/', 'inventory/', 'inventory-movements/']:
+            sync_response = self.client.get(f'/api/{path}')
+            async_response = self.client.get(f'/api/async/{path}')
+            self.assertEqual(async_response.status_code, 200, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+
+    def test_async_endpoints_require_authentication(self):
+        response = APIClient().get('/api/async/inventory/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_async_endpoints_are_read_only(self):
+        response = self.client.post('/api/async/inventory/', {})
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(DATABASE_REPLICAS=[])  # Counts queries on the default connection
+class OrganizationContextTests(BuyerTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for index in range(5):
+            Product.objects.create(name=f'Gadget {index}', sku=f'GAD-{index}', price=Decimal('5.00'), cost=Decimal('2.00'), organization=self.org)
+        self.buyer = self.create_buyer('Buyer A')
+
+    def test_context_is_built_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.buyer.user
+        context = get_request_context(request)
+        self.assertIs(get_request_context(request), context)
+        self.assertTrue(context.is_buyer)
+        self.assertEqual(context.visible_supplier_ids, {self.org.id})
+
+        request.user = self.manager
+        self.assertFalse(get_request_context(request).is_buyer)
+
+    def test_supplier_relationships_are_looked_up_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.buyer.get('/api/products/')
+        self.assertEqual(len(response.json()), 6)
+        relationship_queries = [q for q in queries.captured_queries if 'organizationrelationship' in q['sql']]
+        self.assertEqual(len(relationship_queries), 1)
+
+    def test_relationship_request_records_the_requesting_user(self):
+        supplier = Organization.objects.create(name='Second Supplier', organization_type='supplier')
+        response = self.buyer.post('/api/relationships/request/', {'target_organization_id': supplier.pk}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        relationship = OrganizationRelationship.objects.get(supplier_organization=supplier)
+        self.assertEqual((relationship.buyer_organization, relationship.initiated_by), (self.buyer.user.organization, self.buyer.user))
+
+
+class ReplicaFlaggedView:
+    use_read_replica = True
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class DatabaseRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+
+    def route(self, method='get', view_class=ReplicaFlaggedView, write=False, cookies=None):
+        """Run the routing middleware around a fake view and return its read decisions"""
+        decisions = []
+
+        def view(request):
+            decisions.append(self.router.db_for_read(Product))
+            if write:
+                self.router.db_for_write(Product)
+            decisions.append(self.router.db_for_read(Product))
+            return HttpResponse()
+        view.view_class = view_class
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReadReplicaMiddleware(get_response)
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = middleware(request)
+        return decisions, response
+
+    def test_flagged_reads_use_replicas(self):
+        decisions, _ = self.route()
+        self.assertTrue(all(alias in ('replica1', 'replica2') for alias in decisions))
+
+    def test_unflagged_views_and_unsafe_methods_use_primary(self):
+        self.assertEqual(self.route(view_class=None)[0], ['default', 'default'])
+        self.assertEqual(self.route(method='post')[0], ['default', 'default'])
+
+    def test_write_pins_request_and_client_to_primary(self):
+        decisions, _ = self.route(write=True)
+        self.assertEqual(decisions[1], 'default')
+
+        _, response = self.route(method='post', view_class=None, write=True)
+        self.assertIn(ReadReplicaMiddleware.cookie_name, response.cookies)
+        decisions, _ = self.route(cookies={ReadReplicaMiddleware.cookie_name: '1'})
+        self.assertEqual(decisions, ['default', 'default'])
+
+    def test_state_does_not_leak_between_requests(self):
+        self.route(write=True)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertNotEqual(self.route()[0][0], 'default')
+
+    def test_relations_and_migrations(self):
+        on_primary, on_replica, elsewhere = Product(), Product(), Product()
+        on_primary._state.db, on_replica._state.db, elsewhere._state.db = 'default', 'replica1', 'other'
+        self.assertTrue(self.router.allow_relation(on_primary, on_replica))
+        self.assertFalse(self.router.allow_relation(on_primary, elsewhere))
+        self.assertFalse(self.router.allow_migrate('replica1', 'api'))
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "Set DATABASE_REPLICA_URLS to run the replica consistency suite")
+class ReadReplicaConsistencyTests(StockTestMixin, TransactionTestCase):
+    """
+    End to end routing against real replica connections, e.g.
+    DATABASE_REPLICA_URLS=sqlite:////tmp/replica1.sqlite3,sqlite:////tmp/replica2.sqlite3
+    python manage.py test api.tests.ReadReplicaConsistencyTests
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def capture(self):
+        return [CaptureQueriesContext(connections[alias]) for alias in ['default', *settings.DATABASE_REPLICAS]]
+
+    def queries(self, contexts):
+        primary, *replicas = contexts
+        return len(primary.captured_queries), sum(len(context.captured_queries) for context in replicas)
+
+    def run_captured(self, contexts, call):
+        for context in contexts:
+            context.__enter__()
+        try:
+            return call()
+        finally:
+            for context in reversed(contexts):
+                context.__exit__(None, None, None)
+
+    def test_list_views_read_from_replicas(self):
+        contexts = self.capture()
+        for path in ['/api/products/', '/api/inventory/', '/api/inventory-movements/']:
+            self.assertEqual(self.run_captured(contexts, lambda: self.client.get(path)).status_code, 200)
+        primary, replica = self.queries(contexts)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writes_stay_on_primary_and_reads_follow_them(self):
+        contexts = self.capture()
+        response = self.run_captured(
+            contexts, lambda: self.client.patch(f'/api/inventory/{self.inventory.pk}/update/', {'quantity': 80}, format='json')
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queries(contexts)[1], 0)
+
+        # The pin cookie keeps this client on the primary right after its write
+        contexts = self.capture()
+        response = self.run_captured(contexts, lambda: self.client.get('/api/inventory/'))
+        self.assertEqual(response.json()[0]['quantity'], 80)
+        self.assertEqual(self.queries(contexts)[1], 0)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class IndexAdvisorTests(TestCase):
+
+    def test_recommends_composite_index_for_unindexed_sort(self):
+        with QueryCapture() as capture:
+            list(Notification.objects.filter(notification_type='low_stock').order_by('timestamp'))
+        result = analyze(capture.queries, ['notifications'])
+        self.assertIn(
+            ('api.Notification', ['notification_type', 'timestamp'], {'notifications'}),
+            [(item['model'], item['fields'], item['sources']) for item in result['recommendations']]
+        )
+
+    def test_hot_endpoints_are_covered_and_dataset_rolled_back(self):
+        out = StringIO()
+        call_command('index_advisor', products=20, stdout=out)
+        self.assertIn("Missing composite indexes:\n  none", out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+@override_settings(DATABASE_REPLICAS=[])
+class QueryBudgetTests(TestCase):
+    """Every API endpoint runs the same number of queries with 10 and 1,000 products."""
+
+    def seed(self, products):
+        return prepare(generate_dataset(suppliers=2, buyers=2, products=products, locations=2, orders=2, movements=products))
+
+    def replay(self, products):
+        """Query count of every benchmark.endpoints() scenario against a fresh dataset, which is rolled back afterwards"""
+        counts = {}
+        # Invalidations only happen on commit, so entries cached by an earlier (rolled back) replay would be hit
+        cache.clear()
+        with transaction.atomic():
+            dataset = self.seed(products)
+            for label, method, path, user, data in benchmark.endpoints(dataset):
+                client = APIClient()
+                if user:
+                    client.force_authenticate(dataset[user])
+                # Like benchmark.measure(), every request sees the dataset as seeded
+                with transaction.atomic():
+                    response = getattr(client, method)(path, data, format='json')
+                    transaction.set_rollback(True)
+                self.assertLess(response.status_code, 400, f"{label}: {response.content[:500]}")
+                counts[label] = int(response[QueryBudgetMiddleware.header])
+            transaction.set_rollback(True)
+        return counts
+
+    def test_every_endpoint_declares_a_budget(self):
+        for pattern in api_urls.urlpatterns:
+            budget = get_query_budget(pattern.callback)
+            self.assertIsInstance(budget, QueryBudget, pattern.pattern)
+            if budget.is_exempt:
+                self.assertTrue(budget.reason, pattern.pattern)
+
+    def test_every_endpoint_is_replayed(self):
+        replayed = {benchmark.route(path) for _, _, path, _, _ in benchmark.endpoints(self.seed(1))}
+        untested = {
+            str(pattern.pattern) for pattern in api_urls.urlpatterns
+            if not get_query_budget(pattern.callback).is_exempt and not str(pattern.pattern).startswith('async/')
+        }
+        self.assertEqual(untested - replayed, set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.assertEqual(self.replay(10), self.replay(1000))
+
+    def test_budget_overrun_fails_the_request(self):
+        with patch.object(ProductAPIView, 'query_budget', QueryBudget(1)):
+            client = APIClient()
+            client.force_authenticate(seed_catalog(products=2)['supplier_admin'])
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'over its budget of 1'):
+                client.get('/api/products/')
+
+    @override_settings(QUERY_BUDGETS_RAISE=False)
+    def test_budget_overrun_is_logged_outside_tests(self):
+        with patch.object(ProductAPIView, 'query_budget', QueryBudget(1)):
+            client = APIClient()
+            client.force_authenticate(seed_catalog(products=2)['supplier_admin'])
+            with self.assertLogs('api.query_budget', 'WARNING') as logs:
+                response = client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('query_budget.exceeded', logs.output[0])
+
+    def test_middleware_serves_async_requests_without_an_adapter(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = QueryBudgetMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(response[QueryBudgetMiddleware.header], '0')
+
+    def test_budget_grows_with_page_size(self):
+        budget = QueryBudget(3, per_row=2)
+        self.assertEqual(budget.limit(), 3)
+        self.assertEqual(budget.limit(10), 23)
+        self.assertIsNone(QueryBudget.exempt('broken').limit(10))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class PerformanceMetricsTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        REGISTRY.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def server_timing(self, response):
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_header(self):
+        self.admin.is_staff = True
+        self.admin.save()
+        response = self.client.get('/api/products/')
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'total', 'size'})
+        self.assertEqual(timing['db']['desc'], f'"{response[QueryBudgetMiddleware.header]} queries"')
+        self.assertEqual(timing['size']['desc'], f'"{len(response.content)} bytes"')
+        self.assertEqual(timing['total']['desc'], '"api:api.views.ProductAPIView"')
+        self.assertGreater(float(timing['serialize']['dur']), 0)
+        self.assertGreater(float(timing['render']['dur']), 0)
+        self.assertGreaterEqual(float(timing['total']['dur']), float(timing['db']['dur']))
+
+    def test_server_timing_is_only_sent_to_staff_or_under_debug(self):
+        self.assertFalse(self.client.get('/api/products/').has_header('Server-Timing'))
+        with override_settings(DEBUG=True):
+            self.assertTrue(self.client.get('/api/products/').has_header('Server-Timing'))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint_aggregates_per_view(self):
+        for _ in range(2):
+            self.client.get('/api/products/')
+        self.client.get('/api/locations/')
+
+        body = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        labels = 'view="api:api.views.ProductAPIView",method="GET"'
+        self.assertIn(f'stocksync_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'stocksync_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'stocksync_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn('stocksync_db_queries_total{view="api:location-list-create"} 1', body)
+        self.assertIn('# TYPE stocksync_response_bytes_total counter', body)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint_requires_the_token(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 404)
+        self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_endpoint_is_not_served_without_a_token(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 404)
+
+
+class StructuredLoggingTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.logger = logging.getLogger('api.tests.structured')
+        self.stream = StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(JSONFormatter())
+        handler.addFilter(RequestIDFilter())
+        self.logger.addHandler(handler)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.log = get_logger('api.tests.structured')
+
+    def test_disabled_or_sampled_out_records_evaluate_nothing(self):
+        expensive = Mock(return_value=1)
+        self.logger.setLevel(logging.INFO)
+        self.log.debug('event', value=expensive)
+        self.logger.setLevel(logging.DEBUG)
+        with log_sampling(False):
+            self.log.debug('event', value=expensive)
+            self.log.info('kept', value=2)
+        expensive.assert_not_called()
+        self.assertEqual([json.loads(line)['event'] for line in self.stream.getvalue().splitlines()], ['kept'])
+
+    def test_records_are_json_with_request_id_and_lazy_fields(self):
+        self.logger.setLevel(logging.DEBUG)
+        self.log.debug('cart.updated', order_id=7, total=lambda: Decimal('12.50'))
+        record = json.loads(self.stream.getvalue())
+        self.assertEqual(record['event'], 'cart.updated')
+        self.assertEqual(record['level'], 'DEBUG')
+        self.assertEqual(record['order_id'], 7)
+        self.assertEqual(record['total'], '12.50')
+        self.assertIsNone(record['request_id'])
+
+    def test_requests_get_an_id(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/locations/')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+        response = client.get('/api/locations/', HTTP_X_REQUEST_ID='edge-1234')
+        self.assertEqual(response['X-Request-ID'], 'edge-1234')
+        response = client.get('/api/locations/', HTTP_X_REQUEST_ID='bad id\n')
+        self.assertNotEqual(response['X-Request-ID'], 'bad id\n')
+
+    def test_product_rows_run_no_logging_queries_when_debug_is_disabled(self):
+        buyer = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        OrganizationRelationship.objects.create(buyer_organization=buyer, supplier_organization=self.org, status='accepted')
+        request = RequestFactory().get('/api/products/')
+        request.user = User.objects.create_user(email='buyer@buyer.com', username='buyer', password='password', organization=buyer, role='admin')
+        products = list(Product.objects.with_listing_data())
+        BuyerSupplierProductSerializer(products, many=True, context={'request': request}).data
+        with self.assertNumQueries(0):
+            data = BuyerSupplierProductSerializer(products, many=True, context={'request': request}).data
+        self.assertTrue(data[0]['is_available'])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_logging', products=5, repeat=1, stdout=out)
+        self.assertIn('DEBUG sampled out', out.getvalue())
+        self.assertFalse(Product.objects.exclude(pk=self.product.pk).exists())
+
+
+class DataGeneratorTests(TestCase):
+    sizes = {'suppliers': 2, 'buyers': 3, 'products': 5, 'orders': 2, 'movements': 50}
+
+    def snapshot(self):
+        with transaction.atomic():
+            generate_dataset(**self.sizes, seed=7)
+            rows = (
+                list(Product.objects.order_by('sku').values_list('sku', 'price', 'category__name', 'brand__name', 'active')),
+                list(InventoryMovement.objects.order_by('reference').values_list('reference', 'quantity_change', 'movement_type', 'inventory__product__sku')),
+                list(OrderItem.objects.order_by('order__order_number', 'product__sku').values_list('order__order_number', 'product__sku', 'quantity')),
+                list(OrganizationRelationship.objects.order_by('buyer_organization__name', 'supplier_organization__name').values_list('buyer_organization__name', 'supplier_organization__name')),
+            )
+            transaction.set_rollback(True)
+        return rows
+
+    def test_same_seed_generates_the_same_data(self):
+        self.assertEqual(self.snapshot(), self.snapshot())
+
+    def test_generated_counts(self):
+        dataset = generate_dataset(**self.sizes, seed=1)
+        self.assertEqual(dataset['counts']['products'], 10)
+        self.assertEqual(dataset['counts']['inventory'], 30)
+        self.assertEqual(InventoryMovement.objects.filter(organization__in=dataset['suppliers']).count(), 50)
+        self.assertEqual(OrganizationRelationship.objects.filter(buyer_organization=dataset['buyer_organization']).count(), 2)
+        self.assertEqual(Order.objects.filter(customer=dataset['buyer'], status='pending').count(), 1)
+        self.assertTrue(ProductImage.objects.filter(product__organization=dataset['supplier']).exists())
+
+    def test_generate_data_command(self):
+        out = StringIO()
+        call_command('generate_data', suppliers=1, buyers=1, products=3, movements=10, seed=4, stdout=out)
+        self.assertIn("Generated dataset 'gen4'", out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'already exists'):
+            call_command('generate_data', suppliers=1, buyers=1, seed=4, stdout=StringIO())
+
+    def test_every_endpoint_is_benchmarked(self):
+        dataset = prepare(generate_dataset(**self.sizes))
+        benchmarked = {benchmark.route(path) for _, _, path, _, _ in benchmark.endpoints(dataset)}
+        routes = {str(pattern.pattern) for pattern in api_urls.urlpatterns}
+        self.assertEqual(routes - benchmarked, set(benchmark.skipped_routes()))
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4, 5], 100), 5)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+
+    def test_benchmark_endpoints_compares_runs(self):
+        options = {**self.sizes, 'runs': 2, 'only': 'brand', 'stdout': StringIO()}
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_file = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_endpoints', output=baseline_file, **options)
+            with open(baseline_file) as stream:
+                baseline = json.load(stream)
+            self.assertEqual(set(baseline['results']), {'brands', 'brand detail', 'create brand', 'update brand'})
+            self.assertEqual(baseline['results']['brands']['queries'], 1)
+            self.assertFalse(Organization.objects.exists())
+
+            baseline['results']['brands']['queries'] = 0
+            with open(baseline_file, 'w') as stream:
+                json.dump(baseline, stream)
+            with self.assertRaisesMessage(CommandError, 'Regressed: brands'):
+                call_command('benchmark_endpoints', compare=baseline_file, fail_on_regression=True, threshold=1000, **options)
+
+
+class LoadReplayTests(TransactionTestCase):
+    """Simulated buyers racing for a little shared stock through the cart and checkout endpoints"""
+
+    def test_concurrent_checkouts_never_oversell(self):
+        dataset = load_replay.prepare(buyers=6, products=2, stock=5, seed=3)
+        report = load_replay.run_load(dataset, workers=4, iterations=3, seed=3)
+
+        self.assertEqual(set(report['operations']), {'add to cart', 'cart', 'checkout'})
+        self.assertEqual(report['requests'], sum(stats['requests'] for stats in report['operations'].values()))
+        self.assertGreater(report['checkouts'], 0)
+        for product in report['stock']:
+            self.assertEqual(product['oversold'], 0, product)
+            self.assertTrue(product['consistent'], product)
+            self.assertLessEqual(product['sold'], 5)
+
+    def test_command_reports_and_cleans_up(self):
+        out = StringIO()
+        call_command('load_replay', buyers=3, workers=2, iterations=2, products=1, stock=4, stdout=out)
+        self.assertIn('checkouts', out.getvalue())
+        self.assertIn('Deadlocks / lock timeouts:', out.getvalue())
+        self.assertFalse(Organization.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+
+class PotentialSupplierDiscoveryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        self.user = User.objects.create_user(email='admin@buyer.com', username='buyer_admin', password='password', organization=self.buyer, role='admin')
+        self.suppliers = {
+            name: Organization.objects.create(name=name, organization_type=kind)
+            for name, kind in [
+                ('Acme Supplies', 'supplier'), ('acme outlet', 'both'), ('Beta Goods', 'supplier'),
+                ('Gamma Trading', 'supplier'), ('Delta Wholesale', 'supplier'), ('Other Buyer', 'buyer'),
+            ]
+        }
+        OrganizationRelationship.objects.create(buyer_organization=self.buyer, supplier_organization=self.suppliers['Gamma Trading'], status='accepted')
+        OrganizationRelationship.objects.create(buyer_organization=self.buyer, supplier_organization=self.suppliers['Delta Wholesale'], status='rejected')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, path='/api/potential-suppliers/'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [organization['name'] for organization in response.data['results']]
+
+    def test_excludes_related_suppliers_in_one_query(self):
+        with self.assertNumQueries(1):
+            names = [organization.name for organization in potential_suppliers(self.buyer).order_by('name')]
+        self.assertEqual(names, ['Acme Supplies', 'Beta Goods', 'acme outlet'])
+        self.assertEqual(self.names(), ['Acme Supplies', 'Beta Goods', 'acme outlet'])
+
+    def test_name_prefix_search_ignores_case(self):
+        self.assertEqual(self.names('/api/potential-suppliers/?q=ACME'), ['Acme Supplies', 'acme outlet'])
+        self.assertEqual(self.names('/api/potential-suppliers/?q=gamma'), [])
+        self.assertEqual(self.names('/api/potential-suppliers/?q=supplies'), [])
+
+    def test_keyset_pages(self):
+        for index in range(7):
+            Organization.objects.create(name=f'Zeta {index}', organization_type='supplier')
+        names, path = [], '/api/potential-suppliers/?page_size=4'
+        while path:
+            response = self.client.get(path)
+            self.assertLessEqual(len(response.data['results']), 4)
+            names += [organization['name'] for organization in response.data['results']]
+            path = response.data['next']
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 10)
+
+    def test_cached_per_buyer_until_a_relationship_is_created(self):
+        self.names()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Acme Supplies', 'Beta Goods', 'acme outlet'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrganizationRelationship.objects.create(buyer_organization=self.buyer, supplier_organization=self.suppliers['Beta Goods'])
+        self.assertEqual(self.names(), ['Acme Supplies', 'acme outlet'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Organization.objects.create(name='Epsilon Imports', organization_type='supplier')
+        self.assertEqual(self.names(), ['Acme Supplies', 'Epsilon Imports', 'acme outlet'])
+
+    def test_suppliers_get_no_results(self):
+        self.client.force_authenticate(User.objects.create_user(
+            email='admin@acme.com', username='acme_admin', password='password',
+            organization=self.suppliers['Acme Supplies'], role='admin'
+        ))
+        self.assertEqual(self.names(), [])
+
+class RelationshipBatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        self.user = User.objects.create_user(email='admin@buyer.com', username='buyer_admin', password='password', organization=self.buyer, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def suppliers(self, count, prefix='Supplier'):
+        return Organization.objects.bulk_create([
+            Organization(name=f'{prefix} {index}', organization_type='supplier') for index in range(count)
+        ])
+
+    def request_batch(self, target_ids):
+        return self.client.post('/api/relationships/request/batch/', {'target_organization_ids': target_ids}, format='json')
+
+    def test_request_batch_skips_invalid_targets(self):
+        related, new, other_new = self.suppliers(3)
+        other_buyer = Organization.objects.create(name='Other Buyer', organization_type='buyer')
+        OrganizationRelationship.objects.create(buyer_organization=self.buyer, supplier_organization=related, status='rejected')
+
+        response = self.request_batch([new.pk, related.pk, other_buyer.pk, self.buyer.pk, 999999, new.pk, other_new.pk])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['supplier_organization'] for row in response.data['created']], ['Supplier 1', 'Supplier 2'])
+        self.assertTrue(all(row['status'] == 'pending' and row['initiated_by'] == self.user.email for row in response.data['created']))
+        self.assertEqual(
+            [row['target_organization_id'] for row in response.data['skipped']],
+            [related.pk, other_buyer.pk, self.buyer.pk, 999999]
+        )
+        self.assertEqual(OrganizationRelationship.objects.filter(buyer_organization=self.buyer, status='pending').count(), 2)
+
+        response = self.request_batch([new.pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], [])
+
+    def test_request_batch_queries_do_not_grow_with_targets(self):
+        small = self.request_batch([organization.pk for organization in self.suppliers(2, 'Small')])
+        large = self.request_batch([organization.pk for organization in self.suppliers(100, 'Large')])
+        self.assertEqual(len(large.data['created']), 100)
+        self.assertEqual(small[QueryBudgetMiddleware.header], large[QueryBudgetMiddleware.header])
+
+    def test_request_batch_invalidates_discovery_once(self):
+        targets = self.suppliers(3)
+        self.client.get('/api/potential-suppliers/')
+        with patch('api.signals.invalidate_potential_suppliers', wraps=invalidate_potential_suppliers) as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.request_batch([organization.pk for organization in targets[:2]])
+        invalidate.assert_called_once_with({self.buyer.pk})
+        response = self.client.get('/api/potential-suppliers/')
+        self.assertEqual([organization['name'] for organization in response.data['results']], ['Supplier 2'])
+
+    def test_supplier_answers_pending_requests_in_one_batch(self):
+        supplier = self.suppliers(1)[0]
+        supplier_admin = User.objects.create_user(email='admin@supplier.com', username='supplier_admin', password='password', organization=supplier, role='admin')
+        incoming = [
+            OrganizationRelationship.objects.create(
+                buyer_organization=Organization.objects.create(name=f'Buyer {index}', organization_type='buyer'),
+                supplier_organization=supplier, initiated_by=self.user
+            )
+            for index in range(3)
+        ]
+        outgoing = OrganizationRelationship.objects.create(buyer_organization=self.buyer, supplier_organization=supplier, initiated_by=supplier_admin)
+        incoming[2].status = 'rejected'
+        incoming[2].save()
+        unrelated = OrganizationRelationship.objects.create(
+            buyer_organization=self.buyer, supplier_organization=self.suppliers(1, 'Unrelated')[0], initiated_by=self.user
+        )
+
+        self.client.force_authenticate(supplier_admin)
+        ids = [relationship.pk for relationship in (*incoming, outgoing, unrelated)]
+        response = self.client.post('/api/relationships/update/batch/', {'ids': ids, 'status': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['updated']], [incoming[0].pk, incoming[1].pk])
+        self.assertEqual([row['id'] for row in response.data['skipped']], [incoming[2].pk, outgoing.pk, unrelated.pk])
+        self.assertEqual(
+            list(OrganizationRelationship.objects.filter(pk__in=ids).order_by('pk').values_list('status', flat=True)),
+            ['accepted', 'accepted', 'rejected', 'pending', 'pending']
+        )
+
+        response = self.client.post('/api/relationships/update/batch/', {'ids': ids, 'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(DATABASE_REPLICAS=[])
+class CategoryTreeTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.apparel = Category.objects.create(name='Apparel', organization=self.org)
+        self.shirts = Category.objects.create(name='Shirts', parent=self.apparel, organization=self.org)
+        self.polos = Category.objects.create(name='Polos', parent=self.shirts, organization=self.org)
+        self.tools = Category.objects.create(name='Tools', organization=self.org)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def paths(self):
+        return {category.name: category.path for category in Category.objects.all()}
+
+    def test_paths_follow_moves_and_deletes(self):
+        a, s, p, t = self.apparel.pk, self.shirts.pk, self.polos.pk, self.tools.pk
+        self.assertEqual(self.paths(), {'Apparel': f'{a}/', 'Shirts': f'{a}/{s}/', 'Polos': f'{a}/{s}/{p}/', 'Tools': f'{t}/'})
+
+        response = self.client.patch(f'/api/categories/{s}/', {'name': 'Shirts', 'parent': t}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.paths(), {'Apparel': f'{a}/', 'Shirts': f'{t}/{s}/', 'Polos': f'{t}/{s}/{p}/', 'Tools': f'{t}/'})
+
+        self.tools.delete()
+        self.assertEqual(self.paths(), {'Apparel': f'{a}/', 'Shirts': f'{s}/', 'Polos': f'{s}/{p}/'})
+
+    def test_cannot_move_under_own_subtree(self):
+        response = self.client.patch(f'/api/categories/{self.apparel.pk}/', {'name': 'Apparel', 'parent': self.polos.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.apparel.parent = self.polos
+        with self.assertRaises(ValueError):
+            self.apparel.save()
+        self.apparel.refresh_from_db()
+        self.assertIsNone(self.apparel.parent_id)
+
+    def test_subtree_filter_is_an_index_range(self):
+        for index, category in enumerate([self.apparel, self.shirts, self.polos, self.tools, None]):
+            Product.objects.create(name=f'Item {index}', sku=f'ITEM-{index}', price=Decimal('1.00'), cost=Decimal('0.50'), organization=self.org, category=category)
+        self.assertIn('api_category_path', Category.objects.subtree(self.shirts).explain())
+
+        response = self.client.get(f'/api/products/filter/?category={self.shirts.pk}')
+        self.assertEqual([product['name'] for product in response.json()], ['Item 1', 'Item 2'])
+        response = self.client.get(f'/api/products/filter/?category={self.apparel.pk}')
+        self.assertEqual([product['name'] for product in response.json()], ['Item 0', 'Item 1', 'Item 2'])
+
+    def test_tree_and_breadcrumbs(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/categories/tree/')
+
+        def names(nodes):
+            return [(node['name'], names(node['children'])) for node in nodes]
+        self.assertEqual(names(response.json()), [('Apparel', [('Shirts', [('Polos', [])])]), ('Tools', [])])
+
+        response = self.client.get(f'/api/categories/{self.polos.pk}/breadcrumbs/')
+        self.assertEqual([crumb['name'] for crumb in response.json()], ['Apparel', 'Shirts', 'Polos'])
+
+@override_settings(DATABASE_REPLICAS=[])
+class ProductFacetTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.acme = Brand.objects.create(name='Acme', organization=self.org)
+        self.tools = Category.objects.create(name='Tools', organization=self.org)
+        self.product.brand, self.product.category = self.acme, self.tools
+        self.product.save()
+        for name, sku, price, brand in (('Gadget', 'GAD-001', '30.00', self.acme), ('Gizmo', 'GIZ-001', '600.00', None)):
+            Product.objects.create(name=name, sku=sku, price=Decimal(price), cost=Decimal('1.00'), organization=self.org, brand=brand)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def names(self, query):
+        response = self.client.get(f'/api/products/filter/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()]
+
+    def test_filters_on_price_brand_and_stock(self):
+        self.assertEqual(self.names('min_price=20&max_price=700'), ['Gadget', 'Gizmo'])
+        self.assertEqual(self.names(f'brand={self.acme.pk}'), ['Gadget', 'Widget'])
+        self.assertEqual(self.names('in_stock=true'), ['Widget'])
+        self.assertEqual(self.names('in_stock=false'), ['Gadget', 'Gizmo'])
+
+    def test_facet_counts(self):
+        response = self.client.get('/api/products/filter/?facets=1&max_price=100')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Gadget', 'Widget'])
+        facets = response.data['facets']
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['in_stock'], 1)
+        self.assertEqual([(row['name'], row['count']) for row in facets['brands']], [('Acme', 2)])
+        self.assertEqual({row['name']: row['count'] for row in facets['categories']}, {None: 1, 'Tools': 1})
+        self.assertEqual([(row['name'], row['count']) for row in facets['suppliers']], [('Supplier Org', 2)])
+        self.assertEqual(
+            [(bucket['min'], bucket['count']) for bucket in facets['price'] if bucket['count']],
+            [('10.00', 1), ('25.00', 1)]
+        )
+
+        response = self.client.get('/api/products/filter/?facets=1&max_price=100&page_size=1')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Gadget'])
+        self.assertEqual(response.data['facets'], facets)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([product['name'] for product in response.data['results']], ['Widget'])
+
+    def test_facets_are_grouped_queries_cached_until_the_catalog_changes(self):
+        list_only = int(self.client.get('/api/products/filter/?min_price=1')[QueryBudgetMiddleware.header])
+        first = self.client.get('/api/products/filter/?facets=1&min_price=1')
+        self.assertEqual(int(first[QueryBudgetMiddleware.header]), list_only + 4)
+        cached = self.client.get('/api/products/filter/?facets=1&min_price=1')
+        self.assertEqual(int(cached[QueryBudgetMiddleware.header]), list_only)
+        self.assertEqual(cached.data['facets'], first.data['facets'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inventory.quantity = 0
+            self.inventory.save()
+        self.assertEqual(self.client.get('/api/products/filter/?facets=1&min_price=1').data['facets']['in_stock'], 0)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ProductRankingTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gadget = Product.objects.create(name='Gadget', sku='GAD-001', price=Decimal('30.00'), cost=Decimal('1.00'), organization=self.org)
+            self.gizmo = Product.objects.create(name='Gizmo', sku='GIZ-001', price=Decimal('5.00'), cost=Decimal('1.00'), organization=self.org)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def sell(self, product, quantity, days_ago=0):
+        order = Order.objects.create(status='pending')
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price,
+                                 subtotal=product.price * quantity, organization=self.org)
+        Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        order.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def names(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()]
+
+    def test_rankings_follow_sales_and_stock(self):
+        self.assertEqual(ProductRanking.objects.count(), 3)
+        self.sell(self.gadget, 3, days_ago=60)
+        self.sell(self.gizmo, 2)
+        gadget, gizmo = self.gadget.ranking, self.gizmo.ranking
+        gadget.refresh_from_db()
+        gizmo.refresh_from_db()
+        self.assertEqual((gadget.units_sold, gadget.recent_units), (3, 0))
+        self.assertEqual((gizmo.units_sold, gizmo.recent_units), (2, 2))
+
+        self.inventory.reserved_quantity = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inventory.save()
+        self.assertEqual(ProductRanking.objects.get(product=self.product).available, 40)
+
+    def test_reservations_refresh_availability(self):
+        order = Order.objects.create(status='pending')
+        item = OrderItem.objects.create(order=order, product=self.product, quantity=5, unit_price=self.product.price,
+                                        subtotal=self.product.price * 5, organization=self.org)
+        ranking = self.product.ranking
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(item, 5)
+        ranking.refresh_from_db()
+        self.assertEqual(ranking.available, 45)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservations(item, 2)
+        ranking.refresh_from_db()
+        self.assertEqual(ranking.available, 47)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_reservations(now=timezone.now() + timedelta(days=1))
+        ranking.refresh_from_db()
+        self.assertEqual(ranking.available, 50)
+
+    def test_sort_orders(self):
+        self.sell(self.gadget, 3, days_ago=60)
+        self.sell(self.gizmo, 2)
+        self.assertEqual(self.names('ordering=popular'), ['Gadget', 'Gizmo', 'Widget'])
+        # Ties are broken by id
+        self.assertEqual(self.names('ordering=trending'), ['Gizmo', 'Widget', 'Gadget'])
+        self.assertEqual(self.names('ordering=availability'), ['Widget', 'Gadget', 'Gizmo'])
+        self.assertEqual(self.names('ordering=-price'), ['Gadget', 'Widget', 'Gizmo'])
+        self.assertEqual(self.names('ordering=unknown'), ['Gadget', 'Gizmo', 'Widget'])
+
+    def test_keyset_pages_of_a_sort_order(self):
+        self.sell(self.gadget, 3)
+        response = self.client.get('/api/products/?ordering=popular&page_size=2')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Gadget', 'Widget'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([product['name'] for product in response.data['results']], ['Gizmo'])
+        self.assertIsNone(response.data['next'])
+
+    def test_refresh_command_rebuilds_missing_rankings(self):
+        ProductRanking.objects.all().delete()
+        out = StringIO()
+        call_command('refresh_product_rankings', organization=self.org.pk, stdout=out)
+        self.assertIn('Refreshed the rankings of 3 products.', out.getvalue())
+        self.assertEqual(ProductRanking.objects.get(product=self.product).available, 50)
+
+
+def encoded_image(size, mode='RGB', format='PNG'):
+    buffer = io.BytesIO()
+    PILImage.new(mode, size, (200, 40, 40, 128) if mode == 'RGBA' else (200, 40, 40)).save(buffer, format)
+    return buffer.getvalue()
+
+
+@override_settings(DATABASE_REPLICAS=[], IMAGE_VARIANT_WORKERS=0)
+class ImageVariantTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.storage = ProductImage._meta.get_field('image').storage
+
+    def test_upload_generates_variants_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product, color='red', image=SimpleUploadedFile('red.png', encoded_image((1000, 500)))
+            )
+        image.refresh_from_db()
+        root = image.image.name.removesuffix('.png')
+        self.assertEqual(image.image_variants['source'], image.image.name)
+        self.assertEqual(image.image_variants['srcset'], {
+            'image/webp': [[160, f'{root}__thumbnail.webp'], [640, f'{root}__medium.webp']],
+            'image/jpeg': [[160, f'{root}__thumbnail.jpg'], [640, f'{root}__medium.jpg']],
+        })
+        with self.storage.open(f'{root}__thumbnail.webp') as file, PILImage.open(file) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (160, 80)))
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        srcset = client.get('/api/products/').json()[0]['images'][0]['srcset']
+        self.assertEqual(srcset['image/webp'], (
+            f'{settings.MEDIA_URL}{root}__thumbnail.webp 160w, {settings.MEDIA_URL}{root}__medium.webp 640w'
+        ))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=1)
+    def test_queued_variants_are_stored_in_the_tenant_context(self):
+        stored = []
+
+        def store(model, pk, name, rendered):
+            stored.append((threading.current_thread().name, get_current_organization().id, pk, len(rendered)))
+
+        with patch('api.images.store_variants', store):
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(
+                    product=self.product, color='red', image=SimpleUploadedFile('red.png', encoded_image((200, 100)))
+                )
+            # The queue has one thread, so this job runs after the image's
+            images._get_queue().submit(lambda: None).result()
+        [(thread, organization_id, pk, variants)] = stored
+        self.assertTrue(thread.startswith('image-variants'))
+        self.assertEqual((organization_id, pk, variants), (self.org.id, image.pk, 4))
+
+    def test_small_and_transparent_images(self):
+        rendered = render_variants(encoded_image((100, 50), mode='RGBA'))
+        self.assertEqual(
+            [(variant, width, mime) for variant, width, mime, _, _ in rendered],
+            [('thumbnail', 100, 'image/webp'), ('thumbnail', 100, 'image/png'),
+             ('medium', 100, 'image/webp'), ('medium', 100, 'image/png')]
+        )
+
+    def test_stale_variants_are_not_served(self):
+        self.product.image_variants = {'source': 'products/old.png', 'srcset': {'image/webp': [[160, 'products/old__thumbnail.webp']]}}
+        self.product.image = 'products/new.png'
+        self.assertEqual(image_srcset(self.product.image, self.product.image_variants), {})
+
+    def test_backfill_command_skips_generated_and_missing_images(self):
+        Product.objects.filter(pk=self.product.pk).update(image=self.storage.save('products/widget.jpg', ContentFile(encoded_image((300, 300), format='JPEG'))))
+        ProductImage.objects.bulk_create([ProductImage(product=self.product, color='gone', image='images/variants/gone.png')])
+
+        out = StringIO()
+        call_command('generate_image_variants', workers=1, stdout=out)
+        self.assertIn('Image variants generated for 1 images.', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_variants['srcset']['image/jpeg'][1], [300, 'products/widget__medium.jpg'])
+        self.assertTrue(self.storage.exists('products/widget__medium.jpg'))
+
+        call_command('generate_image_variants', workers=1, stdout=out)
+        self.assertIn('Image variants generated for 0 images.', out.getvalue())
+
+
+def ndjson(*rows):
+    return b''.join(json.dumps(row).encode() + b'\n' for row in rows)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class CatalogImportTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.shirts = Category.objects.create(name='Shirts', organization=self.org)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, name, content, **data):
+        response = self.client.post('/api/products/imports/', {'file': SimpleUploadedFile(name, content), **data}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def run_imports(self, **kwargs):
+        return {catalog_import.pk: catalog_import for catalog_import in run_pending_imports(**kwargs)}
+
+    def test_ndjson_upserts_products_with_sizes_and_images(self):
+        other = Organization.objects.create(name='Other Supplier', organization_type='supplier')
+        Product.objects.create(name='Taken', sku='TAKEN-1', price=Decimal('1.00'), cost=Decimal('1.00'), organization=other)
+        queued = self.upload('catalog.ndjson', ndjson(
+            {'sku': 'WID-001', 'name': 'Widget v2', 'price': '12.00', 'cost': '6.50', 'sizes': ['S', 'M']},
+            {'sku': 'TEE-1', 'name': 'Tee', 'price': '9.99', 'cost': '4', 'brand': 'Acme', 'category': 'Shirts',
+             'images': [{'color': 'red', 'image': 'images/variants/tee-red.jpg', 'default': True}]},
+            {'sku': 'TEE-1', 'name': 'Tee again', 'price': '9.99', 'cost': '4'},
+            {'sku': 'TAKEN-1', 'name': 'Mine', 'price': '1', 'cost': '1'},
+            {'sku': 'BAD-1', 'name': 'Bad', 'price': 'free', 'cost': '1', 'category': 'Hats'},
+        ) + b'{not json\n')
+        self.assertEqual((queued['status'], queued['format']), ('pending', 'ndjson'))
+
+        catalog_import = self.run_imports()[queued['id']]
+        self.assertEqual(catalog_import.status, 'completed')
+        self.assertEqual(
+            (catalog_import.processed_rows, catalog_import.created_products, catalog_import.updated_products, catalog_import.failed_rows),
+            (6, 1, 1, 4)
+        )
+        self.assertEqual(
+            [(error['row'], list(error['errors'])) for error in catalog_import.errors],
+            [(3, ['sku']), (5, ['price']), (6, ['non_field_errors']), (4, ['sku'])]
+        )
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price), ('Widget v2', Decimal('12.00')))
+        self.assertEqual(sorted(self.product.sizes.values_list('size__name', flat=True)), ['M', 'S'])
+        tee = Product.objects.get(sku='TEE-1')
+        self.assertEqual((tee.organization, tee.brand.name, tee.category), (self.org, 'Acme', self.shirts))
+        self.assertEqual(list(tee.images.values_list('color', 'image', 'default')), [('red', 'images/variants/tee-red.jpg', True)])
+        self.assertTrue(ProductRanking.objects.filter(product=tee).exists())
+
+        response = self.client.get(f"/api/products/imports/{queued['id']}/")
+        self.assertEqual((response.data['status'], response.data['created_products']), ('completed', 1))
+
+    def test_csv_reimport_replaces_sizes_and_keeps_unchanged_images(self):
+        header = b'sku,name,price,cost,sizes,images\n'
+        self.upload('catalog.csv', header + b'WID-001,Widget,10.00,6.00,S|M,red=images/variants/r.jpg|blue=images/variants/b.jpg\n')
+        self.run_imports()
+        red = self.product.images.get(color='red')
+
+        self.upload('catalog.csv', header + b'WID-001,Widget,10.00,6.00,L,blue=images/variants/b.jpg|red=images/variants/r.jpg\n')
+        self.run_imports()
+        self.assertEqual(list(self.product.sizes.values_list('size__name', flat=True)), ['L'])
+        self.assertEqual(self.product.images.get(color='red').pk, red.pk)
+        self.assertEqual(self.product.images.get(default=True).color, 'blue')
+
+    def test_chunks_are_set_based(self):
+        def queries(count):
+            rows = ndjson(*[
+                {'sku': f'SKU-{count}-{i}', 'name': f'Product {i}', 'price': '1', 'cost': '1', 'brand': f'Brand {count}-{i % 3}',
+                 'category': 'Shirts', 'sizes': [f'S{count}'], 'images': [{'color': 'red', 'image': f'images/variants/{count}-{i}.jpg'}]}
+                for i in range(count)
+            ])
+            importer = CatalogImporter(self.org, chunk_size=1000)
+            with CaptureQueriesContext(connection) as context:
+                importer.run(read_rows(io.BytesIO(rows), 'ndjson'))
+            self.assertEqual(importer.created, count)
+            return len(context.captured_queries)
+
+        # Within one insert batch of SQLite (999 parameters), which splits larger ones
+        self.assertEqual(queries(5), queries(50))
+
+    def test_progress_is_reported_per_chunk(self):
+        queued = self.upload('catalog.jsonl', ndjson(*[{'sku': f'SKU-{i}', 'name': 'P', 'price': '1', 'cost': '1'} for i in range(5)]))
+        reports = []
+        with patch('api.catalog_import._report', side_effect=lambda catalog_import, importer: reports.append(importer.processed)):
+            self.run_imports(chunk_size=2)
+        self.assertEqual(reports, [2, 4, 5, 5])
+        self.assertEqual(CatalogImport.objects.get(pk=queued['id']).status, 'completed')
+
+    def test_unknown_format_is_rejected_and_command_reports(self):
+        response = self.client.post('/api/products/imports/', {'file': SimpleUploadedFile('catalog.txt', b'x')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('format', response.data)
+
+        self.upload('catalog.txt', ndjson({'sku': 'N-1', 'name': 'N', 'price': '1', 'cost': '1'}), format='ndjson')
+        out = StringIO()
+        call_command('run_catalog_imports', stdout=out)
+        self.assertIn('1 created, 0 updated, 0 failed', out.getvalue())
+        self.assertEqual([row['status'] for row in self.client.get('/api/products/imports/').data], ['completed'])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SalesRollupTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer_org = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        self.buyer_admin = User.objects.create_user(email='admin@buyer.com', username='buyer_admin', password='password', organization=self.buyer_org, role='admin')
+        self.gadget = Product.objects.create(name='Gadget', sku='GAD-001', price=Decimal('30.00'), cost=Decimal('20.00'), organization=self.org)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def order(self, lines, days_ago=0, status='completed'):
+        order = Order.objects.create(status='pending', organization=self.buyer_org)
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price,
+                                     subtotal=product.price * quantity, organization=self.buyer_org)
+        Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        self.transition(order, status)
+        return order
+
+    def transition(self, order, status):
+        order.status = status
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def rollups(self):
+        return sorted(SalesDailyRollup.objects.values_list('product__name', 'units', 'revenue', 'cost'))
+
+    def test_rollups_follow_order_transitions(self):
+        first = self.order([(self.product, 2), (self.gadget, 1)])
+        self.order([(self.product, 3)])
+        cart = Order.objects.create(status='pending', organization=self.buyer_org)
+        OrderItem.objects.create(order=cart, product=self.product, quantity=9, unit_price=Decimal('10.00'),
+                                 subtotal=Decimal('90.00'), organization=self.buyer_org)
+        self.assertEqual(self.rollups(), [
+            ('Gadget', 1, Decimal('30.00'), Decimal('20.00')),
+            ('Widget', 5, Decimal('50.00'), Decimal('30.00')),
+        ])
+        rollup = SalesDailyRollup.objects.get(product=self.product)
+        self.assertEqual((rollup.supplier_organization_id, rollup.buyer_organization_id), (self.org.pk, self.buyer_org.pk))
+
+        # Delivering a completed order counts it once; canceling it takes it out
+        self.transition(first, 'delivered')
+        self.assertEqual(SalesDailyRollup.objects.get(product=self.product).units, 5)
+        self.transition(first, 'canceled')
+        self.assertEqual(self.rollups(), [('Widget', 3, Decimal('30.00'), Decimal('18.00'))])
+
+    def test_series(self):
+        self.order([(self.product, 2)], days_ago=1)
+        self.order([(self.gadget, 1)])
+        today = timezone.localdate()
+        response = self.client.get('/api/analytics/sales/series/', {'start': today - timedelta(days=2), 'end': today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['period'], row['units'], row['revenue'], row['margin']) for row in response.data['series']],
+            [
+                (str(today - timedelta(days=2)), 0, '0.00', '0.00'),
+                (str(today - timedelta(days=1)), 2, '20.00', '8.00'),
+                (str(today), 1, '30.00', '10.00'),
+            ]
+        )
+        self.assertEqual(response.data['totals'], {'units': 3, 'revenue': '50.00', 'cost': '32.00', 'margin': '18.00'})
+
+        response = self.client.get('/api/analytics/sales/series/', {'interval': 'month'})
+        self.assertEqual(response.data['totals']['units'], 3)
+        self.assertTrue(all(row['period'].endswith('-01') for row in response.data['series']))
+
+        # The same sales, seen from the buyer
+        self.client.force_authenticate(self.buyer_admin)
+        response = self.client.get('/api/analytics/sales/series/', {'side': 'purchases'})
+        self.assertEqual(response.data['totals']['revenue'], '50.00')
+        response = self.client.get('/api/analytics/sales/series/')
+        self.assertEqual(response.data['totals']['revenue'], '0.00')
+
+    def test_top(self):
+        self.order([(self.product, 4), (self.gadget, 1)])
+        response = self.client.get('/api/analytics/sales/top/', {'metric': 'units'})
+        self.assertEqual([(row['name'], row['units']) for row in response.data['results']], [('Widget', 4), ('Gadget', 1)])
+        response = self.client.get('/api/analytics/sales/top/', {'metric': 'revenue', 'limit': 1})
+        self.assertEqual([(row['name'], row['revenue']) for row in response.data['results']], [('Widget', '40.00')])
+        response = self.client.get('/api/analytics/sales/top/', {'by': 'buyer'})
+        self.assertEqual([(row['id'], row['margin']) for row in response.data['results']], [(self.buyer_org.pk, '26.00')])
+
+        for query in ({'by': 'color'}, {'limit': 0}, {'start': '2024-02-01', 'end': '2024-01-01'}):
+            self.assertEqual(self.client.get('/api/analytics/sales/top/', query).status_code, 400, query)
+
+    def test_rebuild_command(self):
+        self.order([(self.product, 2)], days_ago=10)
+        self.order([(self.product, 1)])
+        SalesDailyRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', organization=self.org.pk, stdout=out)
+        self.assertIn('Rebuilt 2 daily sales rollups.', out.getvalue())
+
+        SalesDailyRollup.objects.update(units=0)
+        since = timezone.localdate() - timedelta(days=1)
+        call_command('rebuild_sales_rollups', since=str(since), stdout=StringIO())
+        self.assertEqual(sorted(SalesDailyRollup.objects.values_list('units', flat=True)), [0, 1])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_sales_rollups', since='yesterday')
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SupplierMetricsTests(StockTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer_org = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        self.buyer_admin = User.objects.create_user(email='admin@buyer.com', username='buyer_admin', password='password', organization=self.buyer_org, role='admin')
+        self.client = APIClient()
+
+    def order(self, quantity, status, lead_time=None, shipped=0):
+        order = Order.objects.create(status=status, organization=self.buyer_org)
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, unit_price=Decimal('10.00'),
+                                 subtotal=Decimal('10.00') * quantity, organization=self.buyer_org)
+        if lead_time is not None:
+            Order.objects.filter(pk=order.pk).update(date_completed=order.order_date + lead_time)
+        if shipped:
+            self.inventory.remove_stock(shipped, reference=order.order_number, movement_type='sale')
+        return order
+
+    def test_metrics(self):
+        completed = self.order(5, 'completed', lead_time=timedelta(days=2), shipped=5)
+        self.order(1, 'delivered', lead_time=timedelta(days=4), shipped=1)
+        self.order(3, 'processing')
+        self.order(2, 'canceled')
+        self.order(9, 'pending')
+        self.assertEqual(refresh_supplier_metrics(), 1)
+
+        metrics = Supplier(name='Supplier', supplier_code='SUP0001', organization=self.org).get_performance_metrics()
+        self.assertEqual(
+            {key: value for key, value in metrics.items() if key != 'computed_at'},
+            {
+                'total_orders': 4, 'open_orders': 1, 'completed_orders': 2, 'canceled_orders': 1,
+                'units_ordered': 9, 'units_fulfilled': 6, 'fill_rate': Decimal('66.67'),
+                'cancellation_rate': Decimal('25.00'), 'average_lead_time': timedelta(days=3),
+            }
+        )
+        self.assertIn(completed, Supplier(organization=self.org).get_order_history())
+        self.assertEqual(Supplier(organization=self.buyer_org).get_performance_metrics(), None)
+
+    def test_scorecard_visibility(self):
+        self.order(2, 'completed', shipped=2)
+        refresh_supplier_metrics([self.org.pk])
+        path = f'/api/suppliers/{self.org.pk}/scorecard/'
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['organization_name'], response.data['fill_rate']), ('Supplier Org', '100.00'))
+
+        self.client.force_authenticate(self.buyer_admin)
+        self.assertEqual(self.client.get(path).status_code, 404)
+        OrganizationRelationship.objects.create(buyer_organization=self.buyer_org, supplier_organization=self.org, status='accepted')
+        self.assertEqual(self.client.get(path).data['total_orders'], 1)
+
+    def test_refresh_command(self):
+        Organization.objects.create(name='Other Supplier', organization_type='supplier')
+        out = StringIO()
+        call_command('refresh_supplier_metrics', organization=self.org.pk, stdout=out)
+        self.assertIn('Refreshed the performance metrics of 1 suppliers.', out.getvalue())
+        metrics = SupplierPerformanceMetrics.objects.get()
+        self.assertEqual((metrics.total_orders, metrics.fill_rate, metrics.average_lead_time), (0, None, None))
+        call_command('refresh_supplier_metrics', stdout=out)
+        self.assertEqual(SupplierPerformanceMetrics.objects.count(), 2)
+
+
+class BuyerCreditTests(BuyerTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.create_buyer('Buyer A')
+        self.buyer = Buyer.objects.get(user=self.client.user)
+        Buyer.objects.filter(pk=self.buyer.pk).update(payment_terms='net_30', credit_limit=Decimal('50.00'))
+
+    def balance(self):
+        self.buyer.refresh_from_db()
+        return self.buyer.outstanding_balance
+
+    def test_balance_follows_orders(self):
+        self.add_to_cart(self.client, 3)
+        # A cart is not owed yet
+        self.assertEqual(self.balance(), Decimal('0.00'))
+        self.assertEqual(self.checkout(self.client).status_code, 200)
+        self.assertEqual(self.balance(), Decimal('30.00'))
+        self.assertTrue(self.buyer.has_available_credit(Decimal('20.00')))
+        self.assertFalse(self.buyer.has_available_credit(Decimal('20.01')))
+
+        order = Order.objects.get(customer=self.buyer)
+        order.payment_status = 'paid'
+        order.save()
+        self.assertEqual(self.buyer.get_current_credit_usage(), Decimal('30.00'))
+        self.assertEqual(self.balance(), Decimal('0.00'))
+
+        Order.objects.filter(pk=order.pk).update(payment_status='unpaid')
+        out = StringIO()
+        call_command('refresh_outstanding_balances', organization=self.buyer.organization_id, stdout=out)
+        self.assertIn('Refreshed the outstanding balance of 1 buyers.', out.getvalue())
+        self.assertEqual(self.balance(), Decimal('30.00'))
+        order.delete()
+        self.assertEqual(self.balance(), Decimal('0.00'))
+
+    def test_checkout_over_the_credit_limit_is_refused(self):
+        self.add_to_cart(self.client, 3)
+        self.checkout(self.client)
+        self.add_to_cart(self.client, 3)
+        response = self.checkout(self.client)
+        self.assertEqual(response.status_code, 402)
+        self.assertIn('20.00', response.data['detail'])
+        self.assertTrue(Order.objects.filter(customer=self.buyer, status='pending').exists())
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 47)
+        self.assertEqual(self.balance(), Decimal('30.00'))
+
+        # Prepaid buyers are not limited
+        Buyer.objects.filter(pk=self.buyer.pk).update(payment_terms='prepaid')
+        self.assertEqual(self.checkout(self.client).status_code, 200)
+
+    def test_credit_check_is_one_locked_read(self):
+        with self.assertNumQueries(1):
+            check_credit(self.buyer.pk, Decimal('50.00'))
+        with self.assertNumQueries(1), self.assertRaises(CreditLimitExceeded):
+            check_credit(self.buyer.pk, Decimal('50.01'))
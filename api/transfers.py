@@ -0,0 +1,127 @@
+import uuid
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Inventory, InventoryMovement, Location, Product
+from .signals import inventory_changed
+
+
+class TransferError(Exception):
+    """Raised when a stock transfer cannot be carried out. The whole batch is rolled back."""
+
+
+def generate_transfer_reference():
+    return f"TRF-{uuid.uuid4().hex[:12].upper()}"
+
+
+def _lock_inventory(organization, pairs):
+    """Lock the inventory rows of the given (product_id, location_id) pairs in primary key order"""
+    condition = Q()
+    for product_id, location_id in pairs:
+        condition |= Q(product_id=product_id, location_id=location_id)
+    rows = (
+        Inventory.objects.select_for_update()
+        .filter(condition, organization=organization)
+        .order_by('pk')
+    )
+    return {(row.product_id, row.location_id): row for row in rows}
+
+
+def transfer_stock(organization, transfers, user=None, reference=None):
+    """
+    Move stock between locations of one organization in a single transaction.
+
+    Each transfer is a dict with product_id, from_location_id, to_location_id,
+    quantity and an optional note. Source and destination rows are locked in a
+    stable (primary key) order so concurrent transfers cannot deadlock, missing
+    destination rows are created, and quantities are moved with conditional
+    F() updates. Every transfer writes a pair of 'transfer' movements sharing a
+    reference. If any source lacks stock, TransferError is raised and nothing is
+    applied.
+    """
+    transfers = list(transfers)
+    if not transfers:
+        raise TransferError("No transfers given.")
+
+    for item in transfers:
+        if item['quantity'] <= 0:
+            raise TransferError("Transfer quantity must be a positive integer.")
+        if item['from_location_id'] == item['to_location_id']:
+            raise TransferError("Source and destination locations must differ.")
+
+    reference = reference or generate_transfer_reference()
+    now = timezone.now()
+
+    location_ids = {t['from_location_id'] for t in transfers} | {t['to_location_id'] for t in transfers}
+    owned = set(Location.objects.filter(organization=organization, pk__in=location_ids).values_list('pk', flat=True))
+    if location_ids - owned:
+        raise TransferError(f"Locations {sorted(location_ids - owned)} do not belong to your organization.")
+
+    # The catalog of an organization: the products it sells and those it stocks from its suppliers
+    product_ids = {t['product_id'] for t in transfers}
+    known = set(
+        Product.objects.filter(Q(organization=organization) | Q(inventory_items__organization=organization), pk__in=product_ids)
+        .values_list('pk', flat=True)
+    )
+    if product_ids - known:
+        raise TransferError(f"Products {sorted(product_ids - known)} are not in your organization's catalog.")
+
+    with transaction.atomic():
+        sources = {(t['product_id'], t['from_location_id']) for t in transfers}
+        destinations = {(t['product_id'], t['to_location_id']) for t in transfers}
+
+        # Create destination rows up front so they can be locked with the sources
+        Inventory.objects.bulk_create(
+            [
+                Inventory(product_id=product_id, location_id=location_id, organization=organization, quantity=0)
+                for product_id, location_id in destinations
+            ],
+            ignore_conflicts=True
+        )
+        rows = _lock_inventory(organization, sources | destinations)
+
+        movements = []
+        for index, item in enumerate(transfers, start=1):
+            quantity = item['quantity']
+            source = rows.get((item['product_id'], item['from_location_id']))
+            destination = rows.get((item['product_id'], item['to_location_id']))
+            if source is None:
+                raise TransferError(f"No inventory for product {item['product_id']} at location {item['from_location_id']}.")
+            if destination is None:
+                # The row exists (bulk_create skipped it) but is not assigned to this organization
+                raise TransferError(f"Inventory of product {item['product_id']} at location {item['to_location_id']} belongs to another organization.")
+
+            # Units held by carts stay where they are, as with Inventory.remove_stock()
+            removed = Inventory.objects.filter(pk=source.pk, quantity__gte=F('reserved_quantity') + quantity).update(
+                quantity=F('quantity') - quantity,
+                updated_at=now
+            )
+            if not removed:
+                raise TransferError(f"Insufficient unreserved stock for product {item['product_id']} at location {item['from_location_id']}.")
+            Inventory.objects.filter(pk=destination.pk).update(
+                quantity=F('quantity') + quantity,
+                last_stocked=now,
+                updated_at=now
+            )
+
+            pair_reference = reference if len(transfers) == 1 else f"{reference}-{index}"
+            note = item.get('note') or f"Transfer of {quantity} units"
+            movements.append(InventoryMovement(
+                inventory=source, quantity_change=-quantity, movement_type='transfer',
+                note=note, reference=pair_reference, user=user, organization=organization
+            ))
+            movements.append(InventoryMovement(
+                inventory=destination, quantity_change=quantity, movement_type='transfer',
+                note=note, reference=pair_reference, user=user, organization=organization
+            ))
+
+        InventoryMovement.objects.bulk_create(movements, batch_size=500)
+        inventory_changed.send(
+            sender=Inventory,
+            organization_id=organization.id,
+            inventory_ids=[row.pk for row in rows.values()]
+        )
+
+    return reference, movements
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from . import async_views
 app_name = 'api'
 urlpatterns = [
     path('products/', ProductAPIView.as_view()),
@@ -14,18 +15,35 @@ urlpatterns = [
     path('organizations/activate/<uuid:token>/', OrganizationActivationView.as_view(), name='activate-organization'),
     path('relationships/', OrganizationRelationshipListView.as_view(), name='relationship-list'),
     path('relationships/request/', OrganizationRelationshipRequestView.as_view(), name='relationship-request'),
+    path('relationships/request/batch/', OrganizationRelationshipBatchRequestView.as_view(), name='relationship-request-batch'),
+    path('relationships/update/batch/', OrganizationRelationshipBatchUpdateView.as_view(), name='relationship-update-batch'),
     path('relationships/<int:pk>/update/', OrganizationRelationshipUpdateView.as_view(), name='relationship-update'),
     path('potential-suppliers/', PotentialSupplierListView.as_view(), name='potential-supplier-list'),
     path('products/create/', ProductCreateView.as_view(), name='product-create'),
+    path('products/imports/', CatalogImportListView.as_view(), name='catalog-import-list-create'),
+    path('products/imports/<int:pk>/', CatalogImportDetailView.as_view(), name='catalog-import-detail'),
     path('inventory/', InventoryListView.as_view(), name='inventory-list'),
     path('inventory/<int:pk>/', InventoryDetailView.as_view(), name='inventory-detail'),
     path('inventory/create/', InventoryCreateView.as_view(), name='inventory-create'),
     path('inventory/<int:pk>/update/', InventoryUpdateView.as_view(), name='inventory-update'),
+    path('inventory/transfers/', InventoryTransferView.as_view(), name='inventory-transfer'),
+    path('inventory/transfers/batch/', InventoryTransferBatchView.as_view(), name='inventory-transfer-batch'),
     path('inventory-movements/', InventoryMovementListView.as_view(), name='inventory-movement-list'),
     path('brands/', BrandListView.as_view(), name='brand-list-create'),
     path('brands/<int:pk>/', BrandDetailView.as_view(), name='brand-detail-update-delete'),
     path('categories/', CategoryListView.as_view(), name='category-list-create'),
     path('categories/<int:pk>/', CategoryDetailView.as_view(), name='category-detail-update-delete'),
+    path('categories/tree/', CategoryTreeView.as_view(), name='category-tree'),
+    path('categories/<int:pk>/breadcrumbs/', CategoryBreadcrumbsView.as_view(), name='category-breadcrumbs'),
     path('locations/', LocationListView.as_view(), name='location-list-create'),
     path('locations/<int:pk>/', LocationDetailView.as_view(), name='location-detail-update-delete'),
+    path('reports/inventory-valuation/', InventoryValuationView.as_view(), name='inventory-valuation-report'),
+    path('analytics/sales/series/', SalesSeriesView.as_view(), name='sales-series'),
+    path('analytics/sales/top/', SalesTopView.as_view(), name='sales-top'),
+    path('suppliers/<int:pk>/scorecard/', SupplierScorecardView.as_view(), name='supplier-scorecard'),
+    # Async variants of the heavy read endpoints, for deployments served over ASGI
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/filter/', async_views.filtered_product_list, name='async-product-filter'),
+    path('async/inventory/', async_views.inventory_list, name='async-inventory-list'),
+    path('async/inventory-movements/', async_views.inventory_movement_list, name='async-inventory-movement-list'),
 ]
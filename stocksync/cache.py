@@ -0,0 +1,20 @@
+from django.conf import settings
+
+# Cache backends whose entries live in, and are invalidated within, one process only
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured(alias='default'):
+    """
+    Whether every worker process reads and writes the same cache, so an entry
+    deleted or invalidated by one worker is gone for all of them. The
+    CACHE_IS_SHARED setting overrides the guess made from the backend, e.g.
+    for a single-process deployment.
+    """
+    shared = getattr(settings, 'CACHE_IS_SHARED', None)
+    if shared is not None:
+        return shared
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
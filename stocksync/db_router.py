@@ -0,0 +1,122 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Per-request routing state, kept in context variables like the tenant context
+_read_replica = ContextVar('read_replica', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pin_to_primary():
+    """Send every further query of the current request to the primary"""
+    _pinned_to_primary.set(True)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+class ReadReplicaRouter:
+    """
+    Routes queries between the primary and its read replicas.
+
+    Reads go to a random replica from DATABASE_REPLICAS while the request is
+    served by a view flagged use_read_replica and has not written yet; any
+    write pins the rest of the request to the primary. Everything else uses
+    the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and _read_replica.get() and not _pinned_to_primary.get():
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and its replicas hold the same data
+        primary_group = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in primary_group and obj2._state.db in primary_group:
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication
+        if db in replica_aliases():
+            return False
+        return True
+
+
+class ReadReplicaMiddleware:
+    """
+    Enables replica reads for safe requests to views flagged use_read_replica.
+
+    A request that writes stays on the primary from its first write on, and
+    sets a short-lived cookie so the same client keeps reading from the
+    primary for REPLICA_PIN_SECONDS, until replicas have caught up.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        pinned = bool(request.COOKIES.get(self.cookie_name))
+        return _read_replica.set(False), _pinned_to_primary.set(pinned), _wrote.set(False)
+
+    def _finish(self, request, response, tokens):
+        if _wrote.get() and request.method not in SAFE_METHODS and response is not None:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax'
+            )
+        read_token, pin_token, wrote_token = tokens
+        _read_replica.reset(read_token)
+        _pinned_to_primary.reset(pin_token)
+        _wrote.reset(wrote_token)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._start(request)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, response, tokens)
+        return response
+
+    async def __acall__(self, request):
+        tokens = self._start(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, response, tokens)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method in SAFE_METHODS and getattr(view_class, 'use_read_replica', False):
+            _read_replica.set(True)
+        return None
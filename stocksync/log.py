@@ -0,0 +1,161 @@
+import json
+import logging
+import random
+import re
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+_request_id = ContextVar('request_id', default=None)
+_sampled = ContextVar('log_sampled', default=True)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming request IDs are only trusted when they look like one
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def is_sampled():
+    """Whether DEBUG records of the current request are kept (see LOG_DEBUG_SAMPLE_RATE)"""
+    return _sampled.get()
+
+
+@contextmanager
+def log_sampling(sampled):
+    """Keep (True) or drop (False) DEBUG records inside the block, e.g. in commands and tests"""
+    token = _sampled.set(sampled)
+    try:
+        yield
+    finally:
+        _sampled.reset(token)
+
+
+class StructuredLogger:
+    """
+    Logger for events with key/value fields.
+
+        log = get_logger(__name__)
+        log.debug('cart.updated', order_id=order.id, total=lambda: order.get_cart_total)
+
+    Nothing is formatted, and no callable field (e.g. one running a query) is
+    evaluated, unless the level is enabled for the logger. DEBUG records are
+    additionally sampled per request: only LOG_DEBUG_SAMPLE_RATE of the
+    requests log them, so that a request's trace is kept or dropped as a whole.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def is_enabled_for(self, level):
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level > logging.DEBUG or is_sampled()
+
+    def log(self, level, event, exc_info=None, **fields):
+        if not self.is_enabled_for(level):
+            return
+        fields = {key: value() if callable(value) else value for key, value in fields.items()}
+        self.logger.log(level, event, exc_info=exc_info, extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+class RequestIDFilter(logging.Filter):
+    """Adds the current request ID to every record as record.request_id"""
+
+    def filter(self, record):
+        record.request_id = get_request_id()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, event, request_id and the event fields"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIDMiddleware:
+    """
+    Gives every request an ID for its log records and decides whether its DEBUG
+    records are sampled.
+
+    The ID is taken from the X-Request-ID header when a proxy set a valid one,
+    else generated, and returned in the X-Request-ID response header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        sampled = random.random() < getattr(settings, 'LOG_DEBUG_SAMPLE_RATE', 1.0)
+        return _request_id.set(request_id), _sampled.set(sampled)
+
+    def _finish(self, request, response, tokens):
+        id_token, sampled_token = tokens
+        _request_id.reset(id_token)
+        _sampled.reset(sampled_token)
+        if response is not None:
+            response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._start(request)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, response, tokens)
+        return response
+
+    async def __acall__(self, request):
+        tokens = self._start(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, response, tokens)
+        return response
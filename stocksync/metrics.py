@@ -0,0 +1,290 @@
+import threading
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+_serializers_instrumented = False
+
+
+class RequestMetrics:
+    """Timings collected while one request is served"""
+    __slots__ = ('start', 'queries', 'db', 'serialize', 'render', 'serializing', 'render_start')
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.serializing = False
+        self.render_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper() on every database alias
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += perf_counter() - start
+
+
+def current_request_metrics():
+    return _current.get()
+
+
+def _timed_data(prop):
+    """Wrap a serializer's data property to add the time of the outermost call to the request"""
+    def data(self):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return prop.fget(self)
+        metrics.serializing = True
+        start = perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            metrics.serializing = False
+            metrics.serialize += perf_counter() - start
+    return property(data)
+
+
+def instrument_serializers():
+    """Time DRF serialization (Serializer.data and ListSerializer.data); idempotent"""
+    global _serializers_instrumented
+    if _serializers_instrumented:
+        return
+    from rest_framework.serializers import ListSerializer, Serializer
+    Serializer.data = _timed_data(Serializer.data)
+    ListSerializer.data = _timed_data(ListSerializer.data)
+    _serializers_instrumented = True
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """
+    Per-process aggregate of request metrics, in Prometheus text format.
+
+    Each worker process keeps its own registry; Prometheus scrapes and sums
+    them per instance.
+    """
+
+    counters = {
+        'requests_total': ('counter', "Requests served.", ('view', 'method', 'status')),
+        'db_queries_total': ('counter', "SQL statements executed.", ('view',)),
+        'db_duration_seconds_total': ('counter', "Time spent executing SQL.", ('view',)),
+        'serializer_duration_seconds_total': ('counter', "Time spent serializing response data.", ('view',)),
+        'render_duration_seconds_total': ('counter', "Time spent rendering responses.", ('view',)),
+        'response_bytes_total': ('counter', "Response body bytes.", ('view',)),
+    }
+    prefix = 'stocksync_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}
+        self.values = {name: {} for name in self.counters}
+
+    def observe(self, view, method, status, duration, metrics, size):
+        with self.lock:
+            histogram = self.latency.get((view, method))
+            if histogram is None:
+                histogram = self.latency[(view, method)] = Histogram()
+            histogram.observe(duration)
+            for name, labels, value in (
+                ('requests_total', (view, method, str(status)), 1),
+                ('db_queries_total', (view,), metrics.queries),
+                ('db_duration_seconds_total', (view,), metrics.db),
+                ('serializer_duration_seconds_total', (view,), metrics.serialize),
+                ('render_duration_seconds_total', (view,), metrics.render),
+                ('response_bytes_total', (view,), size or 0),
+            ):
+                values = self.values[name]
+                values[labels] = values.get(labels, 0) + value
+
+    @staticmethod
+    def _labels(names, values, **extra):
+        pairs = list(zip(names, values)) + list(extra.items())
+        escaped = (
+            (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs
+        )
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+    def render(self):
+        lines = []
+        with self.lock:
+            name = f'{self.prefix}request_duration_seconds'
+            lines.append(f'# HELP {name} Request latency by view.')
+            lines.append(f'# TYPE {name} histogram')
+            for (view, method), histogram in sorted(self.latency.items()):
+                labels = ('view', 'method'), (view, method)
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{self._labels(*labels, le=bound)} {count}')
+                lines.append(f'{name}_bucket{self._labels(*labels, le="+Inf")} {histogram.count}')
+                lines.append(f'{name}_sum{self._labels(*labels)} {histogram.sum}')
+                lines.append(f'{name}_count{self._labels(*labels)} {histogram.count}')
+
+            for counter, (kind, help_text, label_names) in self.counters.items():
+                name = f'{self.prefix}{counter}'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(self.values[counter].items()):
+                    lines.append(f'{name}{self._labels(label_names, labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def server_timing(metrics, total, view, size):
+    """Server-Timing header value; durations in milliseconds"""
+    entries = [
+        f'db;dur={metrics.db * 1000:.2f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serialize * 1000:.2f}',
+        f'render;dur={metrics.render * 1000:.2f}',
+        f'total;dur={total * 1000:.2f};desc="{view}"',
+    ]
+    if size is not None:
+        entries.append(f'size;desc="{size} bytes"')
+    return ', '.join(entries)
+
+
+def show_server_timing(request):
+    # DRF sets request.user once the view has authenticated the request
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+class PerformanceMiddleware:
+    """
+    Records SQL count and time, serializer time, render time, response size
+    and total time of every request.
+
+    The figures are aggregated per view into REGISTRY, which metrics_view
+    exposes to Prometheus, and returned in a Server-Timing header under DEBUG
+    or to staff users only, as they name views and count queries. Set
+    PERFORMANCE_METRICS = False to turn it off.
+
+    SQL is timed through execute_wrapper on the connections of the serving
+    thread, so queries that api.async_views run on worker threads are not
+    counted; their serialization time is.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PERFORMANCE_METRICS', True)
+        if self.enabled:
+            instrument_serializers()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        metrics = RequestMetrics()
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics))
+        return metrics, stack, _current.set(metrics)
+
+    def _finish(self, request, response, metrics, stack, token):
+        stack.close()
+        _current.reset(token)
+        total = perf_counter() - metrics.start
+        view = view_label(request)
+        size = None if response.streaming else len(response.content)
+        if show_server_timing(request):
+            response['Server-Timing'] = server_timing(metrics, total, view, size)
+        REGISTRY.observe(view, request.method, response.status_code, total, metrics, size)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        metrics, stack, token = self._start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            _current.reset(token)
+            raise
+        return self._finish(request, response, metrics, stack, token)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        metrics, stack, token = self._start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            stack.close()
+            _current.reset(token)
+            raise
+        return self._finish(request, response, metrics, stack, token)
+
+    def process_template_response(self, request, response):
+        # Called right before the response (e.g. a DRF Response) is rendered
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.render_start = perf_counter()
+
+            def rendered(response):
+                metrics.render += perf_counter() - metrics.render_start
+                return None
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of REGISTRY.
+
+    Scrapers must send METRICS_TOKEN as a bearer token; without one
+    configured the endpoint is not served.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import sys
 from datetime import timedelta
 import dj_database_url
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,7 +46,11 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "accounts.User"
 
 MIDDLEWARE = [
+    'stocksync.log.RequestIDMiddleware',  # Request IDs and DEBUG sampling for log records
+    'stocksync.metrics.PerformanceMiddleware',  # Server-Timing header and per-view metrics; keep near the top
     'django.middleware.security.SecurityMiddleware',
+    'stocksync.db_router.ReadReplicaMiddleware',  # Route safe reads of flagged views to replicas
+    'api.query_budget.QueryBudgetMiddleware',  # Check per-view query budgets (tests, or QUERY_BUDGETS_ENFORCED=1)
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +97,62 @@ DATABASES = {
 DATABASE_URL = os.environ.get('DATABASE_URL')
 DATABASES['default'] = dj_database_url.config(default=DATABASE_URL)
 
+# Read replicas: comma separated database URLs, e.g.
+# DATABASE_REPLICA_URLS=sqlite:////tmp/replica1.sqlite3,sqlite:////tmp/replica2.sqlite3
+# In tests each replica mirrors the default test database.
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip())
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['stocksync.db_router.ReadReplicaRouter']
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = 5
+
+# Check requests against their view's QueryBudget: always in test runs, elsewhere only
+# with QUERY_BUDGETS_ENFORCED=1. Over-budget requests fail in test runs and are logged otherwise.
+TESTING = sys.argv[1:2] == ['test']
+QUERY_BUDGETS_ENFORCED = TESTING or os.environ.get('QUERY_BUDGETS_ENFORCED') == '1'
+QUERY_BUDGETS_RAISE = TESTING
+
+# Per-request timings and the Prometheus endpoint at /metrics, served only when METRICS_TOKEN
+# is set; scrapers send it as a bearer token. The Server-Timing header is only sent under DEBUG
+# or to staff users.
+PERFORMANCE_METRICS = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Structured JSON logs with request IDs (see stocksync.log). DEBUG records are
+# kept for LOG_DEBUG_SAMPLE_RATE of the requests. Test runs still build the records,
+# at the same level, but discard them instead of interleaving them with the test output.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'stocksync.log.RequestIDFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'stocksync.log.JSONFormatter'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id'],
+            'formatter': 'json',
+        },
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        app: {'handlers': ['null' if TESTING else 'console'], 'level': LOG_LEVEL, 'propagate': False}
+        for app in ('api', 'accounts', 'stocksync')
+    },
+}
+
 # Email Settings
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' # Switch back to SMTP backend
@@ -145,10 +206,28 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticated'
     # ],    
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
 }
 
+# Cache shared by every worker process. The authenticated user cache and the
+# invalidation of cached reports, facets and supplier pages depend on it: without
+# REDIS_URL each process keeps a local-memory cache of its own, the user cache is
+# disabled, and other workers serve cached pages until their timeouts.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+# Set CACHE_IS_SHARED=1 to treat the local-memory cache as shared, e.g. when serving from a single process
+CACHE_IS_SHARED = True if os.environ.get('CACHE_IS_SHARED') == '1' else None
+
+# Seconds an authenticated user and its organization stay cached between requests
+AUTH_USER_CACHE_TIMEOUT = 60
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -159,8 +238,10 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_TOKEN_CLASSES': (
-        'rest_framework_simplejwt.tokens.AccessToken',
-    )
+        'accounts.tokens.AccessToken',
+    ),
+    # Issues tokens carrying the user's token version (accounts.tokens)
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.TokenObtainPairSerializer',
 }
 
 DJOSER = {
@@ -186,6 +267,23 @@ DJOSER = {
 }
 
 
+# Inventory
+# How long items added to a cart hold supplier stock before the sweeper releases them
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+INVENTORY_REPORT_CACHE_TIMEOUT = 300
+# Sales within this window make up a product's recent velocity (?ordering=trending)
+PRODUCT_VELOCITY_WINDOW = timedelta(days=30)
+# Seconds a page of a buyer's potential suppliers stays cached (also invalidated on changes)
+POTENTIAL_SUPPLIER_CACHE_TIMEOUT = 300
+# Seconds the facet counts of a catalog filter stay cached (0 disables); invalidated on catalog and stock changes
+PRODUCT_FACET_CACHE_TIMEOUT = 60
+# Worker processes generating image variants after uploads (0 renders them inline, on commit)
+IMAGE_VARIANT_WORKERS = 2
+# Rows of a catalog import validated and written together, and the row errors kept per import
+CATALOG_IMPORT_CHUNK_SIZE = 500
+CATALOG_IMPORT_MAX_ERRORS = 100
+
+
 MEDIA_URL= "https://emmanuel197.github.io/stocksync_media/"
 
 
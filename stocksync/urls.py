@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from stocksync.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,6 +11,7 @@ urlpatterns = [
     path('auth/', include('djoser.social.urls')),
     # path('google/auth/', include('djoser.social.urls')),
     path("api/", include("api.urls", namespace="api")),
+    path("metrics", metrics_view, name='metrics'),
     path("", include("store.urls")),
 ]
 